@@ -0,0 +1,211 @@
+"""/stats の年間ヒートマップと曜日×時間帯マトリクス
+
+日別・時間別集計を1回の範囲読み込みで取得し、NumPy の配列にまとめてから描画する。
+集計はセッションごとのループではなく、日付・時間のオフセットを添字にした bincount と reshape で行う。
+描画 (matplotlib) はブロッキング処理のためスレッドで実行し (pyplot は使わない)、できた PNG はしばらくキャッシュする。
+"""
+import asyncio
+import io
+import logging
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Hashable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WEEKDAY_LABELS = ["月", "火", "水", "木", "金", "土", "日"]
+
+# Discordダークテーマ風のカラーパレット (utils のグラフと合わせる)
+BG_COLOR = '#2f3136'
+TEXT_COLOR = '#dcddde'
+EMPTY_COLOR = '#40444b'
+HEAT_COLORS = ['#40444b', '#3b4a8c', '#4a5bc4', '#5865F2', '#8c96ff']
+
+
+def year_grid(rows: List[Tuple[str, int]], end: date, weeks: int = 53) -> Tuple[np.ndarray, date]:
+    """日別の (date, 秒数) を 7行 (月〜日) × weeks 列の時間数の配列にする
+
+    最後の列が end を含む週になるよう、先頭列の月曜日から数えた日数を添字にして集計する。
+    end より後の日は NaN (描画しない)。戻り値は (配列, 先頭列の月曜日)。
+    """
+    first_monday = end - timedelta(days=end.weekday()) - timedelta(weeks=weeks - 1)
+    size = weeks * 7
+    totals = np.zeros(size)
+    if rows:
+        days = np.array([day for day, _ in rows], dtype="datetime64[D]")
+        seconds = np.array([value for _, value in rows], dtype=np.float64)
+        offsets = (days - np.datetime64(first_monday, "D")).astype(np.int64)
+        inside = (offsets >= 0) & (offsets < size)
+        totals = np.bincount(offsets[inside], weights=seconds[inside], minlength=size)
+    totals[(end - first_monday).days + 1:] = np.nan
+    return totals.reshape(weeks, 7).T / 3600, first_monday
+
+
+def weekday_hour_matrix(rows: List[Tuple[str, int]]) -> np.ndarray:
+    """時間別の ('YYYY-MM-DDTHH', 秒数) を 7行 (月〜日) × 24列 の時間数の配列にする"""
+    if not rows:
+        return np.zeros((7, 24))
+    hours = np.array([hour for hour, _ in rows], dtype="datetime64[h]")
+    seconds = np.array([value for _, value in rows], dtype=np.float64)
+    days = hours.astype("datetime64[D]")
+    # 1970-01-01 は木曜日なので +3 で月曜日を 0 にそろえる
+    weekdays = (days.astype(np.int64) + 3) % 7
+    hour_of_day = (hours - days).astype(np.int64)
+    totals = np.bincount(weekdays * 24 + hour_of_day, weights=seconds, minlength=7 * 24)
+    return totals.reshape(7, 24) / 3600
+
+
+def _new_figure(figsize):
+    """pyplot を使わずに Figure を作る (pyplot のグローバル状態はスレッドセーフではないため)"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.subplots()
+
+
+def _to_png(fig) -> bytes:
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=100, bbox_inches='tight', facecolor=fig.get_facecolor())
+    return buffer.getvalue()
+
+
+def render_year_heatmap(grid: np.ndarray, first_monday: date, username: str) -> bytes:
+    """GitHub 風の年間ヒートマップを描画して PNG を返す"""
+    from matplotlib.colors import BoundaryNorm, ListedColormap
+    import japanize_matplotlib  # noqa: F401
+
+    weeks = grid.shape[1]
+    # 0 / 〜1h / 〜2h / 〜4h / 4h〜 の5段階で塗り分ける
+    cmap = ListedColormap(HEAT_COLORS)
+    cmap.set_bad(BG_COLOR)
+    norm = BoundaryNorm([0, 1e-9, 1, 2, 4, 24], cmap.N)
+
+    fig, ax = _new_figure((14, 3))
+    fig.patch.set_facecolor(BG_COLOR)
+    ax.set_facecolor(BG_COLOR)
+    ax.pcolormesh(np.ma.masked_invalid(grid), cmap=cmap, norm=norm, edgecolors=BG_COLOR, linewidth=2)
+    ax.invert_yaxis()
+    ax.set_aspect("equal")
+
+    ax.set_yticks(np.arange(7) + 0.5)
+    ax.set_yticklabels(WEEKDAY_LABELS)
+    # 月が変わる列に月のラベルを付ける
+    month_ticks, month_labels, last_month = [], [], None
+    for week in range(weeks):
+        monday = first_monday + timedelta(weeks=week)
+        if monday.month != last_month:
+            month_ticks.append(week + 0.5)
+            month_labels.append(f"{monday.month}月")
+            last_month = monday.month
+    ax.set_xticks(month_ticks)
+    ax.set_xticklabels(month_labels)
+    ax.tick_params(colors=TEXT_COLOR, labelsize=9, length=0)
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+
+    total_hours = np.nansum(grid)
+    active_days = int(np.count_nonzero(np.nan_to_num(grid) > 0))
+    ax.set_title(f'{username} - 年間の作業記録 ({total_hours:.1f}時間 / {active_days}日)',
+                 fontsize=14, fontweight='bold', color=TEXT_COLOR, pad=12)
+    fig.tight_layout()
+    return _to_png(fig)
+
+
+def render_weekday_hour(matrix: np.ndarray, username: str, days: int) -> bytes:
+    """曜日×時間帯のヒートマップを描画して PNG を返す"""
+    from matplotlib.colors import LinearSegmentedColormap
+    import japanize_matplotlib  # noqa: F401
+
+    cmap = LinearSegmentedColormap.from_list("study", [EMPTY_COLOR, '#5865F2', '#8c96ff'])
+
+    fig, ax = _new_figure((12, 4))
+    fig.patch.set_facecolor(BG_COLOR)
+    ax.set_facecolor(BG_COLOR)
+    ax.pcolormesh(matrix, cmap=cmap, vmin=0, vmax=max(matrix.max(), 1e-9), edgecolors=BG_COLOR, linewidth=1)
+    ax.invert_yaxis()
+
+    ax.set_yticks(np.arange(7) + 0.5)
+    ax.set_yticklabels(WEEKDAY_LABELS)
+    ax.set_xticks(np.arange(0, 24, 2) + 0.5)
+    ax.set_xticklabels([f'{h:02d}' for h in range(0, 24, 2)])
+    ax.set_xlabel('時刻', fontsize=12, color=TEXT_COLOR)
+    ax.tick_params(colors=TEXT_COLOR, labelsize=9, length=0)
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+
+    ax.set_title(f'{username} - 曜日×時間帯 (過去{days}日)', fontsize=14, fontweight='bold', color=TEXT_COLOR, pad=12)
+    fig.tight_layout()
+    return _to_png(fig)
+
+
+class RenderCache:
+    """描画済み PNG の TTL 付き LRU キャッシュ"""
+
+    def __init__(self, ttl: float, max_entries: int = 128):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, bytes]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: bytes) -> None:
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class ActivityCharts:
+    """年間ヒートマップと曜日×時間帯マトリクスの取得・描画・キャッシュ"""
+
+    def __init__(self, db, ttl: float, weekday_hour_days: int):
+        self.db = db
+        self.weekday_hour_days = weekday_hour_days
+        self.cache = RenderCache(ttl)
+
+    async def year_heatmap(self, user_id: int, username: str, today: date) -> Optional[bytes]:
+        """直近53週の年間ヒートマップ (記録がなければ None)"""
+        key = ("year", user_id, username, today)
+        png = self.cache.get(key)
+        if png is None:
+            rows = await self.db.get_daily_series(user_id, today - timedelta(weeks=53), today)
+            if not any(seconds > 0 for _, seconds in rows):
+                return None
+            png = await asyncio.to_thread(self._render_year, rows, today, username)
+            self.cache.put(key, png)
+        return png
+
+    async def weekday_hour(self, user_id: int, username: str, today: date) -> Optional[bytes]:
+        """直近の曜日×時間帯マトリクス (記録がなければ None)"""
+        key = ("weekday_hour", user_id, username, today)
+        png = self.cache.get(key)
+        if png is None:
+            start = today - timedelta(days=self.weekday_hour_days - 1)
+            rows = await self.db.get_hourly_series(user_id, start, today)
+            if not any(seconds > 0 for _, seconds in rows):
+                return None
+            png = await asyncio.to_thread(self._render_weekday_hour, rows, username)
+            self.cache.put(key, png)
+        return png
+
+    @staticmethod
+    def _render_year(rows, today: date, username: str) -> bytes:
+        grid, first_monday = year_grid(rows, today)
+        return render_year_heatmap(grid, first_monday, username)
+
+    def _render_weekday_hour(self, rows, username: str) -> bytes:
+        return render_weekday_hour(weekday_hour_matrix(rows), username, self.weekday_hour_days)
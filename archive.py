@@ -0,0 +1,283 @@
+"""保持期間を過ぎた学習ログのコールドアーカイブ
+
+study_logs から削除するログを、月ごとの追記専用セグメントファイルに列形式で保存する。
+
+セグメント (YYYY-MM.seg) はブロックの並びで、各ブロックは
+    MAGIC | ヘッダ長 (uint32) | JSON ヘッダ | zlib 圧縮された列データ ...
+の形式。列は rowid / user_id / start / end / duration の int64 配列で、
+ヘッダには行数と start・end・user_id の最小/最大値を持つため、範囲外のブロックは展開せずに読み飛ばせる。
+読み込みは mmap で行い、必要な列だけを展開する。
+"""
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_MAGIC = b"SWTSEG1\n"
+MANIFEST_FILENAME = "manifest.json"
+USERS_FILENAME = "users.json"
+COLUMNS = ("rowid", "user_id", "start", "end", "duration")
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_seconds(dt: datetime) -> int:
+    """ナイーブなローカル日時を 1970-01-01 からの秒数に変換する（DB と同じくタイムゾーンは扱わない）"""
+    return int((dt.replace(tzinfo=None) - EPOCH).total_seconds())
+
+
+def _write_json(path: str, data) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class SegmentBlock:
+    """セグメント内の1ブロック（列データは必要になった時点で展開する）"""
+
+    def __init__(self, buf, header: dict, data_offset: int):
+        self._buf = buf
+        self.header = header
+        self._offsets = {}
+        offset = data_offset
+        for name, length in header["columns"]:
+            self._offsets[name] = (offset, length)
+            offset += length
+        self.end_offset = offset
+
+    @property
+    def rows(self) -> int:
+        return self.header["rows"]
+
+    def overlaps(self, start: int, end: int, user_id: Optional[int] = None) -> bool:
+        h = self.header
+        if h["end_max"] < start or h["end_min"] >= end:
+            return False
+        if user_id is not None and not (h["user_min"] <= user_id <= h["user_max"]):
+            return False
+        return True
+
+    def column(self, name: str) -> array:
+        offset, length = self._offsets[name]
+        values = array("q")
+        values.frombytes(zlib.decompress(self._buf[offset:offset + length]))
+        return values
+
+
+class LogArchive:
+    """月別セグメントファイルによる学習ログのアーカイブ"""
+
+    def __init__(self, directory: str, compress_level: int = 6):
+        self.directory = directory
+        self.compress_level = compress_level
+
+    # --- 状態 ---
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_FILENAME)
+
+    def _load_json(self, filename: str, default):
+        try:
+            with open(os.path.join(self.directory, filename), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+        except Exception as e:
+            logger.error(f"アーカイブの {filename} の読み込みに失敗しました: {e}")
+            return default
+
+    @property
+    def watermark(self) -> Optional[str]:
+        """この日時 (created_at) より前のログはアーカイブに、以降は study_logs にある"""
+        return self._load_json(MANIFEST_FILENAME, {}).get("watermark")
+
+    def usernames(self) -> Dict[int, str]:
+        return {int(k): v for k, v in self._load_json(USERS_FILENAME, {}).items()}
+
+    def _segment_path(self, month: str) -> str:
+        return os.path.join(self.directory, f"{month}.seg")
+
+    def months(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-4] for name in os.listdir(self.directory) if name.endswith(".seg"))
+
+    # --- 書き込み ---
+
+    def append(self, rows: List[Tuple[int, int, str, str, int, str]], watermark: str) -> int:
+        """study_logs の行 (rowid, user_id, username, start_time, duration_seconds, created_at) を追記する
+
+        前回の書き込み後に DB からの削除が中断していた場合に備え、同じ月に既にある行は追記しない。
+        戻り値は追記した行数。ブロッキング処理のため asyncio.to_thread から呼ぶ。
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        by_month: Dict[str, List[Tuple[int, int, int, int, int]]] = {}
+        names = {}
+        for rowid, user_id, username, start_time, duration, created_at in rows:
+            try:
+                end = datetime.fromisoformat(created_at)
+                start = datetime.fromisoformat(start_time) if start_time else end
+            except (TypeError, ValueError):
+                logger.warning(f"アーカイブできないログを読み飛ばします (rowid:{rowid})")
+                continue
+            by_month.setdefault(end.strftime("%Y-%m"), []).append(
+                (rowid, user_id, to_seconds(start), to_seconds(end), duration or 0)
+            )
+            names[user_id] = username
+
+        written = 0
+        for month, month_rows in sorted(by_month.items()):
+            existing = self._existing_keys(month)
+            fresh = [r for r in month_rows if (r[0], r[3]) not in existing]
+            if fresh:
+                self._append_block(month, fresh)
+                written += len(fresh)
+
+        if names:
+            users = self._load_json(USERS_FILENAME, {})
+            users.update({str(k): v for k, v in names.items()})
+            _write_json(os.path.join(self.directory, USERS_FILENAME), users)
+        _write_json(self._manifest_path(), {"watermark": max(watermark, self.watermark or "")})
+        return written
+
+    def _existing_keys(self, month: str) -> set:
+        """既存の (rowid, end) の集合。途中で終わっている末尾のブロックは切り詰める"""
+        keys = set()
+        valid_length = 0
+        for block in self._blocks(month):
+            keys.update(zip(block.column("rowid"), block.column("end")))
+            valid_length = block.end_offset
+        path = self._segment_path(month)
+        if os.path.exists(path) and os.path.getsize(path) > valid_length:
+            with open(path, "r+b") as f:
+                f.truncate(valid_length)
+        return keys
+
+    def _append_block(self, month: str, rows: List[Tuple[int, int, int, int, int]]) -> None:
+        rows.sort(key=lambda r: r[3])
+        columns = {name: array("q", (r[i] for r in rows)) for i, name in enumerate(COLUMNS)}
+        compressed = [(name, zlib.compress(columns[name].tobytes(), self.compress_level)) for name in COLUMNS]
+        header = json.dumps({
+            "rows": len(rows),
+            "start_min": min(columns["start"]),
+            "end_min": min(columns["end"]),
+            "end_max": max(columns["end"]),
+            "user_min": min(columns["user_id"]),
+            "user_max": max(columns["user_id"]),
+            "columns": [[name, len(data)] for name, data in compressed],
+        }).encode("utf-8")
+
+        with open(self._segment_path(month), "ab") as f:
+            f.write(SEGMENT_MAGIC)
+            f.write(struct.pack(">I", len(header)))
+            f.write(header)
+            for _, data in compressed:
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    # --- 読み込み ---
+
+    def _blocks(self, month: str) -> Iterator[SegmentBlock]:
+        path = self._segment_path(month)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset = 0
+            size = len(mm)
+            while offset < size:
+                if mm[offset:offset + len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                    # 書き込み途中で止まったブロックはそれ以降を無視する
+                    logger.warning(f"アーカイブ {month} の {offset} バイト目以降が壊れています")
+                    return
+                offset += len(SEGMENT_MAGIC)
+                try:
+                    (header_len,) = struct.unpack(">I", mm[offset:offset + 4])
+                    offset += 4
+                    header = json.loads(mm[offset:offset + header_len].decode("utf-8"))
+                    block = SegmentBlock(mm, header, offset + header_len)
+                except (struct.error, ValueError, KeyError):
+                    block = None
+                if block is None or block.end_offset > size:
+                    logger.warning(f"アーカイブ {month} の最後のブロックが途中で終わっています")
+                    return
+                yield block
+                offset = block.end_offset
+
+    def scan(self, start: datetime, end: datetime, user_id: Optional[int] = None,
+             columns: Tuple[str, ...] = ("user_id", "duration")) -> Iterator[Tuple[array, ...]]:
+        """終了時刻 (created_at) が [start, end) のログを列ごとに返す
+
+        ブロック単位で (指定列..., ) の配列タプルを返す。範囲・ユーザーで行を絞り込んだ結果。
+        """
+        start_s, end_s = to_seconds(start), to_seconds(end)
+        first_month, last_month = start.strftime("%Y-%m"), end.strftime("%Y-%m")
+        for month in self.months():
+            if month < first_month or month > last_month:
+                continue
+            for block in self._blocks(month):
+                if not block.overlaps(start_s, end_s, user_id):
+                    continue
+                ends = block.column("end")
+                users = block.column("user_id")
+                selected = {name: block.column(name) for name in columns if name not in ("end", "user_id")}
+                selected["end"], selected["user_id"] = ends, users
+                if block.header["end_min"] >= start_s and block.header["end_max"] < end_s and user_id is None:
+                    yield tuple(selected[name] for name in columns)
+                    continue
+                keep = [i for i, e in enumerate(ends)
+                        if start_s <= e < end_s and (user_id is None or users[i] == user_id)]
+                yield tuple(array("q", (selected[name][i] for i in keep)) for name in columns)
+
+    def coverage_start(self) -> Optional[str]:
+        """アーカイブにある最も古いログの終了時刻 (これより前に削除されたログはアーカイブに無い)"""
+        months = self.months()
+        if not months:
+            return None
+        ends = [block.header["end_min"] for block in self._blocks(months[0])]
+        if not ends:
+            return None
+        return (EPOCH + timedelta(seconds=min(ends))).isoformat()
+
+    def session_keys(self, month: str) -> set:
+        """指定月 (終了時刻の月) にアーカイブ済みのログの (user_id, 開始時刻の秒数) の集合"""
+        keys = set()
+        for block in self._blocks(month):
+            keys.update(zip(block.column("user_id"), block.column("start")))
+        return keys
+
+    def hourly_histogram(self, start: datetime, end: datetime, user_id: Optional[int] = None) -> Dict[str, int]:
+        """開始時刻の時間帯 (00〜23) 別の合計秒数"""
+        result = {str(i).zfill(2): 0 for i in range(24)}
+        hours = [0] * 24
+        for starts, durations in self.scan(start, end, user_id, columns=("start", "duration")):
+            for s, duration in zip(starts, durations):
+                hours[(s // 3600) % 24] += duration
+        for i, total in enumerate(hours):
+            result[str(i).zfill(2)] = total
+        return result
+
+
+async def merged_hourly_histogram(db, archive: Optional[LogArchive], start: datetime, end: datetime,
+                                  user_id: Optional[int] = None) -> Dict[str, int]:
+    """アーカイブと study_logs をまとめた時間帯別の合計秒数"""
+    watermark = archive.watermark if archive else None
+    result = {str(i).zfill(2): 0 for i in range(24)}
+    if watermark:
+        boundary = min(end, datetime.fromisoformat(watermark))
+        if start < boundary:
+            result = await asyncio.to_thread(archive.hourly_histogram, start, boundary, user_id)
+        start = max(start, datetime.fromisoformat(watermark))
+    if start < end:
+        for hour, total in await db.get_log_hourly_in_range(start.isoformat(), end.isoformat(), user_id):
+            if hour is not None:
+                result[hour] = result.get(hour, 0) + (total or 0)
+    return result
@@ -0,0 +1,294 @@
+"""データベースバックアップの作成と復元
+
+バックアップは SQLite のオンラインバックアップ API で取得した一貫性のあるスナップショットを圧縮したもの。
+差分モードでは、前回のスナップショットから変更されたページだけを書き出す。
+
+復元:
+    python backup.py restore study_log.db backup_2026-01-01.db.gz backup_2026-01-02.delta.gz ...
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+from datetime import date
+from typing import List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+DELTA_MAGIC = b"SWTDELTA1\n"
+STATE_FILENAME = "backup_state.json"
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def create_snapshot(db_path: str, dest_path: str, pages_per_step: int = 1024) -> None:
+    """オンラインバックアップ API で一貫性のあるスナップショットを作成する（WAL 上の未チェックポイント分も含む）"""
+    src = sqlite3.connect(db_path)
+    try:
+        dst = sqlite3.connect(dest_path)
+        try:
+            # ページ単位で少しずつコピーし、書き込みを長時間止めない
+            src.backup(dst, pages=pages_per_step)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+
+
+def _extension(compression: str) -> str:
+    return ".zst" if compression == "zstd" else ".gz"
+
+
+def _open_write(path: str, compression: str):
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd 圧縮には zstandard パッケージが必要です")
+        return zstandard.ZstdCompressor(level=10).stream_writer(open(path, "wb"), closefd=True)
+    return gzip.open(path, "wb", compresslevel=6)
+
+
+def _open_read(path: str):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstd 形式の復元には zstandard パッケージが必要です")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def _read_exact(f, size: int) -> bytes:
+    buf = b""
+    while len(buf) < size:
+        chunk = f.read(size - len(buf))
+        if not chunk:
+            break
+        buf += chunk
+    return buf
+
+
+def _page_size(db_path: str) -> int:
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _page_hashes(db_path: str, page_size: int) -> List[str]:
+    hashes = []
+    with open(db_path, "rb") as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                break
+            hashes.append(hashlib.blake2b(page, digest_size=8).hexdigest())
+    return hashes
+
+
+class BackupArtifact:
+    """作成したバックアップファイルと、その送信が成功した後に保存する状態"""
+
+    def __init__(self, path: str, kind: str, seq: int, pages_total: int, pages_written: int,
+                 raw_bytes: int, pending_state: dict, workdir: str):
+        self.path = path
+        self.kind = kind
+        self.seq = seq
+        self.pages_total = pages_total
+        self.pages_written = pages_written
+        self.raw_bytes = raw_bytes
+        self.size_bytes = os.path.getsize(path)
+        self.pending_state = pending_state
+        self.workdir = workdir
+
+    @property
+    def filename(self) -> str:
+        return os.path.basename(self.path)
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class BackupManager:
+    """スナップショットの作成・圧縮・差分チェーンの管理
+
+    mode="incremental" の場合、最後のフルバックアップから full_every_days 日以内であれば
+    前回から変更されたページだけの差分ファイルを作成する。
+    """
+
+    def __init__(self, db_path: str, state_dir: str, compression: str = "gzip",
+                 mode: str = "full", full_every_days: int = 7):
+        self.db_path = db_path
+        self.state_dir = state_dir
+        self.compression = compression if compression in ("gzip", "zstd") else "gzip"
+        if self.compression == "zstd" and zstandard is None:
+            logger.warning("zstandard がインストールされていないため gzip で圧縮します")
+            self.compression = "gzip"
+        self.mode = mode
+        self.full_every_days = full_every_days
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(self.state_dir, STATE_FILENAME)
+
+    def _load_state(self) -> Optional[dict]:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"バックアップ状態の読み込みに失敗しました: {e}")
+            return None
+
+    def commit(self, artifact: BackupArtifact) -> None:
+        """バックアップの送信に成功した後に呼び、次回の差分の基準とする"""
+        os.makedirs(self.state_dir, exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(artifact.pending_state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _use_incremental(self, state: Optional[dict], page_size: int, date_str: str) -> bool:
+        if self.mode != "incremental" or not state:
+            return False
+        if state.get("page_size") != page_size:
+            return False
+        try:
+            base_date = date.fromisoformat(state["base_date"])
+            days = (date.fromisoformat(date_str) - base_date).days
+        except (KeyError, ValueError):
+            return False
+        return 0 <= days < self.full_every_days
+
+    def build(self, date_str: str) -> BackupArtifact:
+        """バックアップファイルを作成する（ブロッキング処理のため asyncio.to_thread から呼ぶ）"""
+        workdir = tempfile.mkdtemp(prefix="backup_")
+        try:
+            snapshot_path = os.path.join(workdir, "snapshot.db")
+            create_snapshot(self.db_path, snapshot_path)
+            raw_bytes = os.path.getsize(snapshot_path)
+            page_size = _page_size(snapshot_path)
+            hashes = _page_hashes(snapshot_path, page_size)
+            state = self._load_state()
+            ext = _extension(self.compression)
+
+            if self._use_incremental(state, page_size, date_str):
+                previous = state.get("hashes", [])
+                changed = [i for i, h in enumerate(hashes) if i >= len(previous) or previous[i] != h]
+                seq = state.get("seq", 0) + 1
+                path = os.path.join(workdir, f"backup_{date_str}.delta{ext}")
+                self._write_delta(snapshot_path, path, page_size, len(hashes), changed,
+                                  {"base": state.get("base_file"), "seq": seq})
+                kind, pages_written, base_file, base_date = "incremental", len(changed), state.get("base_file"), state["base_date"]
+            else:
+                seq = 0
+                path = os.path.join(workdir, f"backup_{date_str}.db{ext}")
+                with open(snapshot_path, "rb") as src, _open_write(path, self.compression) as dst:
+                    shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+                kind, pages_written, base_file, base_date = "full", len(hashes), os.path.basename(path), date_str
+
+            os.remove(snapshot_path)
+            pending_state = {
+                "page_size": page_size,
+                "hashes": hashes,
+                "base_file": base_file,
+                "base_date": base_date,
+                "seq": seq,
+            }
+            return BackupArtifact(path, kind, seq, len(hashes), pages_written, raw_bytes, pending_state, workdir)
+        except Exception:
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise
+
+    def _write_delta(self, snapshot_path: str, path: str, page_size: int, page_count: int,
+                     changed: List[int], meta: dict) -> None:
+        header = json.dumps({"page_size": page_size, "page_count": page_count, **meta}).encode("utf-8")
+        with open(snapshot_path, "rb") as src, _open_write(path, self.compression) as dst:
+            dst.write(DELTA_MAGIC)
+            dst.write(struct.pack(">I", len(header)))
+            dst.write(header)
+            for page_no in changed:
+                src.seek(page_no * page_size)
+                dst.write(struct.pack(">I", page_no))
+                dst.write(src.read(page_size))
+
+
+def apply_delta(db_file: str, delta_path: str) -> dict:
+    """差分ファイルを復元中のDBファイルに適用する (戻り値: 差分のヘッダ)"""
+    with _open_read(delta_path) as f:
+        if _read_exact(f, len(DELTA_MAGIC)) != DELTA_MAGIC:
+            raise ValueError(f"差分ファイルではありません: {delta_path}")
+        (header_len,) = struct.unpack(">I", _read_exact(f, 4))
+        header = json.loads(_read_exact(f, header_len).decode("utf-8"))
+        page_size = header["page_size"]
+
+        with open(db_file, "r+b") as out:
+            while True:
+                raw = _read_exact(f, 4)
+                if not raw:
+                    break
+                (page_no,) = struct.unpack(">I", raw)
+                page = _read_exact(f, page_size)
+                if len(page) != page_size:
+                    raise ValueError(f"差分ファイルが途中で終わっています: {delta_path}")
+                out.seek(page_no * page_size)
+                out.write(page)
+            out.truncate(header["page_count"] * page_size)
+    return header
+
+
+def restore(output_path: str, files: List[str]) -> None:
+    """フルバックアップと差分ファイルのチェーンから DB を復元する"""
+    if not files:
+        raise ValueError("復元するバックアップファイルを指定してください")
+    base, *deltas = files
+
+    tmp_path = output_path + ".restoring"
+    with _open_read(base) as src, open(tmp_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+
+    previous_seq = 0
+    for delta in deltas:
+        header = apply_delta(tmp_path, delta)
+        seq = header.get("seq")
+        if seq is not None and seq != previous_seq + 1:
+            logger.warning(f"差分の順序が連続していません ({previous_seq} → {seq}): {delta}")
+        previous_seq = seq or previous_seq + 1
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        raise ValueError(f"復元したDBの整合性チェックに失敗しました: {result}")
+    os.replace(tmp_path, output_path)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(description="study_log.db のバックアップツール")
+    sub = parser.add_subparsers(dest="command", required=True)
+    restore_parser = sub.add_parser("restore", help="フルバックアップと差分を順に適用して復元する")
+    restore_parser.add_argument("output", help="復元先のDBファイル")
+    restore_parser.add_argument("files", nargs="+", help="フルバックアップ、続けて差分ファイルを古い順に指定")
+    args = parser.parse_args()
+
+    if args.command == "restore":
+        restore(args.output, args.files)
+        print(f"復元が完了しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""create_embed_from_config の描画コストの比較
+
+事前解析したテンプレート (utils.create_embed_from_config / EmbedTemplate.render) と、
+毎回 str.format する従来の実装 (legacy_create_embed) で、MESSAGES の各 Embed を作る時間を測る。
+
+    python benchmarks/bench_templates.py [繰り返し回数]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord  # noqa: E402
+
+from messages import MESSAGES, Colors  # noqa: E402
+from utils import EMBED_TEMPLATES, create_embed_from_config  # noqa: E402
+
+
+def legacy_create_embed(config, **kwargs):
+    """事前解析を入れる前の create_embed_from_config (比較用)"""
+    title = config.get("embed_title", "")
+    if title:
+        try:
+            title = title.format(**kwargs)
+        except Exception:
+            pass
+
+    desc = config.get("embed_description") or config.get("embed_desc", "")
+    if desc:
+        try:
+            desc = desc.format(**kwargs)
+        except Exception:
+            pass
+
+    embed = discord.Embed(title=title, description=desc, color=config.get("embed_color", Colors.GRAY))
+    if "fields" in config and isinstance(config["fields"], list):
+        for field in config["fields"]:
+            name = field.get("name", "")
+            value = field.get("value", "")
+            try:
+                name = name.format(**kwargs)
+            except Exception:
+                pass
+            try:
+                value = value.format(**kwargs)
+            except Exception:
+                pass
+            if value:
+                embed.add_field(name=name or "\u200b", value=value, inline=field.get("inline", False))
+    return embed
+
+
+def sample_kwargs(name: str) -> dict:
+    """テンプレートの差し込み項目すべてにサンプル値を入れた引数"""
+    return {field: f"<{field}>" for field in EMBED_TEMPLATES[name].placeholders}
+
+
+def run(number: int = 20000) -> dict:
+    """テンプレートごとの1回あたりの時間 (マイクロ秒) を {名前: (従来, 事前解析)} で返す"""
+    results = {}
+    for name in sorted(EMBED_TEMPLATES):
+        config, kwargs = MESSAGES[name], sample_kwargs(name)
+        legacy = timeit.timeit(lambda: legacy_create_embed(config, **kwargs), number=number)
+        compiled = timeit.timeit(lambda: create_embed_from_config(config, **kwargs), number=number)
+        results[name] = (legacy / number * 1e6, compiled / number * 1e6)
+    return results
+
+
+def _render_only(number: int) -> float:
+    """discord.Embed の生成を除いた、文字列の差し込みだけの時間の比 (従来 / 事前解析)"""
+    legacy = compiled = 0.0
+    for name, template in EMBED_TEMPLATES.items():
+        config, kwargs = MESSAGES[name], sample_kwargs(name)
+        texts = [config.get("embed_title") or "", config.get("embed_description") or config.get("embed_desc") or ""]
+        texts += [part for field in config.get("fields") or [] for part in (field.get("name", ""), field.get("value", ""))]
+        parts = [template.title, template.description] + [part for field in template.fields for part in field[:2]]
+        legacy += timeit.timeit(lambda: [t.format(**kwargs) for t in texts], number=number)
+        compiled += timeit.timeit(lambda: [p.render(kwargs) for p in parts], number=number)
+    return legacy / compiled if compiled else 0.0
+
+
+if __name__ == "__main__":
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    total_legacy = total_compiled = 0.0
+    print(f"{'template':<24}{'legacy (us)':>14}{'compiled (us)':>16}")
+    for name, (legacy, compiled) in run(number).items():
+        total_legacy += legacy
+        total_compiled += compiled
+        print(f"{name:<24}{legacy:>14.2f}{compiled:>16.2f}")
+    print(f"{'total':<24}{total_legacy:>14.2f}{total_compiled:>16.2f}")
+    print(f"文字列の差し込みのみ: 事前解析は従来の {_render_only(number):.2f} 倍速")
@@ -1,7 +1,7 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from datetime import datetime
+from datetime import datetime, date, timedelta
 from utils import safe_message_delete, format_duration, create_embed_from_config
 from messages import MESSAGES, Colors
 from config import Config
@@ -52,9 +52,15 @@ class AdminCog(commands.Cog):
             member.display_name,
             now,
             total_seconds,
-            now
+            now,
+            attribute_task=False  # 手動調整はタスクの作業時間には含めない
         )
         
+        # 称号判定用の累計にも反映する
+        study_cog = self.bot.get_cog("StudyCog")
+        if study_cog:
+            await study_cog.milestones.adjust(member.id, total_seconds)
+
         new_total = await self.bot.db.get_today_seconds(member.id)
         time_str = format_duration(new_total)
         
@@ -167,6 +173,115 @@ class AdminCog(commands.Cog):
                 ephemeral=True
             )
 
+    @app_commands.command(name="backfill", description="[管理者用] 指定期間の日別集計を生ログから作り直します")
+    @app_commands.describe(start="開始日 (YYYY-MM-DD)", end="終了日 (YYYY-MM-DD、省略時は開始日のみ)")
+    @app_commands.default_permissions(administrator=True)
+    async def backfill(self, interaction: discord.Interaction, start: str, end: str = None):
+        """日別・月別集計のバックフィル"""
+        try:
+            start_date = date.fromisoformat(start)
+            end_date = date.fromisoformat(end) if end else start_date
+        except ValueError:
+            await interaction.response.send_message("⚠️ 日付は YYYY-MM-DD 形式で指定してください。", ephemeral=True)
+            return
+        if end_date < start_date:
+            await interaction.response.send_message("⚠️ 終了日は開始日以降にしてください。", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        rows = await self.bot.db.materialize_daily_summaries(start_date, end_date)
+        await self.bot.db.rebuild_monthly_summary(start_date.strftime("%Y-%m"))
+        await interaction.followup.send(
+            f"✅ {start_date} 〜 {end_date} の日別集計を作成しました（{rows}行）。\n"
+            f"※ 生ログの保持期間 ({Config.KEEP_LOG_DAYS}日) より前の日は既存の集計がそのまま残ります。",
+            ephemeral=True
+        )
+
+    @app_commands.command(name="concurrency", description="[管理者用] 日ごとの最大同時作業人数と、一緒に作業した時間の長いペアを表示します")
+    @app_commands.describe(days="集計する日数 (今日を含まない直近の日数、既定: 7)")
+    @app_commands.default_permissions(administrator=True)
+    async def concurrency(self, interaction: discord.Interaction, days: app_commands.Range[int, 1, 90] = 7):
+        """同時作業の日別集計を表示"""
+        await interaction.response.defer(ephemeral=True)
+
+        end = date.today() - timedelta(days=1)
+        start = end - timedelta(days=days - 1)
+        day_rows = await self.bot.db.get_concurrency_days(start.isoformat(), end.isoformat())
+        pairs = await self.bot.db.get_co_study_pairs(start.isoformat(), end.isoformat(), limit=10)
+
+        embed = discord.Embed(
+            title="👥 同時作業の集計",
+            description=f"{start.strftime('%Y/%m/%d')} 〜 {end.strftime('%Y/%m/%d')}",
+            color=Colors.BLUE
+        )
+        day_lines = [
+            f"{day[5:].replace('-', '/')}: 最大 {peak}人"
+            + (f" ({peak_time}〜)" if peak_time and peak else "")
+            + f" / 2人以上 {format_duration(co_seconds or 0, for_voice=False)}"
+            for day, peak, peak_time, co_seconds in day_rows
+        ]
+        embed.add_field(name="日別の最大同時作業人数", value="\n".join(day_lines)[:1024] or "集計がありません", inline=False)
+
+        pair_lines = [
+            f"{idx}. <@{user_a}> & <@{user_b}>: {format_duration(seconds, for_voice=False)}"
+            for idx, (user_a, user_b, seconds) in enumerate(pairs, 1)
+        ]
+        embed.add_field(name="一緒に作業した時間", value="\n".join(pair_lines)[:1024] or "該当なし", inline=False)
+        embed.set_footer(text="日別集計は毎日のメンテナンス時に更新されます")
+
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="cache", description="[管理者用] 集計クエリのキャッシュのヒット率を表示します")
+    @app_commands.default_permissions(administrator=True)
+    async def cache(self, interaction: discord.Interaction):
+        """クエリキャッシュの統計を表示"""
+        cache = self.bot.db.cache
+        if cache is None:
+            await interaction.response.send_message("クエリキャッシュは無効です。", ephemeral=True)
+            return
+
+        stats = cache.stats()
+        hits = sum(s["hits"] for s in stats.values())
+        total = hits + sum(s["misses"] for s in stats.values())
+        embed = discord.Embed(
+            title="🗃️ クエリキャッシュ",
+            description=f"保持件数: {cache.size} / TTL: {cache.ttl:.0f}秒\n"
+                        f"全体のヒット率: {hits / total * 100 if total else 0:.1f}% ({hits}/{total})",
+            color=Colors.BLUE
+        )
+        for name, s in list(stats.items())[:25]:
+            embed.add_field(
+                name=name,
+                value=f"ヒット {s['hits']} / ミス {s['misses']} ({s['hit_rate'] * 100:.1f}%)",
+                inline=False
+            )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="jobs", description="[管理者用] スケジューラのジョブ状況を表示します")
+    @app_commands.default_permissions(administrator=True)
+    async def jobs(self, interaction: discord.Interaction):
+        """スケジューラのジョブ一覧と実行統計を表示"""
+        await interaction.response.defer(ephemeral=True)
+
+        metrics = self.bot.scheduler.metrics()
+        embed = discord.Embed(
+            title="⏱️ スケジューラ",
+            description=f"登録ジョブ: {len(metrics)} 件",
+            color=Colors.BLUE
+        )
+
+        for name, m in list(metrics.items())[:25]:
+            next_run = m["next_run"][5:16].replace("T", " ") if m["next_run"] else "---"
+            value = (
+                f"{m['trigger']} / 次回: {next_run}\n"
+                f"実行: {m['runs']}回 (失敗 {m['failures']}, スキップ {m['skipped']}, 取り戻し {m['catch_up_runs']})\n"
+                f"所要: 平均 {m['avg_duration']}s / 最大 {m['max_duration']}s\n"
+                f"遅延: 直近 {m['last_lateness']}s / 最大 {m['max_lateness']}s"
+            )
+            embed.add_field(name=name, value=value, inline=False)
+
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
 
 async def setup(bot):
     await bot.add_cog(AdminCog(bot))
@@ -0,0 +1,221 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+from datetime import date, datetime, timedelta
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from config import Config
+from archive import to_seconds
+from datafile import ExportWriter, ImportReader, session_record, daily_record
+
+logger = logging.getLogger(__name__)
+
+FORMAT_CHOICES = [
+    app_commands.Choice(name="CSV", value="csv"),
+    app_commands.Choice(name="NDJSON", value="ndjson"),
+]
+
+
+def parse_range(start: str = None, end: str = None):
+    """YYYY-MM-DD の開始日・終了日を (開始日, 終了日の翌日) の文字列に変換する（省略時は全期間）"""
+    start_date = date.fromisoformat(start) if start else None
+    end_date = date.fromisoformat(end) if end else None
+    if start_date and end_date and end_date < start_date:
+        raise ValueError("終了日は開始日以降にしてください")
+    start_str = start_date.isoformat() if start_date else "0000-01-01"
+    end_str = (end_date + timedelta(days=1)).isoformat() if end_date else "9999-12-31"
+    return start_str, end_str
+
+
+class ExportCog(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        # 大きなエクスポートが重ならないよう1件ずつ処理する
+        self._lock = asyncio.Lock()
+
+    async def _records(self, start_str: str, end_str: str, user_id: int = None):
+        """daily_summary → study_logs の順にレコードを返す"""
+        async for user, username, date_str, seconds in self.bot.db.iter_daily_summary_rows(start_str, end_str, user_id):
+            yield daily_record(user, username, date_str, seconds)
+        async for user, username, start_time, seconds, end_time in self.bot.db.iter_study_log_rows(start_str, end_str, user_id):
+            yield session_record(user, username, start_time, seconds, end_time)
+
+    async def _export(self, interaction: discord.Interaction, basename: str, fmt: str,
+                      start: str, end: str, user_id: int = None):
+        try:
+            start_str, end_str = parse_range(start, end)
+        except ValueError as e:
+            await interaction.response.send_message(f"⚠️ 日付は YYYY-MM-DD 形式で指定してください。({e})", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        writer = ExportWriter(basename, fmt, max_bytes=Config.EXPORT_MAX_FILE_BYTES)
+        try:
+            async with self._lock:
+                rows = await writer.write_all(self._records(start_str, end_str, user_id))
+                paths = writer.close()
+
+            await interaction.followup.send(
+                f"📦 {rows}件をエクスポートしました（{len(paths)}ファイル / {writer.total_bytes / 1024:.1f} KB）",
+                ephemeral=True
+            )
+            for path in paths:
+                await interaction.followup.send(file=discord.File(path), ephemeral=True)
+        except Exception as e:
+            logger.error(f"エクスポートエラー ({basename}): {e}")
+            await interaction.followup.send("❌ エクスポートに失敗しました。", ephemeral=True)
+        finally:
+            writer.cleanup()
+
+    @app_commands.command(name="export", description="あなたの作業記録をファイルで出力します")
+    @app_commands.describe(start="開始日 (YYYY-MM-DD、省略時は最初から)", end="終了日 (YYYY-MM-DD、省略時は今日まで)",
+                           format="出力形式")
+    @app_commands.choices(format=FORMAT_CHOICES)
+    @app_commands.default_permissions(send_messages=True)
+    async def export(self, interaction: discord.Interaction, start: str = None, end: str = None,
+                     format: app_commands.Choice[str] = None):
+        """個人の作業記録のエクスポート"""
+        fmt = format.value if format else "csv"
+        await self._export(interaction, f"study_{interaction.user.id}", fmt, start, end, user_id=interaction.user.id)
+
+    @app_commands.command(name="export_server", description="[管理者用] サーバー全体の作業記録をファイルで出力します")
+    @app_commands.describe(start="開始日 (YYYY-MM-DD、省略時は最初から)", end="終了日 (YYYY-MM-DD、省略時は今日まで)",
+                           format="出力形式")
+    @app_commands.choices(format=FORMAT_CHOICES)
+    @app_commands.default_permissions(administrator=True)
+    async def export_server(self, interaction: discord.Interaction, start: str = None, end: str = None,
+                            format: app_commands.Choice[str] = None):
+        """サーバー全体の作業記録のエクスポート"""
+        fmt = format.value if format else "csv"
+        await self._export(interaction, "study_server", fmt, start, end)
+
+    @app_commands.command(name="import", description="[管理者用] CSV / NDJSON ファイルから作業記録を取り込みます")
+    @app_commands.describe(file="/export と同じ形式のファイル (gzip 圧縮も可)")
+    @app_commands.default_permissions(administrator=True)
+    async def import_logs(self, interaction: discord.Interaction, file: discord.Attachment):
+        """過去の作業記録の一括取り込み"""
+        await interaction.response.defer(ephemeral=True)
+        started = time.monotonic()
+        fd, path = tempfile.mkstemp(prefix="import_")
+        os.close(fd)
+        reader = None
+        try:
+            await file.save(path)
+            reader = ImportReader(path)
+            async with self._lock:
+                result = await self._import_file(reader)
+        except Exception as e:
+            logger.error(f"インポートエラー ({file.filename}): {e}")
+            await interaction.followup.send(f"❌ 取り込みに失敗しました: {e}", ephemeral=True)
+            return
+        finally:
+            if reader:
+                reader.close()
+            os.remove(path)
+
+        inserted, duplicates, uncovered, days = result
+        lines = [
+            f"📥 **{file.filename}** の取り込みが完了しました（{time.monotonic() - started:.1f}秒）",
+            f"追加: {inserted}件 / 重複: {duplicates}件 / 不正: {reader.invalid}件 / 対象外: {reader.skipped}件",
+        ]
+        if uncovered:
+            lines.append(f"⚠️ 生ログ削除済みで重複を確認できない集計済みの日のログ {uncovered}件は取り込みませんでした")
+        if days:
+            lines.append(f"集計を更新した期間: {min(days)} 〜 {max(days)}")
+        if reader.errors:
+            lines.append("```\n" + "\n".join(reader.errors) + "\n```")
+        await interaction.followup.send("\n".join(lines)[:2000], ephemeral=True)
+
+    async def _import_file(self, reader: ImportReader):
+        """ファイルをチャンクごとに検証・重複除去して取り込み、最後に集計をまとめて更新する"""
+        db = self.bot.db
+        archive = getattr(self.bot, "archive", None)
+        watermark = archive.watermark if archive else None
+        archived_keys = {}  # {月: アーカイブ済みの (user_id, 開始秒) の集合}
+        summarized_days = {}  # {月: 日別集計がある (user_id, 日付) の集合}
+        daily_totals = {}  # {(user_id, 日付): [username, 秒数]}
+        user_totals = {}
+        inserted_count = duplicates = uncovered = 0
+
+        # 重複を確認できる範囲: 生ログが残っている期間と、アーカイブにある期間
+        # それ以外の集計済みの日は、取り込むログが既に集計に含まれているか判断できない
+        daily_through = await db.get_rollup_state("daily_through")
+        raw_from = (datetime.now() - timedelta(days=Config.KEEP_LOG_DAYS)).isoformat()
+        archive_from = await asyncio.to_thread(archive.coverage_start) if watermark else None
+
+        while True:
+            chunk = await asyncio.to_thread(reader.read_chunk, Config.IMPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+
+            # アーカイブに移した期間のログは study_logs に無いため、アーカイブと照合する
+            if watermark:
+                fresh = []
+                for row in chunk:
+                    user_id, _, start_time, _, end_time = row
+                    if end_time < watermark:
+                        month = end_time[:7]
+                        if month not in archived_keys:
+                            archived_keys[month] = await asyncio.to_thread(archive.session_keys, month)
+                        if (user_id, to_seconds(datetime.fromisoformat(start_time))) in archived_keys[month]:
+                            continue
+                    fresh.append(row)
+                duplicates += len(chunk) - len(fresh)
+                chunk = fresh
+
+            # 照合できない期間のログは、その日の集計が無い場合だけ取り込む (あれば二重計上になりうるため除外)
+            if daily_through:
+                checked = []
+                for row in chunk:
+                    user_id, _, _, _, end_time = row
+                    day = end_time[:10]
+                    covered = (
+                        day > daily_through or end_time >= raw_from
+                        or (archive_from is not None and archive_from <= end_time < watermark)
+                    )
+                    if not covered:
+                        month = day[:7]
+                        if month not in summarized_days:
+                            summarized_days[month] = await db.get_summarized_user_days(month)
+                        if (user_id, day) in summarized_days[month]:
+                            continue
+                    checked.append(row)
+                uncovered += len(chunk) - len(checked)
+                chunk = checked
+
+            inserted = await db.import_study_logs(chunk)
+            duplicates += len(chunk) - len(inserted)
+            inserted_count += len(inserted)
+            for user_id, username, _, seconds, end_time in inserted:
+                entry = daily_totals.setdefault((user_id, end_time[:10]), [username, 0])
+                entry[1] += seconds
+                user_totals[user_id] = user_totals.get(user_id, 0) + seconds
+
+        # 集計の更新は最後に1回だけ行う
+        days = sorted({day for _, day in daily_totals})
+        if days:
+            await db.add_to_daily_summaries(
+                [(user_id, username, day, seconds) for (user_id, day), (username, seconds) in daily_totals.items()]
+            )
+            await db.rebuild_monthly_summary(days[0][:7])
+
+            # 時間別集計は生ログが残っている期間だけ作り直す (それより前は生ログが無いため)
+            hourly_through = await db.get_rollup_state("hourly_through")
+            raw_from = (date.today() - timedelta(days=Config.KEEP_LOG_DAYS)).isoformat()
+            for day in days:
+                if day >= raw_from and hourly_through and day <= hourly_through:
+                    await db.rebuild_hourly_summary(date.fromisoformat(day))
+
+            study_cog = self.bot.get_cog("StudyCog")
+            if study_cog:
+                for user_id, seconds in user_totals.items():
+                    await study_cog.milestones.adjust(user_id, seconds)
+
+        return inserted_count, duplicates, uncovered, days
+
+
+async def setup(bot):
+    await bot.add_cog(ExportCog(bot))
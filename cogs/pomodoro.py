@@ -1,50 +1,204 @@
 import discord
-from discord.ext import commands, tasks
-from datetime import datetime
+from discord.ext import commands
+from discord import app_commands
+from datetime import datetime, timedelta
+import asyncio
+import heapq
+import itertools
 import logging
 from config import Config
 from utils import speak_in_vc
 
 logger = logging.getLogger(__name__)
 
+JOB_NAME = "pomodoro:next"
+# POMODORO_CHANNEL_ID からの移行を済ませたことを記録する rollup_state のキー
+MIGRATION_STATE_KEY = "pomodoro_migrated"
+
+# 既定値 (POMODORO_CHANNEL_ID からの移行時にも使用)
+DEFAULT_WORK_MINUTES = 25
+DEFAULT_BREAK_MINUTES = 5
+MAX_MINUTES = 180
+
+
+class PomodoroRoom:
+    """1つのボイスチャンネルのポモドーロ設定
+
+    anchor を起点に (作業 → 休憩) のサイクルを繰り返す。
+    """
+
+    def __init__(self, channel_id: int, guild_id: int, work_minutes: int, break_minutes: int, anchor: datetime):
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.work_minutes = work_minutes
+        self.break_minutes = break_minutes
+        self.anchor = anchor
+        self.next_transition = None
+        self.next_phase = None
+
+    def compute_next(self, now: datetime):
+        """now より後の次の切り替え時刻と、その時点で始まるフェーズ ("start" / "break") を求める"""
+        work = self.work_minutes * 60
+        cycle = work + self.break_minutes * 60
+        elapsed = int((now - self.anchor).total_seconds())
+        cycle_index, offset = divmod(elapsed, cycle)
+        cycle_start = self.anchor + timedelta(seconds=cycle_index * cycle)
+        if offset < work:
+            return cycle_start + timedelta(seconds=work), "break"
+        return cycle_start + timedelta(seconds=cycle), "start"
+
+    def phase_text(self, phase: str):
+        if phase == "start":
+            return f"作業の時間です。{self.work_minutes}分間集中しましょう。"
+        if phase == "break":
+            return f"{self.work_minutes}分経過しました。{self.break_minutes}分間休憩しましょう。"
+        return None
+
+
 class PomodoroCog(commands.Cog):
+    pomodoro = app_commands.Group(
+        name="pomodoro",
+        description="ボイスチャンネルのポモドーロタイマーを設定します",
+        default_permissions=discord.Permissions(manage_channels=True)
+    )
+
     def __init__(self, bot):
         self.bot = bot
-        self.last_triggered_minute = -1
-        self.pomodoro_task.start()
+        self.rooms = {}  # {channel_id: PomodoroRoom}
+        # 全ルーム共通のタイマーホイール: (次の切り替え時刻, seq, channel_id)
+        # スケジューラには先頭の時刻だけを一回限りのジョブとして登録する
+        self._wheel = []
+        self._seq = itertools.count()
+        self._load_task = asyncio.create_task(self._load_rooms())
 
     def cog_unload(self):
-        self.pomodoro_task.cancel()
+        if self._load_task:
+            self._load_task.cancel()
+        self.bot.scheduler.remove(JOB_NAME)
+
+    async def _load_rooms(self):
+        """DBからルーム設定を読み込む（初回のみ、未設定かつ POMODORO_CHANNEL_ID がある場合は移行する）"""
+        rows = await self.bot.db.get_pomodoro_rooms()
+        # 移行は1度だけ行う (/pomodoro stop で全ルームを止めた後の再起動で復活させない)
+        if not await self.bot.db.get_rollup_state(MIGRATION_STATE_KEY):
+            if not rows and Config.POMODORO_CHANNEL_ID:
+                # 従来の毎時 00分・30分開始 / 25分・55分休憩 と同じスケジュール
+                anchor = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+                await self.bot.db.set_pomodoro_room(
+                    Config.POMODORO_CHANNEL_ID, 0, DEFAULT_WORK_MINUTES, DEFAULT_BREAK_MINUTES, anchor.isoformat()
+                )
+                rows = await self.bot.db.get_pomodoro_rooms()
+            await self.bot.db.set_rollup_state(MIGRATION_STATE_KEY, datetime.now().isoformat())
+
+        now = datetime.now()
+        for channel_id, guild_id, work_minutes, break_minutes, anchor_str in rows or []:
+            try:
+                anchor = datetime.fromisoformat(anchor_str)
+            except (TypeError, ValueError):
+                logger.error(f"ポモドーロ設定の起点時刻が不正です (ID:{channel_id}): {anchor_str}")
+                continue
+            self._add_room(PomodoroRoom(channel_id, guild_id, work_minutes, break_minutes, anchor), now)
+
+        if self.rooms:
+            logger.info(f"ポモドーロ: {len(self.rooms)} 部屋のスケジュールを読み込みました。")
+        self._schedule_next()
+
+    def _add_room(self, room: PomodoroRoom, now: datetime):
+        room.next_transition, room.next_phase = room.compute_next(now)
+        self.rooms[room.channel_id] = room
+        heapq.heappush(self._wheel, (room.next_transition, next(self._seq), room.channel_id))
 
-    @tasks.loop(seconds=1.0)
-    async def pomodoro_task(self):
+    def _is_live(self, entry) -> bool:
+        when, _, channel_id = entry
+        room = self.rooms.get(channel_id)
+        return room is not None and room.next_transition == when
+
+    def _schedule_next(self):
+        while self._wheel and not self._is_live(self._wheel[0]):
+            heapq.heappop(self._wheel)
+        if self._wheel:
+            self.bot.scheduler.add_oneshot(JOB_NAME, self._wheel[0][0], self._on_transition)
+        else:
+            self.bot.scheduler.remove(JOB_NAME)
+
+    async def _on_transition(self):
+        """切り替え時刻が来たときにスケジューラから呼ばれる（同時刻の全ルームをまとめて処理）"""
         now = datetime.now()
-        current_minute = now.minute
+        due = []
+        while self._wheel and self._wheel[0][0] <= now:
+            entry = heapq.heappop(self._wheel)
+            if not self._is_live(entry):
+                continue
+            room = self.rooms[entry[2]]
+            due.append((room, room.next_phase))
+            # 次の切り替えを先に計算してホイールに戻す
+            room.next_transition, room.next_phase = room.compute_next(entry[0])
+            heapq.heappush(self._wheel, (room.next_transition, next(self._seq), room.channel_id))
+        self._schedule_next()
+
+        if due:
+            await asyncio.gather(*(self.announce(room, phase) for room, phase in due))
 
-        # すでにこの分で実行済みならスキップ
-        if current_minute == self.last_triggered_minute:
+    @pomodoro.command(name="start", description="このボイスチャンネルでポモドーロを開始します")
+    @app_commands.describe(channel="対象のボイスチャンネル（省略時は参加中のチャンネル）",
+                           work="作業時間（分）", rest="休憩時間（分）")
+    async def pomodoro_start(self, interaction: discord.Interaction,
+                             channel: discord.VoiceChannel = None,
+                             work: int = DEFAULT_WORK_MINUTES, rest: int = DEFAULT_BREAK_MINUTES):
+        """ポモドーロのスケジュールを設定"""
+        channel = channel or getattr(getattr(interaction.user, "voice", None), "channel", None)
+        if not isinstance(channel, discord.VoiceChannel):
+            await interaction.response.send_message("⚠️ ボイスチャンネルを指定するか、参加してから実行してください。", ephemeral=True)
             return
+        if not (0 < work <= MAX_MINUTES and 0 < rest <= MAX_MINUTES):
+            await interaction.response.send_message(f"⚠️ 時間は 1〜{MAX_MINUTES} 分で指定してください。", ephemeral=True)
+            return
+
+        now = datetime.now().replace(microsecond=0)
+        await self.bot.db.set_pomodoro_room(channel.id, channel.guild.id, work, rest, now.isoformat())
+        room = PomodoroRoom(channel.id, channel.guild.id, work, rest, now)
+        self._add_room(room, now)
+        self._schedule_next()
+
+        await interaction.response.send_message(
+            f"🍅 <#{channel.id}> でポモドーロを開始しました（作業 {work}分 / 休憩 {rest}分）", ephemeral=True
+        )
+        await self.announce(room, "start")
 
-        # 秒が0になるのを待つ必要はないが、あまりにズレて実行されるのを防ぐため
-        # 0秒付近（例えば0~5秒）で実行されるようにするか、
-        # あるいは「分が変わった瞬間」に即時実行する（今のロジックなら即時実行される）
-        
-        self.last_triggered_minute = current_minute
+    @pomodoro.command(name="stop", description="ボイスチャンネルのポモドーロを停止します")
+    @app_commands.describe(channel="対象のボイスチャンネル（省略時は参加中のチャンネル）")
+    async def pomodoro_stop(self, interaction: discord.Interaction, channel: discord.VoiceChannel = None):
+        """ポモドーロのスケジュールを削除"""
+        channel = channel or getattr(getattr(interaction.user, "voice", None), "channel", None)
+        if channel is None or channel.id not in self.rooms:
+            await interaction.response.send_message("⚠️ このチャンネルにはポモドーロが設定されていません。", ephemeral=True)
+            return
+
+        await self.bot.db.delete_pomodoro_room(channel.id)
+        del self.rooms[channel.id]
+        self._schedule_next()
+        await interaction.response.send_message(f"🍅 <#{channel.id}> のポモドーロを停止しました。", ephemeral=True)
 
-        channel_id = Config.POMODORO_CHANNEL_ID
-        if not channel_id:
+    @pomodoro.command(name="list", description="ポモドーロが設定されているチャンネルを表示します")
+    async def pomodoro_list(self, interaction: discord.Interaction):
+        """設定済みルームの一覧"""
+        guild_id = interaction.guild_id
+        rooms = [r for r in self.rooms.values() if r.guild_id in (guild_id, 0)]
+        if not rooms:
+            await interaction.response.send_message("📭 ポモドーロが設定されているチャンネルはありません。", ephemeral=True)
             return
 
-        # スケジュール確認
-        # 作業開始: 毎時 00分, 30分
-        if current_minute == 0 or current_minute == 30:
-            await self.announce(channel_id, "start")
-        
-        # 休憩開始: 毎時 25分, 55分
-        elif current_minute == 25 or current_minute == 55:
-            await self.announce(channel_id, "break")
+        lines = []
+        for room in sorted(rooms, key=lambda r: r.next_transition):
+            phase = "作業開始" if room.next_phase == "start" else "休憩開始"
+            lines.append(
+                f"<#{room.channel_id}> 作業 {room.work_minutes}分 / 休憩 {room.break_minutes}分"
+                f"（次: {room.next_transition.strftime('%H:%M')} {phase}）"
+            )
+        await interaction.response.send_message("\n".join(lines)[:2000], ephemeral=True)
 
-    async def announce(self, channel_id, type):
+    async def announce(self, room: PomodoroRoom, phase: str):
+        channel_id = room.channel_id
         try:
             channel = self.bot.get_channel(channel_id)
             if not channel:
@@ -53,7 +207,7 @@ class PomodoroCog(commands.Cog):
                 except Exception as e:
                     logger.error(f"ポモドーロ用チャンネル(ID:{channel_id})の取得に失敗: {e}")
                     return
-            
+
             # ボイスチャンネルか確認
             if not isinstance(channel, discord.VoiceChannel):
                 logger.warning(f"指定されたチャンネル(ID:{channel_id})はボイスチャンネルではありません。")
@@ -65,14 +219,10 @@ class PomodoroCog(commands.Cog):
                 # 誰もいない場合はアナウンスしない
                 return
 
-            if type == "start":
-                text = "作業の時間です。25分間集中しましょう。"
-                logger.info("ポモドーロ: 作業開始アナウンスを実行します")
-            elif type == "break":
-                text = "25分経過しました。5分間休憩しましょう。"
-                logger.info("ポモドーロ: 休憩アナウンスを実行します")
-            else:
+            text = room.phase_text(phase)
+            if not text:
                 return
+            logger.info(f"ポモドーロ: {channel.name} で{'作業開始' if phase == 'start' else '休憩'}アナウンスを実行します")
 
             # 音声再生 ("pomodoro"という固定IDを使用)
             await speak_in_vc(channel, text, "pomodoro")
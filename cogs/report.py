@@ -1,76 +1,235 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
-from datetime import datetime, timedelta, time, timezone
+from datetime import datetime, timedelta, date
 import os
+import io
+import csv
 import asyncio
 import logging
 from config import Config
-from utils import format_duration, delete_previous_message, safe_message_delete, create_embed_from_config, generate_7day_graph, generate_hourly_graph
+from backup import BackupManager
+from activity import ActivityCharts
+from archive import EPOCH, merged_hourly_histogram
+from concurrency import update_daily_concurrency
+from templates import EmbedTemplate
+from utils import EmbedPaginator, fan_out, format_duration, delete_previous_message, safe_message_delete, create_embed_from_config, generate_7day_graph, generate_hourly_graph
 from messages import MESSAGES, Colors
 
 logger = logging.getLogger(__name__)
 
-# JSTの定義
-JST = timezone(timedelta(hours=9))
+# /rank の集計期間 (値: 表示名)
+RANK_PERIODS = {
+    "week": "今週",
+    "month": "今月",
+    "last7": "過去7日間",
+    "last30": "過去30日間",
+    "year": "今年",
+    "all": "全期間",
+    "custom": "期間指定",
+}
+
+
+def resolve_rank_period(key: str, today: date, start: str = None, end: str = None):
+    """集計期間を (開始日, 終了日) に変換する（どちらも含む）"""
+    if key == "week":
+        return today - timedelta(days=today.weekday()), today
+    if key == "month":
+        return today.replace(day=1), today
+    if key == "last7":
+        return today - timedelta(days=6), today
+    if key == "last30":
+        return today - timedelta(days=29), today
+    if key == "year":
+        return today.replace(month=1, day=1), today
+    if key == "all":
+        return date(2000, 1, 1), today
+    start_date = date.fromisoformat(start) if start else today
+    end_date = date.fromisoformat(end) if end else today
+    if end_date < start_date:
+        raise ValueError("終了日は開始日以降にしてください")
+    return start_date, end_date
+
+# ランキングのスナップショットを保存する期間の種類
+SNAPSHOT_PERIODS = {
+    "week": "週間",
+    "month": "月間",
+}
+
+
+def snapshot_period(period_type: str, day: date):
+    """day を含む週 (月曜始まり) または月の (開始日, 終了日)"""
+    if period_type == "month":
+        start = day.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        return start, end
+    start = day - timedelta(days=day.weekday())
+    return start, start + timedelta(days=6)
+
+
+# 期間指定のランキングは見出しだけ period_title に差し替えたテンプレートを使う
+PERIOD_RANK_TEMPLATE = EmbedTemplate(
+    {**MESSAGES.get("rank", {}), "embed_title": MESSAGES.get("rank", {}).get("period_title", "{period}")},
+    "rank.period_title"
+)
+
+
+def build_rank_embed(rows, label: str = None) -> discord.Embed:
+    """ランキングのEmbedを作成（label が無い場合は今週のランキングの見出し）"""
+    rank_config = MESSAGES.get("rank", {})
+    if label is None:
+        embed = create_embed_from_config(rank_config)
+    else:
+        embed = PERIOD_RANK_TEMPLATE.render(period=label)
+
+    rank_text = ""
+    row_fmt = rank_config.get("row", "{icon} **{name}**: {time}\n")
+    
+    for i, (_, username, total_seconds) in enumerate(rows, 1):
+        time_str = format_duration(total_seconds, for_voice=True)
+        icon = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"{i}."
+        rank_text += row_fmt.format(icon=icon, name=username, time=time_str)
+    
+    embed.add_field(name="Top Members", value=rank_text or "-", inline=False)
+    return embed
+
+
+def build_snapshot_embed(period_type: str, snapshot) -> discord.Embed:
+    start, end, rows = snapshot
+    label = (f"{SNAPSHOT_PERIODS[period_type]} {date.fromisoformat(start).strftime('%Y/%m/%d')}"
+             f"〜{date.fromisoformat(end).strftime('%Y/%m/%d')}")
+    return build_rank_embed(rows[:Config.RANK_SIZE], label)
+
+
+class RankHistoryView(discord.ui.View):
+    """保存済みランキングのページ送り"""
+
+    def __init__(self, db, period_type: str, start: str):
+        super().__init__(timeout=300)
+        self.db = db
+        self.period_type = period_type
+        self.start = start
+
+    async def refresh_buttons(self):
+        self.older.disabled = await self.db.get_adjacent_ranking_period(self.period_type, self.start, older=True) is None
+        self.newer.disabled = await self.db.get_adjacent_ranking_period(self.period_type, self.start, older=False) is None
+
+    async def _move(self, interaction: discord.Interaction, older: bool):
+        start = await self.db.get_adjacent_ranking_period(self.period_type, self.start, older=older)
+        snapshot = await self.db.get_ranking_snapshot(self.period_type, start) if start else None
+        if not snapshot:
+            await interaction.response.defer()
+            return
+        self.start = start
+        await self.refresh_buttons()
+        await interaction.response.edit_message(embed=build_snapshot_embed(self.period_type, snapshot), view=self)
+
+    @discord.ui.button(label="◀ 前の期間", style=discord.ButtonStyle.secondary)
+    async def older(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._move(interaction, older=True)
+
+    @discord.ui.button(label="次の期間 ▶", style=discord.ButtonStyle.secondary)
+    async def newer(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._move(interaction, older=False)
+
 
 class ReportCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.rank_msg_tracker = {}
         self.pending_vc_clears = set()
+        self.backup_manager = BackupManager(
+            self.bot.db.db_path,
+            Config.BACKUP_STATE_DIR,
+            compression=Config.BACKUP_COMPRESSION,
+            mode=Config.BACKUP_MODE,
+            full_every_days=Config.BACKUP_FULL_EVERY_DAYS
+        )
+        # /stats の年間ヒートマップ・曜日×時間帯マトリクス (描画結果をキャッシュ)
+        self.activity = ActivityCharts(self.bot.db, Config.HEATMAP_CACHE_SECONDS, Config.WEEKDAY_HOUR_DAYS)
         
-        # タスクを開始
-        # 日報: 翌朝 7:00
-        self.daily_report_task.change_interval(time=time(hour=7, minute=0, tzinfo=JST))
-        self.daily_report_task.start()
+        # スケジューラにジョブを登録
+        scheduler = self.bot.scheduler
+        # 日報: 翌朝 7:00 (停止中に逃した場合は起動後に送信)
+        scheduler.add_daily("report:daily_report", 7, 0, self.daily_report_task, catch_up=True)
 
         # バックアップ: 設定時刻 (23:59)
-        self.backup_task.change_interval(time=time(hour=Config.DAILY_REPORT_HOUR, minute=Config.DAILY_REPORT_MINUTE, tzinfo=JST))
-        self.backup_task.start()
+        scheduler.add_daily("report:backup", Config.DAILY_REPORT_HOUR, Config.DAILY_REPORT_MINUTE, self.backup_task)
 
         # 警告: バックアップ5分前 (23:54)
-        warn_time = time(hour=Config.DAILY_REPORT_HOUR, minute=max(0, Config.DAILY_REPORT_MINUTE - 5), tzinfo=JST)
-        self.warning_task.change_interval(time=warn_time)
-        self.warning_task.start()
+        scheduler.add_daily("report:warning", Config.DAILY_REPORT_HOUR, max(0, Config.DAILY_REPORT_MINUTE - 5), self.warning_task)
+
+        # ランキングのスナップショット: 毎日 0:05 に、終わった週・月の分が未保存なら保存する
+        scheduler.add_daily("report:ranking_snapshot", 0, 5, self.ranking_snapshot_task, catch_up=True)
 
     def cog_unload(self):
-        self.daily_report_task.cancel()
-        self.backup_task.cancel()
-        self.warning_task.cancel()
+        for name in ("report:daily_report", "report:backup", "report:warning", "report:ranking_snapshot"):
+            self.bot.scheduler.remove(name)
+
+    rank = app_commands.Group(
+        name="rank",
+        description="作業時間ランキングを表示します",
+        default_permissions=discord.Permissions(send_messages=True)
+    )
+
+    @rank.command(name="top", description="作業時間ランキングを表示します")
+    @app_commands.describe(period="集計期間（省略時は今週）", start="期間指定の開始日 (YYYY-MM-DD)", end="期間指定の終了日 (YYYY-MM-DD)")
+    @app_commands.choices(period=[app_commands.Choice(name=label, value=key) for key, label in RANK_PERIODS.items()])
+    async def rank_top(self, interaction: discord.Interaction, period: app_commands.Choice[str] = None,
+                       start: str = None, end: str = None):
+        """期間ごとのランキングを表示"""
+        key = period.value if period else ("custom" if start or end else "week")
+        try:
+            start_date, end_date = resolve_rank_period(key, datetime.now().date(), start, end)
+        except ValueError:
+            await interaction.response.send_message("⚠️ 期間指定は開始日・終了日を YYYY-MM-DD 形式で指定してください。", ephemeral=True)
+            return
 
-    @app_commands.command(name="rank", description="週間ランキングを表示します")
-    @app_commands.default_permissions(send_messages=True)
-    async def rank(self, interaction: discord.Interaction):
-        """週間ランキングを表示"""
         await interaction.response.defer(ephemeral=True)
-        
-        now = datetime.now()
-        monday = now - timedelta(days=now.weekday())
-        monday = monday.replace(hour=0, minute=0, second=0, microsecond=0)
-        monday_str = monday.isoformat()
+        rows = await self.bot.db.get_range_ranking(start_date, end_date, limit=Config.RANK_SIZE)
 
-        rows = await self.bot.db.get_weekly_ranking(monday_str)
+        rank_config = MESSAGES.get("rank", {})
+        if key == "custom":
+            label = f"{start_date.strftime('%Y/%m/%d')}〜{end_date.strftime('%Y/%m/%d')}"
+        else:
+            label = RANK_PERIODS[key]
 
         if not rows:
-            msg = MESSAGES.get("rank", {}).get("empty_message", "データがありません")
+            if key == "week":
+                msg = rank_config.get("empty_message", "データがありません")
+            else:
+                msg = rank_config.get("empty_message_period", "データがありません").format(period=label)
             await interaction.followup.send(msg, ephemeral=True)
             return
 
-        rank_config = MESSAGES.get("rank", {})
-        embed = create_embed_from_config(rank_config)
-        
-        rank_text = ""
-        row_fmt = rank_config.get("row", "{icon} **{name}**: {time}\n")
-        
-        for i, (username, total_seconds) in enumerate(rows, 1):
-            time_str = format_duration(total_seconds, for_voice=True)
-            icon = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"{i}."
-            rank_text += row_fmt.format(icon=icon, name=username, time=time_str)
-        
-        embed.add_field(name="Top Members", value=rank_text, inline=False)
+        embed = build_rank_embed(rows, None if key == "week" else label)
         await interaction.followup.send(embed=embed, ephemeral=True)
 
+    @rank.command(name="history", description="過去の週間・月間ランキングを表示します")
+    @app_commands.describe(kind="ランキングの種類", date="表示する期間に含まれる日付 (YYYY-MM-DD、省略時は直近)")
+    @app_commands.choices(kind=[app_commands.Choice(name=label, value=key) for key, label in SNAPSHOT_PERIODS.items()])
+    async def rank_history(self, interaction: discord.Interaction, kind: app_commands.Choice[str] = None, date: str = None):
+        """保存済みのランキングをページ送りで表示"""
+        period_type = kind.value if kind else "week"
+        start = None
+        if date:
+            try:
+                start = snapshot_period(period_type, datetime.fromisoformat(date).date())[0].isoformat()
+            except ValueError:
+                await interaction.response.send_message("⚠️ 日付は YYYY-MM-DD 形式で指定してください。", ephemeral=True)
+                return
+        else:
+            start = await self.bot.db.get_adjacent_ranking_period(period_type, None, older=True)
+
+        snapshot = await self.bot.db.get_ranking_snapshot(period_type, start) if start else None
+        if not snapshot:
+            await interaction.response.send_message("📭 保存されているランキングはありません。", ephemeral=True)
+            return
+
+        view = RankHistoryView(self.bot.db, period_type, snapshot[0])
+        await view.refresh_buttons()
+        await interaction.response.send_message(embed=build_snapshot_embed(period_type, snapshot), view=view, ephemeral=True)
+
     @app_commands.command(name="stats", description="あなたの累計作業時間を表示します")
     @app_commands.default_permissions(send_messages=True)
     async def stats(self, interaction: discord.Interaction):
@@ -103,6 +262,22 @@ class ReportCog(commands.Cog):
             days=days_since
         )
         embed1.set_thumbnail(url=interaction.user.display_avatar.url)
+
+        # タスク別の作業時間 (上位5件)
+        task_totals = await self.bot.db.get_task_totals(user_id, limit=5)
+        if task_totals:
+            task_lines = [f"・{content[:50]}: {format_duration(seconds, for_voice=False)}" for content, seconds in task_totals]
+            embed1.add_field(name="📝 タスク別の作業時間", value="\n".join(task_lines), inline=False)
+
+        # 全期間でよく作業する時間帯 (生ログ削除後の期間はアーカイブから読む)
+        try:
+            all_time_hours = await merged_hourly_histogram(self.bot.db, self.bot.archive, EPOCH, datetime.now(), user_id)
+            top_hours = sorted((h for h in all_time_hours.items() if h[1] > 0), key=lambda h: h[1], reverse=True)[:3]
+            if top_hours:
+                hour_lines = [f"・{int(hour)}時台: {format_duration(seconds, for_voice=False)}" for hour, seconds in top_hours]
+                embed1.add_field(name="🕒 よく作業する時間帯 (全期間)", value="\n".join(hour_lines), inline=False)
+        except Exception as e:
+            logger.error(f"全期間の時間帯集計エラー ({user_id}): {e}")
         
         # 送信するEmbedリストとファイルリスト
         embeds_to_send = [embed1]
@@ -139,6 +314,23 @@ class ReportCog(commands.Cog):
                         
                 except Exception as e:
                     logger.error(f"時間帯グラフ生成エラー ({user_id}): {e}")
+
+            # C. 年間ヒートマップと曜日×時間帯マトリクス (集計済みデータから作成し、描画はスレッドで実行)
+            today = datetime.now().date()
+            heatmaps = await asyncio.gather(
+                self.activity.year_heatmap(user_id, interaction.user.display_name, today),
+                self.activity.weekday_hour(user_id, interaction.user.display_name, today),
+                return_exceptions=True
+            )
+            for png, filename in zip(heatmaps, ("year_heatmap.png", "weekday_hour.png")):
+                if isinstance(png, Exception):
+                    logger.error(f"ヒートマップ生成エラー ({user_id}, {filename}): {png}")
+                    continue
+                if png:
+                    files_to_send.append(discord.File(io.BytesIO(png), filename=filename))
+                    embed = discord.Embed(color=embed1.color)
+                    embed.set_image(url=f"attachment://{filename}")
+                    embeds_to_send.append(embed)
         except Exception as e:
             logger.error(f"グラフ生成処理エラー ({user_id}): {e}")
         
@@ -150,8 +342,10 @@ class ReportCog(commands.Cog):
             # 生成したグラフファイルをクリーンアップ
             for file in files_to_send:
                 try:
-                    if os.path.exists(file.fp.name):
-                        os.remove(file.fp.name)
+                    # メモリ上の画像 (ヒートマップ) はファイルを持たない
+                    path = getattr(file.fp, "name", None)
+                    if isinstance(path, str) and os.path.exists(path):
+                        os.remove(path)
                 except:
                     pass
 
@@ -193,86 +387,115 @@ class ReportCog(commands.Cog):
         await self.perform_backup(datetime.now())
         await interaction.followup.send("バックアップとクリーンアップが完了しました。")
 
-    @tasks.loop(time=time(hour=7, minute=0, tzinfo=JST))
     async def daily_report_task(self):
         """毎朝7時に前日の日報を送信"""
         yesterday = datetime.now() - timedelta(days=1)
         await self.send_daily_report(yesterday)
 
-    @tasks.loop(time=time(hour=23, minute=54, tzinfo=JST))
     async def warning_task(self):
         """23:54にVC参加ユーザーへ通知"""
-        for guild in self.bot.guilds:
-            for vc in guild.voice_channels:
-                for member in vc.members:
-                    if not member.bot:
-                        try:
-                            embed = discord.Embed(
-                                title="🕒 日次集計のお知らせ",
-                                description="まもなく (23:59) 本日の作業時間の集計が行われます。\n通話はそのまま継続してご利用いただけます。",
-                                color=Colors.YELLOW
-                            )
-                            await member.send(embed=embed)
-                        except Exception as e:
-                            logger.error(f"DM送信失敗 ({member.display_name}): {e}")
-
-    @tasks.loop(time=time(hour=23, minute=59, tzinfo=JST))
+        members = [
+            member
+            for guild in self.bot.guilds
+            for vc in guild.voice_channels
+            for member in vc.members
+            if not member.bot
+        ]
+        if not members:
+            return
+
+        embed = discord.Embed(
+            title="🕒 日次集計のお知らせ",
+            description="まもなく (23:59) 本日の作業時間の集計が行われます。\n通話はそのまま継続してご利用いただけます。",
+            color=Colors.YELLOW
+        )
+        result = await fan_out(members, concurrency=Config.DM_CONCURRENCY, retries=Config.DM_RETRIES, embed=embed)
+        logger.info(f"日次集計のお知らせ: {result.summary()}")
+        for user_id, error in result.failed.items():
+            logger.error(f"DM送信失敗 (User ID: {user_id}): {error}")
+
     async def backup_task(self):
         """毎日バックアップを実行し、ログをクリーンアップ (ソフトメンテナンス)"""
         logger.info("日次メンテナンス: 日次集計処理を開始...")
         
         study_cog = self.bot.get_cog("StudyCog")
         log_channel = self.bot.get_channel(Config.LOG_CHANNEL_ID)
-        now = datetime.now()
-        processed_count = 0
 
         if study_cog:
+            # 全員を同じ時刻で分割する (途中に await を挟まないので分割時刻がずれない)
+            now = datetime.now()
+            splits = []  # (member, join_time, total_seconds, 分割前のオフセット)
             for guild in self.bot.guilds:
                 for vc in guild.voice_channels:
                     for member in vc.members:
-                        if member.bot:
-                            continue
-                        
                         # 記録中のユーザーのみ処理
-                        if member.id in study_cog.voice_state_log:
-                            try:
-                                join_time = study_cog.voice_state_log[member.id]
-                                duration = now - join_time
-                                total_seconds = int(duration.total_seconds())
-                                
-                                # セッション保存
-                                await self.bot.db.add_study_log(
-                                    member.id,
-                                    member.display_name,
-                                    join_time,
-                                    total_seconds,
-                                    now
-                                )
-                                
-                                # 称号チェック
-                                await study_cog.check_and_award_milestones(member, total_seconds, log_channel)
-
-                                # 論理分割: 保存した分をオフセットに追加し、開始時間を現在に更新
-                                # これにより表示上の「継続時間」は途切れない
-                                current_offset = study_cog.voice_state_offset.get(member.id, 0)
-                                study_cog.voice_state_offset[member.id] = current_offset + total_seconds
-                                study_cog.voice_state_log[member.id] = now
-                                
-                                processed_count += 1
-                                
-                            except Exception as e:
-                                logger.error(f"日次集計エラー ({member.display_name}): {e}")
-            
-            if processed_count > 0:
-                logger.info(f"{processed_count}名のセッションを分割しました。")
+                        if member.bot or member.id not in study_cog.voice_state_log:
+                            continue
+                        join_time = study_cog.voice_state_log[member.id]
+                        total_seconds = int((now - join_time).total_seconds())
+                        current_offset = study_cog.voice_state_offset.get(member.id, 0)
+
+                        # 論理分割: 保存した分をオフセットに追加し、開始時間を現在に更新
+                        # これにより表示上の「継続時間」は途切れない
+                        study_cog.voice_state_offset[member.id] = current_offset + total_seconds
+                        study_cog.voice_state_log[member.id] = now
+                        splits.append((member, join_time, total_seconds, current_offset))
+
+            # セッション保存 (1トランザクション)
+            saved = await self.bot.db.add_study_logs([
+                (member.id, member.display_name, join_time, total_seconds, now)
+                for member, join_time, total_seconds, _ in splits
+            ])
+            if saved < len(splits):
+                logger.error("日次集計エラー (セッション保存): 分割したセッションを保存できませんでした")
+                # 保存できなかった分は分割を取り消し、退出時にまとめて保存させる
+                for member, join_time, _, current_offset in splits:
+                    if study_cog.voice_state_log.get(member.id) == now:
+                        study_cog.voice_state_log[member.id] = join_time
+                        study_cog.voice_state_offset[member.id] = current_offset
+                splits = []
+
+            # 称号チェック (同時実行数を制限して並列に処理)
+            semaphore = asyncio.Semaphore(Config.MILESTONE_CONCURRENCY)
+
+            async def check(member, total_seconds):
+                async with semaphore:
+                    try:
+                        await study_cog.check_and_award_milestones(member, total_seconds, log_channel)
+                    except Exception as e:
+                        logger.error(f"称号チェックエラー ({member.display_name}): {e}")
+
+            await asyncio.gather(*(check(member, total_seconds) for member, _, total_seconds, _ in splits))
+
+            if splits:
+                logger.info(f"{len(splits)}名のセッションを分割しました。")
         else:
             logger.error("StudyCogが見つかりません。セッション分割をスキップします。")
 
         await self.perform_backup(datetime.now())
 
+    async def ranking_snapshot_task(self):
+        """終わった週・月のランキングを保存する（保存済みなら何もしない）"""
+        today = datetime.now().date()
+        for period_type in SNAPSHOT_PERIODS:
+            # 直近に終わった期間 (今の期間の開始日の前日を含む期間) を対象にする
+            # 停止中に期間の境目をまたいでも、再開後の実行で取りこぼさない
+            current_start, _ = snapshot_period(period_type, today)
+            start_date, end_date = snapshot_period(period_type, current_start - timedelta(days=1))
+            if await self.bot.db.has_ranking_snapshot(period_type, start_date):
+                continue
+
+            # 23:59 の日次集計の後に保存されたログも含めるため、最終日の日別集計を作り直してから集計する
+            await self.bot.db.materialize_daily_summaries(end_date, end_date)
+            rows = await self.bot.db.get_range_ranking(start_date, end_date, limit=Config.RANK_SNAPSHOT_SIZE)
+            await self.bot.db.save_ranking_snapshot(period_type, start_date, end_date, rows)
+            logger.info(f"ランキングを保存しました ({period_type}: {start_date}〜{end_date}, {len(rows)}名)")
+
     async def send_daily_report(self, target_date: datetime):
-        """日報Embedを作成して送信"""
+        """日報Embedを作成して送信（人数が多い場合は複数Embed、さらに多い場合はCSVを添付）"""
         channel = self.bot.get_channel(Config.SUMMARY_CHANNEL_ID)
+        if not channel:
+            return
         
         start_of_day = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
         start_str = start_of_day.isoformat()
@@ -280,53 +503,96 @@ class ReportCog(commands.Cog):
         end_of_day = start_of_day + timedelta(days=1)
         end_str = end_of_day.isoformat()
 
-        rows = await self.bot.db.get_study_logs_in_range(start_str, end_str)
         today_disp_str = target_date.strftime('%Y/%m/%d')
+        report_config = MESSAGES.get("report", {})
+        row_fmt = report_config.get("row", "• **{name}**: {time}\n")
+
+        paginator = EmbedPaginator(
+            create_embed_from_config(report_config, date=today_disp_str),
+            max_pages=Config.REPORT_MAX_PAGES
+        )
+        csv_buffer = io.StringIO()
+        writer = csv.writer(csv_buffer)
+        writer.writerow(["rank", "user_id", "username", "total_seconds", "time"])
+        count = 0
+
+        # DBカーソルから1行ずつ取り出して詰める (全件をリストや1つの文字列にしない)
+        async for user_id, username, total_seconds in self.bot.db.iter_study_logs_in_range(start_str, end_str):
+            count += 1
+            time_str = format_duration(total_seconds, for_voice=True)
+            paginator.add_line(row_fmt.format(name=username, time=time_str))
+            writer.writerow([count, user_id, username, total_seconds, time_str])
 
-        if channel:
-            if not rows:
-                msg = MESSAGES.get("report", {}).get("empty_message", "本日の作業はありませんでした。")
-                await channel.send(f"**[{today_disp_str}]** {msg}")
+        if count == 0:
+            msg = report_config.get("empty_message", "本日の作業はありませんでした。")
+            await channel.send(f"**[{today_disp_str}]** {msg}")
+            return
+
+        pages = paginator.finish()
+        file = None
+        if paginator.overflowed:
+            pages[-1].set_footer(text=f"全{count}名の結果は添付のCSVをご覧ください")
+            csv_bytes = csv_buffer.getvalue().encode("utf-8-sig")
+            file = discord.File(io.BytesIO(csv_bytes), filename=f"report_{start_of_day.strftime('%Y-%m-%d')}.csv")
+
+        for i, page in enumerate(pages):
+            if file and i == len(pages) - 1:
+                await channel.send(embed=page, file=file)
             else:
-                report_config = MESSAGES.get("report", {})
-                embed = create_embed_from_config(
-                    report_config,
-                    date=today_disp_str
-                )
-                
-                report_text = ""
-                row_fmt = report_config.get("row", "• **{name}**: {time}\n")
-                
-                for _, username, total_seconds in rows:
-                    time_str = format_duration(total_seconds, for_voice=True)
-                    report_text += row_fmt.format(name=username, time=time_str)
-                
-                embed.add_field(name="Results", value=report_text, inline=False)
-                await channel.send(embed=embed)
+                await channel.send(embed=page)
 
     async def perform_backup(self, now: datetime):
         """バックアップとメンテナンス実行"""
         today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        today_str = today_start.isoformat()
         today_date_str = now.strftime('%Y-%m-%d')
         today_disp_str = now.strftime('%Y/%m/%d')
 
-        # 集計
-        rows = await self.bot.db.get_study_logs_in_range(today_str)
-        
-        if rows:
-            for user_id, username, total_seconds in rows:
-                await self.bot.db.save_daily_summary(user_id, username, today_date_str, total_seconds)
-        
-        # 削除閾値
-        cleanup_summary_threshold = now - timedelta(days=365)
-        cleanup_summary_threshold_str = cleanup_summary_threshold.strftime('%Y-%m-%d')
+        # 集計 (前回以降の日をまとめて1回の INSERT ... SELECT で作り直す)
+        # 前日も含めることで、前回の集計後 (23:59〜24:00) に保存されたログも反映する
+        summary_from = today_start.date() - timedelta(days=1)
+        daily_through = await self.bot.db.get_rollup_state("daily_through")
+        if daily_through:
+            summary_from = min(summary_from, date.fromisoformat(daily_through) + timedelta(days=1))
+        summary_from = max(summary_from, today_start.date() - timedelta(days=Config.KEEP_LOG_DAYS))
+        summary_rows = await self.bot.db.materialize_daily_summaries(summary_from, today_start.date())
+        await self.bot.db.set_rollup_state("daily_through", today_date_str)
+        logger.info(f"日別集計完了 - {summary_from} 〜 {today_date_str}: {summary_rows}行")
+
+        # 段階的集計 (生ログ → 時間別、日別 → 月別)。生ログを削除する前に実行する
+        rollup_result = await self.bot.db.compact_rollups(now.date())
+        logger.info(f"段階的集計完了 - 時間別: {rollup_result['hourly_rows']}行, 月別: {rollup_result['monthly_rows']}行")
+
+        # 同時作業の日別集計 (前回の続きから今日まで。今日の分は次回にもう一度作り直す)
+        try:
+            concurrency_from = now.date() - timedelta(days=Config.KEEP_LOG_DAYS)
+            concurrency_through = await self.bot.db.get_rollup_state("concurrency_through")
+            if concurrency_through:
+                concurrency_from = max(concurrency_from, date.fromisoformat(concurrency_through))
+            concurrency_days = await update_daily_concurrency(self.bot.db, concurrency_from, now.date())
+            await self.bot.db.set_rollup_state("concurrency_through", today_date_str)
+            logger.info(f"同時作業の集計完了 - {concurrency_days}日分")
+        except Exception as e:
+            logger.error(f"同時作業の集計エラー: {e}")
+
+        # 削除閾値 (日別・月別集計は無期限に保持)
+        cleanup_hourly_threshold = now - timedelta(days=Config.KEEP_HOURLY_DAYS)
+        cleanup_hourly_threshold_str = cleanup_hourly_threshold.strftime('%Y-%m-%dT00')
         
         cleanup_threshold = now - timedelta(days=Config.KEEP_LOG_DAYS)
         cleanup_threshold_str = cleanup_threshold.isoformat()
 
+        # 削除前にアーカイブへ移す (失敗した場合は生ログを削除しない)
+        if self.bot.archive:
+            try:
+                archive_rows = await self.bot.db.get_logs_before(cleanup_threshold_str)
+                archived = await asyncio.to_thread(self.bot.archive.append, archive_rows, cleanup_threshold_str)
+                logger.info(f"ログアーカイブ完了 - {archived}件")
+            except Exception as e:
+                logger.error(f"ログアーカイブエラー: {e}")
+                cleanup_threshold_str = ""
+
         # クリーンアップ実行
-        logs_deleted, summary_deleted = await self.bot.db.cleanup_old_data(cleanup_threshold_str, cleanup_summary_threshold_str)
+        logs_deleted, summary_deleted = await self.bot.db.cleanup_old_data(cleanup_threshold_str, cleanup_hourly_threshold_str)
 
         # データベースサイズ
         db_path = self.bot.db.db_path
@@ -353,7 +619,11 @@ class ReportCog(commands.Cog):
         db_path = self.bot.db.db_path
 
         if backup_channel and os.path.exists(db_path):
+            artifact = None
             try:
+                # 稼働中のDBファイルを直接送らず、一貫性のあるスナップショットを圧縮して送る
+                artifact = await asyncio.to_thread(self.backup_manager.build, today_date_str)
+
                 embed = discord.Embed(
                     title="🔒 データベース自動バックアップ",
                     description=f"{today_disp_str} の日次バックアップとクリーンアップを実行しました",
@@ -361,18 +631,27 @@ class ReportCog(commands.Cog):
                 )
                 
                 cleanup_info = f"""**スタディログ削除:** {logs_deleted}件
-**Daily Summary削除:** {summary_deleted}件
+**時間別集計削除:** {summary_deleted}件
 **DB容量:** {db_size_mb:.2f} MB"""
                 
                 embed.add_field(name="📊 クリーンアップ情報", value=cleanup_info, inline=False)
+
+                kind_disp = "フル" if artifact.kind == "full" else f"差分 #{artifact.seq}"
+                backup_info = f"""**種類:** {kind_disp}
+**ページ:** {artifact.pages_written} / {artifact.pages_total}
+**圧縮後:** {artifact.size_bytes / (1024 * 1024):.2f} MB"""
+                embed.add_field(name="💾 バックアップ情報", value=backup_info, inline=False)
                 embed.set_footer(text="自動実行")
                 
-                backup_filename = f"backup_{today_date_str}.db"
-                file = discord.File(db_path, filename=backup_filename)
+                file = discord.File(artifact.path, filename=artifact.filename)
                 await backup_channel.send(embed=embed, file=file)
-                logger.info("バックアップ送信完了")
+                self.backup_manager.commit(artifact)
+                logger.info(f"バックアップ送信完了 ({artifact.filename}, {artifact.size_bytes} bytes)")
             except Exception as e:
                 logger.error(f"バックアップ送信エラー: {e}")
+            finally:
+                if artifact:
+                    artifact.cleanup()
 
     async def cleanup_vc_chats(self):
         """全てのVCチャットをクリーンアップ（人がいる場合は待機）"""
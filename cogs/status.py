@@ -3,8 +3,9 @@ import logging
 from datetime import datetime, timedelta
 
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 
+from concurrency import analyze_day
 from config import Config
 from messages import Colors, MESSAGES
 from utils import create_embed_from_config, format_duration
@@ -18,6 +19,8 @@ class StatusCog(commands.Cog):
         self._ranking_message_id = None
         self._daily_message_id = None
         rank_cfg = MESSAGES.get("rank", {})
+        # 今日の同時作業人数の集計結果 (キー, 集計時刻, 結果, 日の始まり)
+        self._concurrency_cache = None
         self._ranking_embed_title = rank_cfg.get("embed_title", "🏆 今週の作業時間ランキング")
         
         # Debounce制御用
@@ -25,33 +28,23 @@ class StatusCog(commands.Cog):
         # create_task を使う（Bot.loop に依存しない）
         self._update_manager_task = asyncio.create_task(self._status_update_manager())
         
-        self.update_status_loop.start()
-        self.ranking_task.start()
+        self.bot.scheduler.add_interval("status:board", 5 * 60, self.update_status_loop, run_immediately=True)
+        self.bot.scheduler.add_interval("status:ranking", 5 * 60, self.ranking_task, run_immediately=True)
 
     def cog_unload(self):
-        self.update_status_loop.cancel()
-        self.ranking_task.cancel()
+        self.bot.scheduler.remove("status:board")
+        self.bot.scheduler.remove("status:ranking")
         if self._update_manager_task:
             self._update_manager_task.cancel()
 
-    @tasks.loop(minutes=5)
     async def update_status_loop(self):
         await self.update_status_board()
 
-    @update_status_loop.before_loop
-    async def before_update_status_loop(self):
-        await self.bot.wait_until_ready()
-
-    @tasks.loop(minutes=5)
     async def ranking_task(self):
         # Update both weekly ranking and today's server total every 5 minutes
         await self.update_weekly_ranking()
         await self.update_daily_server_total()
 
-    @ranking_task.before_loop
-    async def before_ranking_task(self):
-        await self.bot.wait_until_ready()
-
     async def update_weekly_ranking(self):
         """週次ランキングを投稿または更新する。VCの有無に関わらず実行される。"""
         channel = await self._acquire_status_channel("ランキング更新")
@@ -347,8 +340,35 @@ class StatusCog(commands.Cog):
             rank_lines.append(row_fmt.format(icon=icon, name=username, time=time_str))
 
         embed.add_field(name="Top Members", value="".join(rank_lines), inline=False)
+
+        # 今日の最大同時作業人数 (保存済みのログと作業中のセッションから求める)
+        try:
+            active = dict(study_cog.voice_state_log) if study_cog else {}
+            result, day_start = await self._today_concurrency(active, now)
+            if result.peak_users >= 2:
+                embed.add_field(
+                    name="👥 同時作業",
+                    value=f"今日の最大: {result.peak_users}人 ({result.peak_time(day_start)}〜)",
+                    inline=False
+                )
+        except Exception:
+            logger.exception("同時作業人数の集計に失敗しました")
         return embed
 
+    async def _today_concurrency(self, active: dict, now: datetime):
+        """今日の同時作業の集計 (作業中のメンバーが変わらない間は前回の結果を使う)
+
+        ログが増えるのは主に退出時で、そのときは作業中のメンバーも変わる。
+        メンバーが変わらなければ最大人数も変わらないため、入退室か一定時間の経過でだけ走査し直す。
+        """
+        key = (now.date(), frozenset(active.items()))
+        cached = self._concurrency_cache
+        if cached and cached[0] == key and now - cached[1] < timedelta(seconds=Config.CONCURRENCY_CACHE_SECONDS):
+            return cached[2], cached[3]
+        result, day_start = await analyze_day(self.bot.db, now.date(), active, now)
+        self._concurrency_cache = (key, now, result, day_start)
+        return result, day_start
+
     async def _build_server_total_embed(self) -> discord.Embed:
         """本日のサーバー合計作業時間だけを返すEmbedを生成する"""
         cfg = MESSAGES.get("rank", {})
@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 from utils import format_duration, speak_in_vc, delete_previous_message, create_embed_from_config
 from messages import MESSAGES, Colors
 from config import Config
+from milestones import MilestoneEngine
 import logging
 
 logger = logging.getLogger(__name__)
@@ -66,6 +67,10 @@ class StudyCog(commands.Cog):
         self.voice_state_offset = {} # Bot再起動前や日次集計前の時間を保持するオフセット
         self.break_state_log = {} # 休憩中のユーザーと開始時刻を記録: {user_id: break_start_time}
         self.break_duration_accumulated = {} # 蓄積された休憩時間: {user_id: total_break_seconds}
+        self.milestones = MilestoneEngine(bot.db) # 累計時間と次の称号をメモリ上で管理
+
+    async def cog_load(self):
+        await self.milestones.load()
 
     @app_commands.command(name="task", description="現在取り組んでいるタスクを設定します")
     @app_commands.describe(content="タスクの内容")
@@ -86,6 +91,26 @@ class StudyCog(commands.Cog):
                 # ランキング更新は副次的処理なので失敗してもログを残して続行
                 logger.exception("退出時のランキング即時更新に失敗しました")
 
+    @app_commands.command(name="task_search", description="これまでに設定したタスクをキーワードで検索します")
+    @app_commands.describe(keyword="検索するキーワード")
+    @app_commands.default_permissions(send_messages=True)
+    async def task_search(self, interaction: discord.Interaction, keyword: str):
+        """タスク履歴の検索コマンド"""
+        rows = await self.bot.db.search_tasks(interaction.user.id, keyword)
+        if not rows:
+            await interaction.response.send_message(f"「{keyword}」を含むタスクは見つかりませんでした。", ephemeral=True)
+            return
+
+        embed = discord.Embed(title=f"🔍 タスク検索: {keyword}", color=Colors.BLUE)
+        for _, content, created_at, total_seconds, sessions in rows:
+            set_at = datetime.fromisoformat(created_at).strftime('%Y/%m/%d') if created_at else "---"
+            embed.add_field(
+                name=content[:256],
+                value=f"{format_duration(total_seconds or 0, for_voice=False)} / {sessions}セッション（設定日: {set_at}）",
+                inline=False
+            )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
     @app_commands.command(name="reading", description="読み上げ用の名前(読み仮名)を設定します")
     @app_commands.describe(name="読み上げに使用する名前")
     @app_commands.default_permissions(send_messages=True)
@@ -511,41 +536,43 @@ class StudyCog(commands.Cog):
                 await status_cog.update_daily_server_total()
             except Exception:
                 logger.exception("退出時の本日のサーバー合計即時更新に失敗しました")
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role):
+        self.milestones.invalidate_roles(role.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before, after):
+        self.milestones.invalidate_roles(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.milestones.invalidate_roles(role.guild.id)
+
     async def check_and_award_milestones(self, member, total_seconds_session, text_channel):
-        """累計時間に基づいて称号ロールを付与する"""
+        """累計時間に基づいて称号ロールを付与する（保存済みのセッション分を渡す）"""
         if total_seconds_session <= 0:
             return
 
-        # 最新の累計時間を取得
-        current_total_sec = await self.bot.db.get_total_seconds(member.id)
-        current_hours = current_total_sec // 3600
-        
-        # 今回の作業前の時間
-        prev_total_sec = current_total_sec - total_seconds_session
-        prev_hours = prev_total_sec // 3600
-
-        # 時間の境界をまたいだかチェック
-        if prev_hours < current_hours:
-            for hours, role_name in sorted(Config.MILESTONES.items()):
-                # 今回の作業で境界を超えた場合
-                if prev_hours < hours <= current_hours:
-                    # ロールを取得して付与
-                    role = discord.utils.get(member.guild.roles, name=role_name)
-                    if role:
-                        try:
-                            await member.add_roles(role)
-                            # お祝いメッセージ
-                            if text_channel:
-                                embed = discord.Embed(
-                                    title="🎉 称号獲得！",
-                                    description=f"{member.mention}さんが **{role_name}** の称号を獲得しました！\nおめでとうございます！👏👏",
-                                    color=Colors.GOLD
-                                )
-                                await text_channel.send(embed=embed)
-                        except discord.Forbidden:
-                            logger.error(f"権限エラー: ロール {role_name} を付与できませんでした。Botのロール順位を確認してください。")
-                    else:
-                        logger.error(f"設定エラー: ロール「{role_name}」がサーバーに見つかりません。")
+        # 今回の作業で境界を超えた称号のみ (超えていなければDBにもDiscordにもアクセスしない)
+        for role_name in await self.milestones.record(member.id, total_seconds_session):
+            # ロールを取得して付与
+            role = self.milestones.resolve_role(member.guild, role_name)
+            if role:
+                try:
+                    await member.add_roles(role)
+                    # お祝いメッセージ
+                    if text_channel:
+                        embed = discord.Embed(
+                            title="🎉 称号獲得！",
+                            description=f"{member.mention}さんが **{role_name}** の称号を獲得しました！\nおめでとうございます！👏👏",
+                            color=Colors.GOLD
+                        )
+                        await text_channel.send(embed=embed)
+                except discord.Forbidden:
+                    logger.error(f"権限エラー: ロール {role_name} を付与できませんでした。Botのロール順位を確認してください。")
+            else:
+                logger.error(f"設定エラー: ロール「{role_name}」がサーバーに見つかりません。")
 
 async def setup(bot):
     await bot.add_cog(StudyCog(bot))
@@ -1,21 +1,67 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
 from datetime import datetime, timedelta
-from utils import safe_message_delete
+import asyncio
+import heapq
+from utils import UserResolver, send_with_retry
 from messages import MESSAGES
 from config import Config
 import logging
 
 logger = logging.getLogger(__name__)
 
+JOB_NAME = "timer:personal"
+
+
 class TimerCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.check_timers_task.start()
+        self.user_resolver = UserResolver(bot)
+        # 未発火タイマーの最小ヒープ: (end_time, rowid, user_id, minutes)
+        # スケジューラには先頭 (最も早い期限) の1件だけを一回限りのジョブとして登録する
+        self._timer_heap = []
+        self._load_task = asyncio.create_task(self._load_pending_timers())
 
     def cog_unload(self):
-        self.check_timers_task.cancel()
+        if self._load_task:
+            self._load_task.cancel()
+        self.bot.scheduler.remove(JOB_NAME)
+
+    def _push_timer(self, end_time: datetime, rowid: int, user_id: int, minutes: int):
+        """ヒープにタイマーを追加し、先頭が変わった場合は次回の発火時刻を登録し直す"""
+        heapq.heappush(self._timer_heap, (end_time, rowid, user_id, minutes))
+        if self._timer_heap[0][1] == rowid:
+            self._schedule_next()
+
+    def _schedule_next(self):
+        if self._timer_heap:
+            self.bot.scheduler.add_oneshot(JOB_NAME, self._timer_heap[0][0], self._on_deadline)
+        else:
+            # タイマーが無い間はジョブ自体を登録しない（DBアクセスなし）
+            self.bot.scheduler.remove(JOB_NAME)
+
+    async def _load_pending_timers(self):
+        """起動時にDBから未発火のタイマーを読み込む"""
+        rows = await self.bot.db.get_pending_timers()
+        for rowid, user_id, end_time_str, minutes in rows or []:
+            try:
+                end_time = datetime.fromisoformat(end_time_str)
+            except (TypeError, ValueError):
+                logger.error(f"タイマー終了時刻が不正です (rowid: {rowid}): {end_time_str}")
+                continue
+            heapq.heappush(self._timer_heap, (end_time, rowid, user_id, minutes))
+        if self._timer_heap:
+            logger.info(f"未発火のタイマー {len(self._timer_heap)} 件を読み込みました。")
+        self._schedule_next()
+
+    async def _on_deadline(self):
+        """先頭のタイマーの期限が来たときにスケジューラから呼ばれる"""
+        now = datetime.now()
+        while self._timer_heap and self._timer_heap[0][0] <= now:
+            heapq.heappop(self._timer_heap)
+        self._schedule_next()
+        await self.fire_expired_timers(now)
 
     async def set_personal_timer(self, interaction: discord.Interaction, minutes: int):
         """個人タイマーを設定"""
@@ -35,7 +81,9 @@ class TimerCog(commands.Cog):
         end_time_str = end_time.isoformat()
         end_time_disp = end_time.strftime('%H:%M')
 
-        await self.bot.db.add_personal_timer(interaction.user.id, end_time_str, minutes)
+        rowid = await self.bot.db.add_personal_timer(interaction.user.id, end_time_str, minutes)
+        if rowid is not None:
+            self._push_timer(end_time, rowid, interaction.user.id, minutes)
 
         msg = timer_msgs.get("set", "⏰ {minutes}分後に通知します。").format(minutes=minutes, end_time=end_time_disp)
         
@@ -50,32 +98,27 @@ class TimerCog(commands.Cog):
         """タイマーコマンド"""
         await self.set_personal_timer(interaction, minutes)
 
-    @tasks.loop(seconds=Config.TIMER_CHECK_INTERVAL)
-    async def check_timers_task(self):
-        """期限切れのタイマーを確認して通知"""
-        now_str = datetime.now().isoformat()
-        
-        expired_timers = await self.bot.db.get_and_delete_expired_timers(now_str)
+    async def fire_expired_timers(self, now: datetime):
+        """期限切れのタイマーをDBから一括取得・削除して、並列にDMで通知"""
+        expired_timers = await self.bot.db.get_and_delete_expired_timers(now.isoformat())
         
         if not expired_timers:
             return
         
         timer_msgs = MESSAGES.get("timer", {})
-        
-        for rowid, user_id, minutes in expired_timers:
-            try:
-                user = self.bot.get_user(user_id)
-                if not user:
-                    try:
-                        user = await self.bot.fetch_user(user_id)
-                    except discord.NotFound:
-                        user = None
-                
-                if user:
-                    msg = timer_msgs.get("finish", "⏰ {minutes}分が経過しました！").format(minutes=minutes)
-                    await user.send(msg)
-            except Exception as e:
-                logger.error(f"タイマー通知エラー (User ID: {user_id}): {e}")
+        finish_fmt = timer_msgs.get("finish", "⏰ {minutes}分が経過しました！")
+        semaphore = asyncio.Semaphore(Config.DM_CONCURRENCY)
+
+        async def notify(user_id, minutes):
+            async with semaphore:
+                try:
+                    user = await self.user_resolver.resolve(user_id)
+                    if user:
+                        await send_with_retry(user, retries=Config.DM_RETRIES, content=finish_fmt.format(minutes=minutes))
+                except Exception as e:
+                    logger.error(f"タイマー通知エラー (User ID: {user_id}): {e}")
+
+        await asyncio.gather(*(notify(user_id, minutes) for _, user_id, minutes in expired_timers))
 
 async def setup(bot):
     await bot.add_cog(TimerCog(bot))
@@ -0,0 +1,125 @@
+"""同時作業の分析 (最大同時作業人数・一緒に作業した時間)
+
+study_logs の各セッションを [終了時刻 - 作業秒数, 終了時刻] の区間とみなし、
+開始・終了イベントを時刻順に並べて1回走査する (O(n log n))。
+2人の重なり時間は、片方が入室した時点で在室中の相手ごとにペアを開き、どちらかが退出した時点で閉じて加算する。
+区間同士を総当たりで比較しないため、コストはイベント数と実際に重なったペアの数だけで決まる。
+"""
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class ConcurrencyResult:
+    """1日分の走査結果 (時刻は日の始まりからの秒数)"""
+
+    def __init__(self):
+        self.timeline: List[Tuple[int, int]] = []  # (時刻, その時点からの同時作業人数)
+        self.peak_users = 0
+        self.peak_at: Optional[int] = None
+        self.co_study_seconds = 0  # 2人以上が同時に作業していた時間
+        self.pair_seconds: Dict[Tuple[int, int], int] = {}  # {(user_a, user_b): 重なり秒数} (user_a < user_b)
+
+    def peak_time(self, day_start: datetime) -> Optional[str]:
+        if self.peak_at is None:
+            return None
+        return (day_start + timedelta(seconds=self.peak_at)).strftime("%H:%M")
+
+
+def session_intervals(rows: Iterable[Tuple[int, int, str]], day_start: datetime,
+                      day_end: datetime) -> List[Tuple[int, int, int]]:
+    """(user_id, duration_seconds, created_at) のログを、指定日内に切り詰めた (user_id, 開始秒, 終了秒) にする"""
+    intervals = []
+    for user_id, duration_seconds, created_at in rows:
+        try:
+            end_time = datetime.fromisoformat(created_at)
+        except (TypeError, ValueError):
+            continue
+        start = max(end_time - timedelta(seconds=max(duration_seconds or 0, 0)), day_start)
+        end = min(end_time, day_end)
+        if start < end:
+            intervals.append((user_id, int((start - day_start).total_seconds()), int((end - day_start).total_seconds())))
+    return intervals
+
+
+def sweep(intervals: Iterable[Tuple[int, int, int]]) -> ConcurrencyResult:
+    """(user_id, 開始, 終了) の区間を走査して同時作業人数とペアごとの重なり時間を求める
+
+    同じ人の区間が重なっている・接している場合 (日次分割の前後など) は1人として数える。
+    同時刻では退出を先に処理するため、入れ替わりで人数が一時的に増えることはない。
+    """
+    events = []
+    for user_id, start, end in intervals:
+        if start < end:
+            events.append((start, 1, user_id))
+            events.append((end, 0, user_id))
+    events.sort()
+
+    result = ConcurrencyResult()
+    active: Dict[int, int] = {}  # {user_id: 重なっている区間の数}
+    opened: Dict[Tuple[int, int], int] = {}  # {ペア: 重なり始めた時刻}
+    previous = None
+    for t, is_start, user_id in events:
+        if previous is not None and len(active) >= 2:
+            result.co_study_seconds += t - previous
+        previous = t
+
+        if is_start:
+            if user_id in active:
+                active[user_id] += 1
+                continue
+            for other in active:
+                opened[(min(user_id, other), max(user_id, other))] = t
+            active[user_id] = 1
+        else:
+            active[user_id] -= 1
+            if active[user_id]:
+                continue
+            del active[user_id]
+            for other in active:
+                pair = (min(user_id, other), max(user_id, other))
+                result.pair_seconds[pair] = result.pair_seconds.get(pair, 0) + t - opened.pop(pair)
+
+        count = len(active)
+        if result.timeline and result.timeline[-1][0] == t:
+            result.timeline[-1] = (t, count)
+        else:
+            result.timeline.append((t, count))
+        if count > result.peak_users:
+            result.peak_users, result.peak_at = count, t
+
+    # 重なり0秒のペア (同時刻に入れ替わった場合など) は残さない
+    result.pair_seconds = {pair: seconds for pair, seconds in result.pair_seconds.items() if seconds > 0}
+    return result
+
+
+async def analyze_day(db, day: date, active: Optional[Dict[int, datetime]] = None,
+                      now: Optional[datetime] = None) -> Tuple[ConcurrencyResult, datetime]:
+    """指定日のログ (と、あれば作業中のセッション {user_id: 開始時刻}) を走査する"""
+    day_start = datetime.combine(day, datetime.min.time())
+    day_end = day_start + timedelta(days=1)
+    # 日付をまたぐセッションを拾うため、翌日に終了したログも対象にする
+    rows = await db.get_log_intervals(day_start.isoformat(), (day_end + timedelta(days=1)).isoformat())
+    intervals = session_intervals(rows, day_start, day_end)
+    if active and now:
+        for user_id, join_time in active.items():
+            start, end = max(join_time, day_start), min(now, day_end)
+            if start < end:
+                intervals.append((user_id, int((start - day_start).total_seconds()), int((end - day_start).total_seconds())))
+    result = await asyncio.to_thread(sweep, intervals)
+    return result, day_start
+
+
+async def update_daily_concurrency(db, from_day: date, to_day: date) -> int:
+    """from_day 〜 to_day の日別集計 (最大同時作業人数・ペアの重なり時間) を作り直す (戻り値: 処理した日数)"""
+    days = 0
+    day = from_day
+    while day <= to_day:
+        result, day_start = await analyze_day(db, day)
+        await db.save_concurrency_day(
+            day.isoformat(), result.peak_users, result.peak_time(day_start),
+            result.co_study_seconds, result.pair_seconds
+        )
+        days += 1
+        day += timedelta(days=1)
+    return days
@@ -28,12 +28,45 @@ class Config:
     # Application Settings
     DB_PATH = "/data/study_log.db"
     KEEP_LOG_DAYS = 30 
+    KEEP_HOURLY_DAYS = 180  # 時間別集計の保持日数 (日別・月別集計は無期限)
     DAILY_REPORT_HOUR = 23
     DAILY_REPORT_MINUTE = 59
+    REPORT_MAX_PAGES = 3  # 日報のEmbed数の上限 (超えた分はCSVで添付)
+    RANK_SIZE = 10  # /rank の表示人数
+    RANK_SNAPSHOT_SIZE = 50  # 週間・月間ランキングの保存人数
+    HEATMAP_CACHE_SECONDS = 600  # /stats のヒートマップ画像をキャッシュする秒数
+    CONCURRENCY_CACHE_SECONDS = 600  # ステータスボードの同時作業人数を再集計するまでの秒数 (入退室があれば即時に再集計)
+    QUERY_CACHE_SECONDS = 300  # ランキング・統計クエリの結果を保持する秒数 (書き込みがあれば即時に無効化)
+    WEEKDAY_HOUR_DAYS = 90  # 曜日×時間帯マトリクスの集計日数 (KEEP_HOURLY_DAYS 以下)
+    EXPORT_MAX_FILE_BYTES = 8 * 1024 * 1024  # /export の1ファイルあたりの上限 (超えると分割)
+    IMPORT_CHUNK_SIZE = 5000  # /import で1トランザクションに取り込む行数
+
+    # Backup Settings
+    BACKUP_MODE = os.getenv('BACKUP_MODE', 'full')  # full / incremental
+    BACKUP_COMPRESSION = os.getenv('BACKUP_COMPRESSION', 'gzip')  # gzip / zstd
+    BACKUP_FULL_EVERY_DAYS = 7  # 差分モードでフルバックアップを取り直す間隔
+    BACKUP_STATE_DIR = "/data/backups"
+
+    # Archive Settings (保持期間を過ぎたログを削除前に列形式のファイルへ移す)
+    ARCHIVE_ENABLED = os.getenv('ARCHIVE_ENABLED', 'true').lower() == 'true'
+    ARCHIVE_DIR = "/data/archive"
 
     # Timer Settings
     TIMER_MAX_MINUTES = 180
-    TIMER_CHECK_INTERVAL = 10
+
+    # DM Delivery Settings
+    DM_CONCURRENCY = 5
+    DM_RETRIES = 2
+
+    # 日次分割時の称号チェックの同時実行数
+    MILESTONE_CONCURRENCY = 5
+
+    # TTS Settings (先頭から順に試行し、失敗・タイムアウト時は次へフォールバック)
+    TTS_BACKENDS = [b.strip() for b in os.getenv('TTS_BACKENDS', 'edge,local').split(',') if b.strip()]
+    TTS_VOICE_NAME = os.getenv('TTS_VOICE_NAME', 'ja-JP-NanamiNeural')
+    TTS_LOCAL_COMMAND = os.getenv('TTS_LOCAL_COMMAND', 'espeak-ng')
+    TTS_TIMEOUT = float(os.getenv('TTS_TIMEOUT', 5.0))
+    TTS_SLOW_THRESHOLD = 3.0
 
     # Milestones (Hours: Role Name)
     MILESTONES = {
@@ -1,24 +1,69 @@
 import aiosqlite
+import asyncio
+import heapq
 import os
 import logging
+import random
+import unicodedata
 from datetime import datetime
 from typing import Optional, List, Any, Tuple, Union
 from datetime import datetime, timedelta, date
 from contextlib import asynccontextmanager
+from querycache import QueryCache, cached, invalidates
 
 logger = logging.getLogger(__name__)
 
+# キャッシュの無効化単位 (生ログ / 日別・時間別・月別集計とその進捗)
+LOGS = "study_logs"
+ROLLUPS = "rollups"
+
+
+def task_ngrams(text: str) -> str:
+    """タスク文を FTS5 に登録する文字 bigram の列に変換する
+
+    日本語は単語の区切りが空白で分からないため、空白で区切った各語を2文字ずつずらして分割する（1文字の語はそのまま）。
+    """
+    grams = []
+    for word in unicodedata.normalize("NFKC", text).lower().replace('"', " ").split():
+        if len(word) == 1:
+            grams.append(word)
+        else:
+            grams.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return " ".join(grams)
+
+
+def task_match_query(keyword: str) -> Optional[str]:
+    """検索語を FTS5 の MATCH 式に変換する（bigram の並びをフレーズとして検索）"""
+    grams = task_ngrams(keyword)
+    if not grams:
+        return None
+    if len(grams) == 1:
+        # 1文字の検索語は、その文字で始まる bigram の前方一致で探す
+        return f'"{grams}"*'
+    return f'"{grams}"'
+
+
 class Database:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, cache_ttl: float = 0):
         self.db_path = db_path
+        self.fts_enabled = False
+        # 集計クエリの結果キャッシュ (cache_ttl が 0 なら使わない)
+        self.cache = QueryCache(cache_ttl) if cache_ttl > 0 else None
+        # Tips はメモリに載せ、シャッフルした袋から1つずつ取り出す (add_tip / delete_tip のたびに読み直す)
+        self._tips: Optional[List[str]] = None
+        self._tip_bag: List[str] = []
+        self._last_tip: Optional[str] = None
 
     @asynccontextmanager
     async def get_connection(self):
         async with aiosqlite.connect(self.db_path) as db:
             # WALモードでのパフォーマンスと信頼性のための設定
-            await db.execute("PRAGMA foreign_keys=ON")
-            await db.execute("PRAGMA synchronous=NORMAL")  # WALモード推奨
-            await db.execute("PRAGMA busy_timeout=5000")   # ロック競合時のタイムアウト設定
+            # (結果行を返すPRAGMAのカーソルを閉じておかないと VACUUM が "statements in progress" で失敗する)
+            await db.executescript(
+                "PRAGMA foreign_keys=ON;"
+                "PRAGMA synchronous=NORMAL;"  # WALモード推奨
+                "PRAGMA busy_timeout=5000;"   # ロック競合時のタイムアウト設定
+            )
             yield db
 
     async def execute_script(self, script: str) -> None:
@@ -54,6 +99,14 @@ class Database:
     async def setup(self) -> None:
         """データベーステーブルとインデックスの初期化"""
         async with self.get_connection() as db:
+            # 空き領域を VACUUM なしで少しずつ回収できるようにする（既存DBは初回のみ VACUUM で変換）
+            cursor = await db.execute("PRAGMA auto_vacuum")
+            row = await cursor.fetchone()
+            if row and row[0] != 2:
+                logger.info("auto_vacuum を INCREMENTAL に変換します (初回のみ VACUUM を実行)")
+                await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                await db.execute("VACUUM")
+
             # WALモードを有効化（永続設定）
             await db.execute("PRAGMA journal_mode=WAL")
             
@@ -71,17 +124,88 @@ class Database:
                          (user_id INTEGER PRIMARY KEY, reading TEXT)''')
             await db.execute('''CREATE TABLE IF NOT EXISTS tips
                          (id INTEGER PRIMARY KEY AUTOINCREMENT, tip_text TEXT UNIQUE, created_at TEXT)''')
+            await db.execute('''CREATE TABLE IF NOT EXISTS scheduler_state
+                         (job_name TEXT PRIMARY KEY, last_run TEXT)''')
+            await db.execute('''CREATE TABLE IF NOT EXISTS pomodoro_rooms
+                         (channel_id INTEGER PRIMARY KEY, guild_id INTEGER, work_minutes INTEGER, break_minutes INTEGER, anchor TEXT)''')
             
             await db.execute('''CREATE INDEX IF NOT EXISTS idx_study_logs_user_created 
                          ON study_logs(user_id, created_at)''')
+            await db.execute('''CREATE INDEX IF NOT EXISTS idx_study_logs_user_start 
+                         ON study_logs(user_id, start_time)''')
             await db.execute('''CREATE INDEX IF NOT EXISTS idx_study_logs_created 
                          ON study_logs(created_at)''')
             await db.execute('''CREATE INDEX IF NOT EXISTS idx_personal_timers_end_time 
                          ON personal_timers(end_time)''')
             await db.execute('''CREATE INDEX IF NOT EXISTS idx_daily_summary_date 
                          ON daily_summary(date)''')
+
+            # 段階的な保持: 生ログ(30日) → 時間別(180日) → 日別・月別(無期限)
+            await db.execute('''CREATE TABLE IF NOT EXISTS hourly_summary
+                         (user_id INTEGER, hour TEXT, total_seconds INTEGER, PRIMARY KEY(user_id, hour))''')
+            await db.execute('''CREATE TABLE IF NOT EXISTS monthly_summary
+                         (user_id INTEGER, username TEXT, month TEXT, total_seconds INTEGER, PRIMARY KEY(user_id, month))''')
+            await db.execute('''CREATE TABLE IF NOT EXISTS rollup_state
+                         (key TEXT PRIMARY KEY, value TEXT)''')
+            await db.execute('''CREATE INDEX IF NOT EXISTS idx_hourly_summary_hour 
+                         ON hourly_summary(hour)''')
+            await db.execute('''CREATE INDEX IF NOT EXISTS idx_monthly_summary_month 
+                         ON monthly_summary(month)''')
+            # ユーザーごとの日別累積和 (任意期間の合計を 2 回の参照の差で求める)
+            await db.execute('''CREATE TABLE IF NOT EXISTS daily_cumulative
+                         (user_id INTEGER, date TEXT, username TEXT, cumulative_seconds INTEGER, PRIMARY KEY(user_id, date))''')
+            # 週間・月間ランキングのスナップショット (期間の切り替わり時に保存)
+            await db.execute('''CREATE TABLE IF NOT EXISTS ranking_periods
+                         (period_type TEXT, period_start TEXT, period_end TEXT, created_at TEXT,
+                          PRIMARY KEY(period_type, period_start))''')
+            await db.execute('''CREATE TABLE IF NOT EXISTS ranking_snapshots
+                         (period_type TEXT, period_start TEXT, rank INTEGER, user_id INTEGER, username TEXT, seconds INTEGER,
+                          PRIMARY KEY(period_type, period_start, rank))''')
+            # タスクの履歴 (/task のたびに1行) と、セッション (またはタスク変更で分割した区間) の割り当て
+            # 割り当ての明細 (task_sessions) は生ログと同じ期間だけ残し、合計秒数・セッション数は task_history に持つ
+            await db.execute('''CREATE TABLE IF NOT EXISTS task_history
+                         (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, content TEXT, created_at TEXT,
+                          total_seconds INTEGER DEFAULT 0, session_count INTEGER DEFAULT 0)''')
+            await db.execute('''CREATE TABLE IF NOT EXISTS task_sessions
+                         (task_id INTEGER, user_id INTEGER, start_time TEXT, end_time TEXT, seconds INTEGER)''')
+            await db.execute('''CREATE INDEX IF NOT EXISTS idx_task_history_user_created 
+                         ON task_history(user_id, created_at)''')
+            await db.execute('''CREATE INDEX IF NOT EXISTS idx_task_sessions_end 
+                         ON task_sessions(end_time)''')
+            await db.execute("DROP INDEX IF EXISTS idx_task_sessions_task")
+            # session_count が無い既存の task_history には列を追加し、残っている明細から数える
+            cursor = await db.execute("PRAGMA table_info(task_history)")
+            if "session_count" not in [row[1] for row in await cursor.fetchall()]:
+                await db.execute("ALTER TABLE task_history ADD COLUMN session_count INTEGER DEFAULT 0")
+                await db.execute('''UPDATE task_history SET session_count =
+                                      (SELECT COUNT(*) FROM task_sessions s WHERE s.task_id = task_history.id)''')
+            # 同時作業の日別集計 (最大同時作業人数と、2人ずつの重なり時間)
+            await db.execute('''CREATE TABLE IF NOT EXISTS concurrency_daily
+                         (date TEXT PRIMARY KEY, peak_users INTEGER, peak_time TEXT, co_study_seconds INTEGER)''')
+            await db.execute('''CREATE TABLE IF NOT EXISTS co_study_daily
+                         (date TEXT, user_a INTEGER, user_b INTEGER, seconds INTEGER, PRIMARY KEY(date, user_a, user_b))''')
+            # タスク文の全文検索 (rowid = task_history.id、本文は task_history 側に持つ)
+            try:
+                await db.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS task_fts USING fts5(grams, content='')''')
+                self.fts_enabled = True
+            except Exception as e:
+                logger.warning(f"FTS5 が使えないため、タスク検索は LIKE で行います: {e}")
             await db.commit()
 
+            # 既存の現在タスクを履歴に移す (初回のみ)。進行中のセッションにも割り当たるよう日時は最小にしておく
+            cursor = await db.execute("SELECT EXISTS(SELECT 1 FROM task_history)")
+            if not (await cursor.fetchone())[0]:
+                cursor = await db.execute("SELECT user_id, task_content FROM user_tasks")
+                for user_id, content in await cursor.fetchall():
+                    await self._insert_task_history(db, user_id, content, "")
+                await db.commit()
+
+            cursor = await db.execute("SELECT EXISTS(SELECT 1 FROM daily_cumulative), EXISTS(SELECT 1 FROM daily_summary)")
+            has_cumulative, has_summary = await cursor.fetchone()
+        if has_summary and not has_cumulative:
+            logger.info("日別累積和を作成します (初回のみ)")
+            await self.rebuild_daily_cumulative("")
+
     async def get_today_seconds(self, user_id: int) -> int:
         """ユーザーの本日の作業時間を取得"""
         now = datetime.now()
@@ -95,14 +219,11 @@ class Database:
         )
         return result[0] if result and result[0] else 0
 
+    @cached(LOGS, ROLLUPS)
     async def get_total_seconds(self, user_id: int) -> int:
-        """ユーザーの累計作業時間を取得"""
-        result = await self.execute(
-            '''SELECT SUM(duration_seconds) FROM study_logs WHERE user_id = ?''',
-            (user_id,),
-            fetch_one=True
-        )
-        return result[0] if result and result[0] else 0
+        """ユーザーの累計作業時間を取得（生ログ削除後の期間は日別・月別集計から補う）"""
+        rows = await self.get_tiered_totals(date.min, date.max, user_id=user_id)
+        return rows[0][1] if rows else 0
 
     async def get_message_state(self, user_id: int) -> Optional[Tuple[int, int]]:
         """ユーザーのメッセージ状態を取得 (join_msg_id, leave_msg_id)"""
@@ -160,12 +281,44 @@ class Database:
             
         return 0
 
-    async def add_study_log(self, user_id: int, username: str, join_time: datetime, duration_seconds: int, leave_time: datetime) -> None:
-        """学習ログを追加"""
-        await self.execute(
-            "INSERT INTO study_logs VALUES (?, ?, ?, ?, ?)",
-            (user_id, username, join_time.isoformat(), duration_seconds, leave_time.isoformat())
-        )
+    @invalidates(LOGS)
+    async def add_study_log(self, user_id: int, username: str, join_time: datetime, duration_seconds: int, leave_time: datetime,
+                            attribute_task: bool = True) -> None:
+        """学習ログを追加（attribute_task が True ならその間のタスクにも時間を割り当てる）"""
+        try:
+            async with self.get_connection() as db:
+                await db.execute(
+                    "INSERT INTO study_logs VALUES (?, ?, ?, ?, ?)",
+                    (user_id, username, join_time.isoformat(), duration_seconds, leave_time.isoformat())
+                )
+                if attribute_task:
+                    await self._attribute_task_time(db, user_id, join_time, leave_time, duration_seconds)
+                await db.commit()
+        except Exception as e:
+            logger.error(f"学習ログの保存エラー (User ID: {user_id}): {e}")
+
+    @invalidates(LOGS)
+    async def add_study_logs(self, logs: List[Tuple[int, str, datetime, int, datetime]]) -> int:
+        """学習ログをまとめて1トランザクションで追加 (user_id, username, join_time, duration_seconds, leave_time)
+
+        戻り値は保存した件数。失敗した場合は何も保存せず 0 を返す。
+        """
+        if not logs:
+            return 0
+        try:
+            async with self.get_connection() as db:
+                await db.executemany(
+                    "INSERT INTO study_logs VALUES (?, ?, ?, ?, ?)",
+                    [(user_id, username, join_time.isoformat(), duration, leave_time.isoformat())
+                     for user_id, username, join_time, duration, leave_time in logs]
+                )
+                for user_id, _, join_time, duration, leave_time in logs:
+                    await self._attribute_task_time(db, user_id, join_time, leave_time, duration)
+                await db.commit()
+        except Exception as e:
+            logger.error(f"学習ログの一括保存エラー ({len(logs)}件): {e}")
+            return 0
+        return len(logs)
 
     async def get_user_task(self, user_id: int) -> Optional[str]:
         """ユーザーの現在取組中のタスクを取得"""
@@ -177,10 +330,115 @@ class Database:
         return result[0] if result else None
 
     async def set_user_task(self, user_id: int, task_content: str) -> None:
-        """ユーザーのタスクを設定"""
-        await self.execute(
-            '''INSERT OR REPLACE INTO user_tasks (user_id, task_content) VALUES (?, ?)''',
-            (user_id, task_content)
+        """ユーザーのタスクを設定（タスク履歴にも追加する）"""
+        try:
+            async with self.get_connection() as db:
+                await db.execute(
+                    '''INSERT OR REPLACE INTO user_tasks (user_id, task_content) VALUES (?, ?)''',
+                    (user_id, task_content)
+                )
+                await self._insert_task_history(db, user_id, task_content, datetime.now().isoformat())
+                await db.commit()
+        except Exception as e:
+            logger.error(f"タスク設定エラー (User ID: {user_id}): {e}")
+
+    async def _insert_task_history(self, db, user_id: int, content: str, created_at: str) -> None:
+        cursor = await db.execute(
+            "INSERT INTO task_history (user_id, content, created_at) VALUES (?, ?, ?)",
+            (user_id, content, created_at)
+        )
+        if self.fts_enabled:
+            await db.execute("INSERT INTO task_fts (rowid, grams) VALUES (?, ?)", (cursor.lastrowid, task_ngrams(content)))
+
+    async def _attribute_task_time(self, db, user_id: int, start: datetime, end: datetime, seconds: int) -> None:
+        """セッションの作業時間をその間のタスクに割り当てる（呼び出し側のトランザクション内で実行）
+
+        開始時点のタスクと、途中で /task により切り替わったタスクごとに区間を分け、
+        記録された秒数 (休憩などを除いた値) を各区間の経過時間の比で配分する。
+        """
+        start_str, end_str = start.isoformat(), end.isoformat()
+        if end <= start:
+            # 時間幅がない記録 (休憩後の退出など) は終了時点のタスクにまとめる
+            start_str = end_str
+        cursor = await db.execute(
+            '''SELECT id, created_at FROM task_history WHERE user_id = ? AND created_at <= ?
+               ORDER BY created_at DESC, id DESC LIMIT 1''',
+            (user_id, start_str)
+        )
+        current = await cursor.fetchone()
+        cursor = await db.execute(
+            '''SELECT id, created_at FROM task_history WHERE user_id = ? AND created_at > ? AND created_at < ?
+               ORDER BY created_at, id''',
+            (user_id, start_str, end_str)
+        )
+        changes = await cursor.fetchall()
+        if not current and not changes:
+            return
+
+        # (タスクID, 区間の開始, 区間の終了)。最初のタスク設定より前の区間は割り当てない
+        segments = []
+        task_id, segment_start = (current[0], start_str) if current else (None, None)
+        for next_id, changed_at in changes:
+            if task_id is not None:
+                segments.append((task_id, segment_start, changed_at))
+            task_id, segment_start = next_id, changed_at
+        segments.append((task_id, segment_start, end_str))
+
+        total_span = (end - start).total_seconds()
+        if current is None and total_span > 0:
+            # 最初のタスク設定より前の時間は割り当てないので、その分を除いた秒数を配分する
+            covered = (end - datetime.fromisoformat(segments[0][1])).total_seconds()
+            remaining = int(seconds * covered / total_span)
+        else:
+            remaining = seconds
+
+        rows = []
+        for i, (task_id, seg_start, seg_end) in enumerate(segments):
+            if i == len(segments) - 1:
+                allotted = remaining  # 端数は最後の区間に寄せる
+            else:
+                span = (datetime.fromisoformat(seg_end) - datetime.fromisoformat(seg_start)).total_seconds()
+                allotted = int(seconds * span / total_span)
+            remaining -= allotted
+            rows.append((task_id, user_id, seg_start, seg_end, allotted))
+
+        await db.executemany("INSERT INTO task_sessions VALUES (?, ?, ?, ?, ?)", rows)
+        await db.executemany(
+            "UPDATE task_history SET total_seconds = total_seconds + ?, session_count = session_count + 1 WHERE id = ?",
+            [(allotted, task_id) for task_id, _, _, _, allotted in rows]
+        )
+
+    async def get_task_totals(self, user_id: int, limit: int = 5) -> List[Tuple[str, int]]:
+        """タスク内容ごとの合計作業時間 (多い順)。同じ内容を何度設定しても1つにまとめる"""
+        return await self.execute(
+            '''SELECT content, SUM(total_seconds) AS seconds FROM task_history
+               WHERE user_id = ? GROUP BY content HAVING seconds > 0
+               ORDER BY seconds DESC LIMIT ?''',
+            (user_id, limit),
+            fetch_all=True
+        )
+
+    async def search_tasks(self, user_id: int, keyword: str, limit: int = 10) -> List[Tuple[int, str, str, int, int]]:
+        """タスク履歴をキーワードで検索する (id, content, created_at, total_seconds, セッション数)"""
+        columns = "t.id, t.content, t.created_at, t.total_seconds, t.session_count"
+        if self.fts_enabled:
+            match = task_match_query(keyword)
+            if match is None:
+                return []
+            return await self.execute(
+                f'''SELECT {columns} FROM task_fts JOIN task_history t ON t.id = task_fts.rowid
+                    WHERE task_fts MATCH ? AND t.user_id = ?
+                    ORDER BY t.created_at DESC LIMIT ?''',
+                (match, user_id, limit),
+                fetch_all=True
+            )
+        escaped = keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return await self.execute(
+            f'''SELECT {columns} FROM task_history t
+                WHERE t.user_id = ? AND t.content LIKE ? ESCAPE '\\'
+                ORDER BY t.created_at DESC LIMIT ?''',
+            (user_id, f"%{escaped}%", limit),
+            fetch_all=True
         )
 
     async def get_user_reading(self, user_id: int) -> Optional[str]:
@@ -199,6 +457,7 @@ class Database:
             (user_id, reading)
         )
 
+    @cached(LOGS)
     async def get_weekly_ranking(self, start_date: str) -> List[Tuple[str, int]]:
         """週間ランキングデータを取得"""
         return await self.execute(
@@ -212,15 +471,76 @@ class Database:
             fetch_all=True
         )
 
+    async def save_ranking_snapshot(self, period_type: str, start_date: date, end_date: date,
+                                    rows: List[Tuple[int, str, int]]) -> None:
+        """期間のランキング (user_id, username, seconds) を順位付きで保存する"""
+        start_str = start_date.isoformat()
+        async with self.get_connection() as db:
+            await db.execute("DELETE FROM ranking_snapshots WHERE period_type = ? AND period_start = ?", (period_type, start_str))
+            await db.executemany(
+                "INSERT INTO ranking_snapshots VALUES (?, ?, ?, ?, ?, ?)",
+                [(period_type, start_str, rank, user_id, username, seconds)
+                 for rank, (user_id, username, seconds) in enumerate(rows, 1)]
+            )
+            await db.execute(
+                "INSERT OR REPLACE INTO ranking_periods VALUES (?, ?, ?, ?)",
+                (period_type, start_str, end_date.isoformat(), datetime.now().isoformat())
+            )
+            await db.commit()
+
+    async def has_ranking_snapshot(self, period_type: str, start_date: date) -> bool:
+        result = await self.execute(
+            "SELECT 1 FROM ranking_periods WHERE period_type = ? AND period_start = ?",
+            (period_type, start_date.isoformat()),
+            fetch_one=True
+        )
+        return result is not None
+
+    async def get_ranking_snapshot(self, period_type: str, start: str) -> Optional[Tuple[str, str, List[Tuple[int, str, int]]]]:
+        """保存済みのランキングを取得 (period_start, period_end, [(user_id, username, seconds), ...])"""
+        period = await self.execute(
+            "SELECT period_start, period_end FROM ranking_periods WHERE period_type = ? AND period_start = ?",
+            (period_type, start),
+            fetch_one=True
+        )
+        if not period:
+            return None
+        rows = await self.execute(
+            '''SELECT user_id, username, seconds FROM ranking_snapshots
+               WHERE period_type = ? AND period_start = ? ORDER BY rank''',
+            (period_type, start),
+            fetch_all=True
+        )
+        return period[0], period[1], rows or []
+
+    async def get_adjacent_ranking_period(self, period_type: str, start: Optional[str], older: bool) -> Optional[str]:
+        """start の1つ前 (older) / 後の保存済み期間の開始日。start が None なら最新の期間"""
+        if start is None:
+            query = "SELECT MAX(period_start) FROM ranking_periods WHERE period_type = ?"
+            params = (period_type,)
+        elif older:
+            query = "SELECT MAX(period_start) FROM ranking_periods WHERE period_type = ? AND period_start < ?"
+            params = (period_type, start)
+        else:
+            query = "SELECT MIN(period_start) FROM ranking_periods WHERE period_type = ? AND period_start > ?"
+            params = (period_type, start)
+        result = await self.execute(query, params, fetch_one=True)
+        return result[0] if result else None
+
     async def get_first_log_date(self, user_id: int) -> Optional[str]:
-        """ユーザーの最初のログ日時を取得"""
+        """ユーザーの最初のログ日時を取得（生ログ削除後も日別集計から求める）"""
         result = await self.execute(
-            '''SELECT MIN(created_at) FROM study_logs WHERE user_id = ?''',
-            (user_id,),
+            '''SELECT MIN(first) FROM (
+                   SELECT MIN(date) AS first FROM daily_summary WHERE user_id = ?
+                   UNION ALL
+                   SELECT MIN(created_at) FROM study_logs WHERE user_id = ?
+               )''',
+            (user_id, user_id),
             fetch_one=True
         )
         return result[0] if result else None
 
+    @cached(LOGS)
     async def get_study_logs_in_range(self, start_date: str, end_date: Optional[str] = None) -> List[Tuple[int, str, int]]:
         """指定期間の学習ログを集計して取得 (user_id, username, total_time)"""
         if end_date:
@@ -240,6 +560,7 @@ class Database:
             
         return await self.execute(query, params, fetch_all=True)
 
+    @invalidates(ROLLUPS)
     async def save_daily_summary(self, user_id: int, username: str, date_str: str, total_seconds: int) -> None:
         """日次サマリーを保存"""
         await self.execute(
@@ -247,44 +568,571 @@ class Database:
                VALUES (?, ?, ?, ?)''',
             (user_id, username, date_str, total_seconds)
         )
+        await self.rebuild_daily_cumulative(date_str)
+
+    @invalidates(ROLLUPS)
+    async def rebuild_daily_cumulative(self, from_date: str) -> None:
+        """from_date 以降の日別累積和を daily_summary から作り直す（日別集計を書き換えた後に呼ぶ）"""
+        try:
+            async with self.get_connection() as db:
+                await db.execute("DELETE FROM daily_cumulative WHERE date >= ?", (from_date,))
+                await db.execute(
+                    '''INSERT INTO daily_cumulative (user_id, date, username, cumulative_seconds)
+                       SELECT d.user_id, d.date, d.username,
+                              SUM(d.total_seconds) OVER (PARTITION BY d.user_id ORDER BY d.date)
+                              + COALESCE((SELECT c.cumulative_seconds FROM daily_cumulative c
+                                          WHERE c.user_id = d.user_id AND c.date < ?
+                                          ORDER BY c.date DESC LIMIT 1), 0)
+                       FROM daily_summary d
+                       WHERE d.date >= ?''',
+                    (from_date, from_date)
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"日別累積和の更新エラー ({from_date}〜): {e}")
+
+    @cached(LOGS, ROLLUPS)
+    async def get_range_ranking(self, start_date: date, end_date: date, limit: int = 10) -> List[Tuple[int, str, int]]:
+        """[start_date, end_date] の作業時間ランキング (user_id, username, total_seconds)
+
+        集計済みの日はユーザーごとに累積和を2回参照した差で求めるため、期間の長さによらず一定のコストで済む。
+        まだ日別集計されていない日 (当日など) の分だけ生ログから加算する。
+        """
+        start_str, end_str = start_date.isoformat(), end_date.isoformat()
+        rows = await self.execute(
+            '''SELECT u.user_id,
+                      (SELECT username FROM daily_cumulative WHERE user_id = u.user_id AND date <= ?
+                       ORDER BY date DESC LIMIT 1),
+                      COALESCE((SELECT cumulative_seconds FROM daily_cumulative WHERE user_id = u.user_id AND date <= ?
+                                ORDER BY date DESC LIMIT 1), 0)
+                      - COALESCE((SELECT cumulative_seconds FROM daily_cumulative WHERE user_id = u.user_id AND date < ?
+                                  ORDER BY date DESC LIMIT 1), 0)
+               FROM (SELECT DISTINCT user_id FROM daily_cumulative) u''',
+            (end_str, end_str, start_str),
+            fetch_all=True
+        )
+        totals = {user_id: [username, seconds] for user_id, username, seconds in rows or [] if seconds}
+
+        through_str = await self.get_rollup_state("daily_through")
+        raw_from = max(start_date, date.fromisoformat(through_str) + timedelta(days=1)) if through_str else start_date
+        if raw_from <= end_date:
+            raw_rows = await self.get_study_logs_in_range(
+                datetime.combine(raw_from, datetime.min.time()).isoformat(),
+                datetime.combine(end_date + timedelta(days=1), datetime.min.time()).isoformat()
+            )
+            for user_id, username, seconds in raw_rows or []:
+                entry = totals.setdefault(user_id, [username, 0])
+                entry[0] = username
+                entry[1] += seconds or 0
+
+        top = heapq.nlargest(limit, totals.items(), key=lambda item: item[1][1])
+        return [(user_id, username, seconds) for user_id, (username, seconds) in top if seconds > 0]
+
+    async def _iter_rows(self, query: str, params: Tuple = (), batch_size: int = 500):
+        """クエリ結果を fetchmany で少しずつ取り出して1行ずつ返す（全件をリストにしない）"""
+        async with self.get_connection() as db:
+            async with db.execute(query, params) as cursor:
+                while True:
+                    rows = await cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield row
+
+    def iter_study_logs_in_range(self, start_date: str, end_date: str, batch_size: int = 500):
+        """get_study_logs_in_range と同じ集計を、全件をリストにせずカーソルから順に返す"""
+        return self._iter_rows(
+            '''SELECT user_id, username, SUM(duration_seconds) as total_time 
+               FROM study_logs 
+               WHERE created_at >= ? AND created_at < ?
+               GROUP BY user_id 
+               ORDER BY total_time DESC''',
+            (start_date, end_date),
+            batch_size
+        )
+
+    def iter_study_log_rows(self, start: str, end: str, user_id: Optional[int] = None):
+        """study_logs の生の行を順に返す (user_id, username, start_time, duration_seconds, created_at)"""
+        query = '''SELECT user_id, username, start_time, duration_seconds, created_at FROM study_logs
+                   WHERE created_at >= ? AND created_at < ?'''
+        params = [start, end]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        return self._iter_rows(query + " ORDER BY created_at", tuple(params))
+
+    def iter_daily_summary_rows(self, start_date: str, end_date: str, user_id: Optional[int] = None):
+        """daily_summary の行を順に返す (user_id, username, date, total_seconds)、end_date は含まない"""
+        query = "SELECT user_id, username, date, total_seconds FROM daily_summary WHERE date >= ? AND date < ?"
+        params = [start_date, end_date]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        return self._iter_rows(query + " ORDER BY date, user_id", tuple(params))
+
+    @invalidates(ROLLUPS)
+    async def materialize_daily_summaries(self, start_date: date, end_date: date) -> int:
+        """study_logs から [start_date, end_date] の日別集計を1つの INSERT ... SELECT で作成する
+
+        過去の日を指定すればバックフィルとして使える。生ログが無い日の既存行はそのまま残す。
+        書き込んだ後に日別累積和も更新する。戻り値は書き込んだ行数 (失敗時は 0)。
+        """
+        start_str = datetime.combine(start_date, datetime.min.time()).isoformat()
+        end_str = datetime.combine(end_date + timedelta(days=1), datetime.min.time()).isoformat()
+        # MAX(created_at) と同時に選んだ username はその日の最後のログの表示名になる
+        result = await self.execute(
+            '''INSERT OR REPLACE INTO daily_summary (user_id, username, date, total_seconds)
+               SELECT user_id, username, day, total FROM (
+                   SELECT user_id, username, substr(created_at, 1, 10) AS day,
+                          SUM(duration_seconds) AS total, MAX(created_at)
+                   FROM study_logs
+                   WHERE created_at >= ? AND created_at < ?
+                   GROUP BY user_id, day
+               )''',
+            (start_str, end_str)
+        )
+        await self.rebuild_daily_cumulative(start_date.isoformat())
+        return result or 0
+
+    @invalidates(LOGS)
+    async def import_study_logs(self, rows: List[Tuple[int, str, str, int, str]]) -> List[Tuple[int, str, str, int, str]]:
+        """学習ログを1トランザクションで取り込み、実際に追加した行を返す
+
+        rows は (user_id, username, start_time, duration_seconds, created_at)。
+        既に同じ (user_id, start_time) のログがある行と、rows 内の重複は追加しない。
+        """
+        if not rows:
+            return []
+        async with self.get_connection() as db:
+            await db.execute('''CREATE TEMP TABLE IF NOT EXISTS import_chunk
+                                (user_id INTEGER, username TEXT, start_time TEXT, duration_seconds INTEGER, created_at TEXT,
+                                 PRIMARY KEY(user_id, start_time))''')
+            await db.execute("DELETE FROM import_chunk")
+            await db.executemany("INSERT OR IGNORE INTO import_chunk VALUES (?, ?, ?, ?, ?)", rows)
+            new_rows_query = '''SELECT c.user_id, c.username, c.start_time, c.duration_seconds, c.created_at
+                                FROM import_chunk c
+                                WHERE NOT EXISTS (SELECT 1 FROM study_logs s
+                                                  WHERE s.user_id = c.user_id AND s.start_time = c.start_time)'''
+            cursor = await db.execute(new_rows_query)
+            inserted = await cursor.fetchall()
+            await db.execute("INSERT INTO study_logs " + new_rows_query)
+            await db.execute("DELETE FROM import_chunk")
+            await db.commit()
+        return inserted
+
+    async def get_summarized_user_days(self, month: str) -> set:
+        """指定月 (YYYY-MM) に日別集計がある (user_id, date) の集合"""
+        rows = await self.execute(
+            "SELECT user_id, date FROM daily_summary WHERE date >= ? AND date < ? AND total_seconds > 0",
+            (f"{month}-01", f"{month}-32"),
+            fetch_all=True
+        )
+        return {(user_id, day) for user_id, day in rows or []}
+
+    @invalidates(ROLLUPS)
+    async def add_to_daily_summaries(self, totals: List[Tuple[int, str, str, int]]) -> None:
+        """日別集計に加算する (user_id, username, date, seconds)。取り込んだ過去のログの反映に使う"""
+        if not totals:
+            return
+        async with self.get_connection() as db:
+            await db.executemany(
+                '''INSERT INTO daily_summary (user_id, username, date, total_seconds) VALUES (?, ?, ?, ?)
+                   ON CONFLICT(user_id, date) DO UPDATE SET total_seconds = total_seconds + excluded.total_seconds''',
+                totals
+            )
+            await db.commit()
+        await self.rebuild_daily_cumulative(min(day for _, _, day, _ in totals))
+
+    @invalidates(LOGS, ROLLUPS)
+    async def cleanup_old_data(self, log_threshold: str, hourly_threshold: str,
+                               batch_size: int = 500, pause: float = 0.05) -> Tuple[int, int]:
+        """保持期間を過ぎた生ログと時間別集計を削除 (戻り値: logs_deleted, hourly_deleted)
+
+        日別・月別集計は削除しない。先に compact_rollups で集計済みであること。
+        タスクへの割り当ての明細 (task_sessions) も生ログと同じ期間で削除する (合計は task_history に残る)。
+        削除は小さなバッチに分けてコミットし、バッチ間で待機して他の書き込みを妨げないようにする。
+        """
+        logs_deleted = await self._delete_in_batches(
+            "study_logs", "created_at < ?", (log_threshold,), batch_size, pause
+        )
+        summary_deleted = await self._delete_in_batches(
+            "hourly_summary", "hour < ?", (hourly_threshold,), batch_size, pause
+        )
+        if log_threshold:
+            await self._delete_in_batches("task_sessions", "end_time < ?", (log_threshold,), batch_size, pause)
+
+        await self.reclaim_free_space()
 
-    async def cleanup_old_data(self, log_threshold: str, summary_threshold: str) -> Tuple[int, int]:
-        """古いデータを削除 (戻り値: logs_deleted, summary_deleted)"""
-        # 古いログを削除
-        logs_deleted = await self.execute("DELETE FROM study_logs WHERE created_at < ?", (log_threshold,))
-        if logs_deleted is None: logs_deleted = 0
-            
-        # 古いDaily Summaryデータを削除
-        summary_deleted = await self.execute("DELETE FROM daily_summary WHERE date < ?", (summary_threshold,))
-        if summary_deleted is None: summary_deleted = 0
-            
-        # VACUUM
-        await self.execute_script("VACUUM")
-        
         return logs_deleted, summary_deleted
 
-    async def add_personal_timer(self, user_id: int, end_time_str: str, minutes: int) -> None:
-        """個人タイマーを追加"""
-        await self.execute(
-            "INSERT INTO personal_timers VALUES (?, ?, ?)",
-            (user_id, end_time_str, minutes)
+    async def _delete_in_batches(self, table: str, condition: str, params: Tuple,
+                                 batch_size: int, pause: float) -> int:
+        """条件に一致する行を batch_size 件ずつ削除する（戻り値: 削除件数）"""
+        total = 0
+        try:
+            async with self.get_connection() as db:
+                while True:
+                    cursor = await db.execute(
+                        f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {condition} LIMIT ?)",
+                        (*params, batch_size)
+                    )
+                    await db.commit()
+                    deleted = cursor.rowcount or 0
+                    total += deleted
+                    if deleted < batch_size:
+                        break
+                    # ロックを手放している間に入退室などの書き込みを通す
+                    await asyncio.sleep(pause)
+        except Exception as e:
+            logger.error(f"バッチ削除エラー ({table}): {e}")
+        return total
+
+    async def get_freelist_ratio(self) -> float:
+        """データベース全体に占める空きページの割合"""
+        page_count = await self.execute("PRAGMA page_count", fetch_one=True)
+        freelist_count = await self.execute("PRAGMA freelist_count", fetch_one=True)
+        if not page_count or not page_count[0] or not freelist_count:
+            return 0.0
+        return freelist_count[0] / page_count[0]
+
+    async def reclaim_free_space(self, full_vacuum_ratio: float = 0.5, step_pages: int = 256,
+                                 max_steps: int = 40, pause: float = 0.05) -> int:
+        """空き領域を回収する (戻り値: 回収したページ数)
+
+        通常は incremental_vacuum を step_pages ずつ実行し、各ステップの間で待機する。
+        空きページの割合が full_vacuum_ratio を超えた場合のみ、ファイル全体を書き直す VACUUM を実行する。
+        """
+        ratio = await self.get_freelist_ratio()
+        if ratio >= full_vacuum_ratio:
+            logger.info(f"空きページ率 {ratio:.0%} が閾値を超えたため VACUUM を実行します")
+            await self.execute_script("VACUUM")
+            return 0
+
+        reclaimed = 0
+        try:
+            async with self.get_connection() as db:
+                for _ in range(max_steps):
+                    cursor = await db.execute("PRAGMA freelist_count")
+                    row = await cursor.fetchone()
+                    free_pages = row[0] if row else 0
+                    if free_pages <= 0:
+                        break
+                    step = min(step_pages, free_pages)
+                    # 結果を最後まで読み出さないと1ページしか解放されない
+                    cursor = await db.execute(f"PRAGMA incremental_vacuum({step})")
+                    await cursor.fetchall()
+                    await db.commit()
+                    reclaimed += step
+                    await asyncio.sleep(pause)
+        except Exception as e:
+            logger.error(f"incremental_vacuum エラー: {e}")
+        return reclaimed
+
+    async def get_logs_before(self, threshold: str) -> List[Tuple]:
+        """アーカイブ対象のログを取得 (rowid, user_id, username, start_time, duration_seconds, created_at)"""
+        rows = await self.execute(
+            '''SELECT rowid, user_id, username, start_time, duration_seconds, created_at
+               FROM study_logs WHERE created_at < ? ORDER BY created_at''',
+            (threshold,),
+            fetch_all=True
         )
+        return rows or []
 
-    async def get_and_delete_expired_timers(self, now_str: str) -> List[Tuple[int, int, int]]:
-        """期限切れタイマーを取得し、取得したものは同時に削除する (rowid, user_id, minutes)"""
-        # まず取得して、IDリストで削除する
-        expired = await self.execute(
-            "SELECT rowid, user_id, minutes FROM personal_timers WHERE end_time <= ?",
-            (now_str,),
+    async def get_log_hourly_in_range(self, start: str, end: str, user_id: Optional[int] = None) -> List[Tuple[str, int]]:
+        """study_logs の開始時刻の時間帯別合計 (終了時刻が [start, end) のログ)"""
+        query = '''SELECT strftime('%H', start_time), SUM(duration_seconds) FROM study_logs
+                   WHERE created_at >= ? AND created_at < ?'''
+        params = [start, end]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        rows = await self.execute(query + " GROUP BY 1", tuple(params), fetch_all=True)
+        return rows or []
+
+    async def get_rollup_state(self, key: str) -> Optional[str]:
+        """集計処理の進捗 (どこまで集計済みか) を取得"""
+        result = await self.execute("SELECT value FROM rollup_state WHERE key = ?", (key,), fetch_one=True)
+        return result[0] if result else None
+
+    @invalidates(ROLLUPS)
+    async def set_rollup_state(self, key: str, value: str) -> None:
+        await self.execute("INSERT OR REPLACE INTO rollup_state (key, value) VALUES (?, ?)", (key, value))
+
+    @staticmethod
+    def _split_into_hours(end_time: datetime, duration_seconds: int, day_start: datetime, day_end: datetime):
+        """終了時刻から遡った作業区間を、指定日の範囲内で1時間ごとの (hour_key, seconds) に分割する"""
+        if duration_seconds <= 0:
+            # 手動調整 (/add) など区間を持たないログは終了時刻の時間帯に計上する
+            if day_start <= end_time < day_end:
+                yield end_time.strftime("%Y-%m-%dT%H"), duration_seconds
+            return
+
+        start = max(end_time - timedelta(seconds=duration_seconds), day_start)
+        end = min(end_time, day_end)
+        while start < end:
+            next_hour = start.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            segment_end = min(next_hour, end)
+            yield start.strftime("%Y-%m-%dT%H"), int((segment_end - start).total_seconds())
+            start = segment_end
+
+    @invalidates(ROLLUPS)
+    async def rebuild_hourly_summary(self, day: date) -> int:
+        """指定日の時間別集計を生ログから作り直す (戻り値: 書き込んだ行数)"""
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+        # 日付をまたぐセッションを拾うため、翌日に終了したログも対象にする
+        rows = await self.execute(
+            "SELECT user_id, duration_seconds, created_at FROM study_logs WHERE created_at >= ? AND created_at < ?",
+            (day_start.isoformat(), (day_end + timedelta(days=1)).isoformat()),
             fetch_all=True
         )
-        
-        if expired:
-            for rowid, _, _ in expired:
-                await self.execute("DELETE FROM personal_timers WHERE rowid = ?", (rowid,))
-                
-                
-        return expired if expired else []
+
+        buckets = {}
+        for user_id, duration_seconds, created_at in rows or []:
+            try:
+                end_time = datetime.fromisoformat(created_at)
+            except (TypeError, ValueError):
+                continue
+            for hour_key, seconds in self._split_into_hours(end_time, duration_seconds or 0, day_start, day_end):
+                buckets[(user_id, hour_key)] = buckets.get((user_id, hour_key), 0) + seconds
+
+        try:
+            async with self.get_connection() as db:
+                await db.execute(
+                    "DELETE FROM hourly_summary WHERE hour >= ? AND hour < ?",
+                    (day_start.strftime("%Y-%m-%dT%H"), day_end.strftime("%Y-%m-%dT%H"))
+                )
+                await db.executemany(
+                    "INSERT INTO hourly_summary (user_id, hour, total_seconds) VALUES (?, ?, ?)",
+                    [(user_id, hour_key, seconds) for (user_id, hour_key), seconds in buckets.items()]
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"時間別集計エラー ({day}): {e}")
+            return 0
+        return len(buckets)
+
+    @invalidates(ROLLUPS)
+    async def rebuild_monthly_summary(self, from_month: str = "") -> int:
+        """日別集計から月別集計を作り直す (from_month 以降の月が対象、'YYYY-MM')"""
+        result = await self.execute(
+            '''INSERT OR REPLACE INTO monthly_summary (user_id, username, month, total_seconds)
+               SELECT user_id, MAX(username), substr(date, 1, 7) AS month, SUM(total_seconds)
+               FROM daily_summary
+               WHERE date >= ?
+               GROUP BY user_id, month''',
+            (from_month,)
+        )
+        return result or 0
+
+    async def compact_rollups(self, today: date, pause: float = 0.05) -> dict:
+        """夜間の段階的集計を実行する（前回の続きから今日までの日だけを処理する）
+
+        - 時間別: 前回処理した日（当時は途中だった）から今日までを作り直す
+        - 月別: 日別集計が更新された月を作り直す（初回は全期間）
+        """
+        hourly_from_str = await self.get_rollup_state("hourly_through")
+        if hourly_from_str:
+            hourly_from = date.fromisoformat(hourly_from_str)
+        else:
+            first = await self.execute("SELECT MIN(created_at) FROM study_logs", fetch_one=True)
+            hourly_from = datetime.fromisoformat(first[0]).date() if first and first[0] else today
+
+        hourly_rows = 0
+        day = hourly_from
+        while day <= today:
+            hourly_rows += await self.rebuild_hourly_summary(day)
+            day += timedelta(days=1)
+            await asyncio.sleep(pause)
+        await self.set_rollup_state("hourly_through", today.isoformat())
+
+        monthly_from = await self.get_rollup_state("monthly_through")
+        monthly_rows = await self.rebuild_monthly_summary(monthly_from[:7] if monthly_from else "")
+        await self.set_rollup_state("monthly_through", today.isoformat())
+
+        return {"hourly_rows": hourly_rows, "monthly_rows": monthly_rows}
+
+    async def get_tiered_totals(self, start: date, end: date, user_id: Optional[int] = None) -> List[Tuple[int, int]]:
+        """[start, end) の日付範囲のユーザー別合計を取得 (user_id, total_seconds)
+
+        日別集計が済んだ期間は、丸ごと含まれる月は月別、残りは日別から集計し、
+        それ以降の期間だけを生ログから集計する（1クエリ）。
+        """
+        through_str = await self.get_rollup_state("daily_through")
+        segments = []
+        raw_from = start
+        if through_str:
+            rolled_end = min(end, date.fromisoformat(through_str) + timedelta(days=1))
+            if start < rolled_end:
+                month_start = start if start.day == 1 else (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+                month_end = rolled_end.replace(day=1)
+                if month_start < month_end:
+                    segments.append(("monthly", month_start, month_end))
+                    segments.append(("daily", start, month_start))
+                    segments.append(("daily", month_end, rolled_end))
+                else:
+                    segments.append(("daily", start, rolled_end))
+                raw_from = max(start, rolled_end)
+        if raw_from < end:
+            segments.append(("raw", raw_from, end))
+
+        user_filter = " AND user_id = ?" if user_id is not None else ""
+        parts, params = [], []
+        for tier, seg_start, seg_end in segments:
+            if seg_start >= seg_end:
+                continue
+            if tier == "monthly":
+                parts.append(f"SELECT user_id, total_seconds AS s FROM monthly_summary WHERE month >= ? AND month < ?{user_filter}")
+                params += [seg_start.strftime("%Y-%m"), seg_end.strftime("%Y-%m")]
+            elif tier == "daily":
+                parts.append(f"SELECT user_id, total_seconds AS s FROM daily_summary WHERE date >= ? AND date < ?{user_filter}")
+                params += [seg_start.isoformat(), seg_end.isoformat()]
+            else:
+                parts.append(f"SELECT user_id, duration_seconds AS s FROM study_logs WHERE created_at >= ? AND created_at < ?{user_filter}")
+                params += [seg_start.isoformat(), seg_end.isoformat()]
+            if user_id is not None:
+                params.append(user_id)
+
+        if not parts:
+            return []
+        query = f"SELECT user_id, SUM(s) AS total FROM ({' UNION ALL '.join(parts)}) GROUP BY user_id ORDER BY total DESC"
+        rows = await self.execute(query, tuple(params), fetch_all=True)
+        return [(uid, total or 0) for uid, total in rows or []]
+
+    async def get_daily_series(self, user_id: int, start: date, end: date) -> List[Tuple[str, int]]:
+        """[start, end] のユーザーの日別作業時間 (date, total_seconds)
+
+        日別集計が済んだ日は daily_summary の主キー範囲で読み、それ以降の日だけを生ログから集計する（1クエリ）。
+        """
+        through_str = await self.get_rollup_state("daily_through")
+        raw_from = max(start, date.fromisoformat(through_str) + timedelta(days=1)) if through_str else start
+        rows = await self.execute(
+            '''SELECT date, total_seconds FROM daily_summary WHERE user_id = ? AND date >= ? AND date < ?
+               UNION ALL
+               SELECT substr(created_at, 1, 10) AS day, SUM(duration_seconds) FROM study_logs
+               WHERE user_id = ? AND created_at >= ? AND created_at < ?
+               GROUP BY day''',
+            (user_id, start.isoformat(), raw_from.isoformat(),
+             user_id, raw_from.isoformat(), (end + timedelta(days=1)).isoformat()),
+            fetch_all=True
+        )
+        return [(day, seconds or 0) for day, seconds in rows or []]
+
+    async def get_hourly_series(self, user_id: int, start: date, end: date) -> List[Tuple[str, int]]:
+        """[start, end] のユーザーの時間別作業時間 (hour 'YYYY-MM-DDTHH', total_seconds)
+
+        時間別集計が済んだ日は hourly_summary から読み、まだの日 (前回の集計以降) だけを生ログから1時間ごとに分割する。
+        """
+        through_str = await self.get_rollup_state("hourly_through")
+        raw_from = max(start, date.fromisoformat(through_str)) if through_str else start
+        rows = await self.execute(
+            '''SELECT hour, total_seconds FROM hourly_summary WHERE user_id = ? AND hour >= ? AND hour < ?''',
+            (user_id, start.isoformat(), raw_from.isoformat()),
+            fetch_all=True
+        ) or []
+
+        raw_start = datetime.combine(raw_from, datetime.min.time())
+        raw_end = datetime.combine(end + timedelta(days=1), datetime.min.time())
+        if raw_start < raw_end:
+            logs = await self.execute(
+                "SELECT duration_seconds, created_at FROM study_logs WHERE user_id = ? AND created_at >= ? AND created_at < ?",
+                (user_id, raw_start.isoformat(), (raw_end + timedelta(days=1)).isoformat()),
+                fetch_all=True
+            )
+            buckets = {}
+            for duration_seconds, created_at in logs or []:
+                try:
+                    end_time = datetime.fromisoformat(created_at)
+                except (TypeError, ValueError):
+                    continue
+                for hour_key, seconds in self._split_into_hours(end_time, duration_seconds or 0, raw_start, raw_end):
+                    buckets[hour_key] = buckets.get(hour_key, 0) + seconds
+            rows = list(rows) + list(buckets.items())
+        return rows
+
+    async def get_log_intervals(self, start: str, end: str) -> List[Tuple[int, int, str]]:
+        """終了時刻が [start, end) のログを (user_id, duration_seconds, created_at) で取得"""
+        return await self.execute(
+            "SELECT user_id, duration_seconds, created_at FROM study_logs WHERE created_at >= ? AND created_at < ?",
+            (start, end),
+            fetch_all=True
+        )
+
+    async def save_concurrency_day(self, day: str, peak_users: int, peak_time: Optional[str],
+                                   co_study_seconds: int, pair_seconds: dict) -> None:
+        """1日分の同時作業の集計を置き換える"""
+        try:
+            async with self.get_connection() as db:
+                await db.execute(
+                    "INSERT OR REPLACE INTO concurrency_daily (date, peak_users, peak_time, co_study_seconds) VALUES (?, ?, ?, ?)",
+                    (day, peak_users, peak_time, co_study_seconds)
+                )
+                await db.execute("DELETE FROM co_study_daily WHERE date = ?", (day,))
+                await db.executemany(
+                    "INSERT INTO co_study_daily (date, user_a, user_b, seconds) VALUES (?, ?, ?, ?)",
+                    [(day, user_a, user_b, seconds) for (user_a, user_b), seconds in pair_seconds.items()]
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"同時作業の集計保存エラー ({day}): {e}")
+
+    async def get_concurrency_days(self, start: str, end: str) -> List[Tuple[str, int, Optional[str], int]]:
+        """[start, end] の日別の (date, peak_users, peak_time, co_study_seconds)"""
+        return await self.execute(
+            '''SELECT date, peak_users, peak_time, co_study_seconds FROM concurrency_daily
+               WHERE date >= ? AND date <= ? ORDER BY date''',
+            (start, end),
+            fetch_all=True
+        )
+
+    async def get_co_study_pairs(self, start: str, end: str, limit: int = 10) -> List[Tuple[int, int, int]]:
+        """[start, end] に一緒に作業した時間が長いペア (user_a, user_b, seconds)"""
+        return await self.execute(
+            '''SELECT user_a, user_b, SUM(seconds) AS total FROM co_study_daily
+               WHERE date >= ? AND date <= ?
+               GROUP BY user_a, user_b ORDER BY total DESC LIMIT ?''',
+            (start, end, limit),
+            fetch_all=True
+        )
+
+    async def add_personal_timer(self, user_id: int, end_time_str: str, minutes: int) -> Optional[int]:
+        """個人タイマーを追加 (戻り値: 追加した行の rowid)"""
+        try:
+            async with self.get_connection() as db:
+                cursor = await db.execute(
+                    "INSERT INTO personal_timers VALUES (?, ?, ?)",
+                    (user_id, end_time_str, minutes)
+                )
+                await db.commit()
+                return cursor.lastrowid
+        except Exception as e:
+            logger.error(f"タイマー追加エラー: {e}")
+            return None
+
+    async def get_pending_timers(self) -> List[Tuple[int, int, str, int]]:
+        """未発火の個人タイマーを全件取得 (rowid, user_id, end_time, minutes)"""
+        return await self.execute(
+            "SELECT rowid, user_id, end_time, minutes FROM personal_timers ORDER BY end_time",
+            fetch_all=True
+        )
+
+    async def get_and_delete_expired_timers(self, now_str: str) -> List[Tuple[int, int, int]]:
+        """期限切れタイマーを取得し、取得したものは同時に削除する (rowid, user_id, minutes)
+
+        DELETE ... RETURNING で1文にまとめ、取得と削除の間に別の処理が割り込まないようにする。
+        """
+        try:
+            async with self.get_connection() as db:
+                cursor = await db.execute(
+                    "DELETE FROM personal_timers WHERE end_time <= ? RETURNING rowid, user_id, minutes",
+                    (now_str,)
+                )
+                expired = await cursor.fetchall()
+                await db.commit()
+                return expired
+        except Exception as e:
+            logger.error(f"期限切れタイマー取得エラー: {e}")
+            return []
 
     async def get_user_streak(self, user_id: int) -> int:
         """ユーザーの連続ログイン日数を取得"""
@@ -340,23 +1188,41 @@ class Database:
 
     async def add_tip(self, tip_text: str) -> bool:
         """tipsを追加（重複チェック付き）"""
-        try:
-            await self.execute(
-                "INSERT INTO tips (tip_text, created_at) VALUES (?, ?)",
-                (tip_text, datetime.now().isoformat())
-            )
-            return True
-        except Exception as e:
-            logger.error(f"Tip追加エラー: {e}")
+        result = await self.execute(
+            "INSERT INTO tips (tip_text, created_at) VALUES (?, ?)",
+            (tip_text, datetime.now().isoformat())
+        )
+        if result is None:
+            # UNIQUE 制約違反などのエラーは execute 側でログ出力済み
             return False
+        await self._load_tips()
+        return True
+
+    async def _load_tips(self) -> None:
+        """Tips を読み直す。袋に残っているものはそのまま、新しい Tip は袋に加える"""
+        rows = await self.execute("SELECT tip_text FROM tips", fetch_all=True)
+        tips = [row[0] for row in rows or []]
+        if self._tips is not None:
+            current, known = set(tips), set(self._tips)
+            self._tip_bag = [tip for tip in self._tip_bag if tip in current]
+            self._tip_bag.extend(tip for tip in tips if tip not in known)
+            random.shuffle(self._tip_bag)
+        self._tips = tips
 
     async def get_random_tip(self) -> Optional[str]:
-        """ランダムなtipを取得"""
-        result = await self.execute(
-            "SELECT tip_text FROM tips ORDER BY RANDOM() LIMIT 1",
-            fetch_one=True
-        )
-        return result[0] if result else None
+        """ランダムなtipを取得（全て表示し終わるまで同じ Tip は出さない）"""
+        if self._tips is None:
+            await self._load_tips()
+        if not self._tips:
+            return None
+        if not self._tip_bag:
+            self._tip_bag = list(self._tips)
+            random.shuffle(self._tip_bag)
+            # 袋を詰め直した直後に、直前と同じ Tip が続かないようにする
+            if len(self._tip_bag) > 1 and self._tip_bag[-1] == self._last_tip:
+                self._tip_bag[0], self._tip_bag[-1] = self._tip_bag[-1], self._tip_bag[0]
+        self._last_tip = self._tip_bag.pop()
+        return self._last_tip
 
     async def get_all_tips(self) -> List[Tuple[int, str]]:
         """全てのtipsを取得 (id, tip_text)"""
@@ -371,8 +1237,48 @@ class Database:
             "DELETE FROM tips WHERE id = ?",
             (tip_id,)
         )
+        deleted = result is not None and result > 0
+        if deleted:
+            await self._load_tips()
+        return deleted
+
+    async def get_job_last_run(self, job_name: str) -> Optional[str]:
+        """スケジューラジョブの最終実行時刻を取得"""
+        result = await self.execute(
+            "SELECT last_run FROM scheduler_state WHERE job_name = ?",
+            (job_name,),
+            fetch_one=True
+        )
+        return result[0] if result else None
+
+    async def set_job_last_run(self, job_name: str, last_run: str) -> None:
+        """スケジューラジョブの最終実行時刻を保存"""
+        await self.execute(
+            "INSERT OR REPLACE INTO scheduler_state (job_name, last_run) VALUES (?, ?)",
+            (job_name, last_run)
+        )
+
+    async def get_pomodoro_rooms(self) -> List[Tuple[int, int, int, int, str]]:
+        """ポモドーロ設定済みのボイスチャンネルを全件取得 (channel_id, guild_id, work_minutes, break_minutes, anchor)"""
+        return await self.execute(
+            "SELECT channel_id, guild_id, work_minutes, break_minutes, anchor FROM pomodoro_rooms",
+            fetch_all=True
+        )
+
+    async def set_pomodoro_room(self, channel_id: int, guild_id: int, work_minutes: int, break_minutes: int, anchor: str) -> None:
+        """ポモドーロのスケジュールを設定 (INSERT OR REPLACE)"""
+        await self.execute(
+            '''INSERT OR REPLACE INTO pomodoro_rooms (channel_id, guild_id, work_minutes, break_minutes, anchor)
+               VALUES (?, ?, ?, ?, ?)''',
+            (channel_id, guild_id, work_minutes, break_minutes, anchor)
+        )
+
+    async def delete_pomodoro_room(self, channel_id: int) -> bool:
+        """ポモドーロのスケジュールを削除"""
+        result = await self.execute("DELETE FROM pomodoro_rooms WHERE channel_id = ?", (channel_id,))
         return result is not None and result > 0
 
+    @cached(LOGS, per_day=True)
     async def get_last_7_days_summary(self, user_id: int) -> dict:
         """過去7日間の日別作業時間を取得
         
@@ -412,6 +1318,7 @@ class Database:
         
         return result
 
+    @cached(LOGS, per_day=True)
     async def get_hourly_stats(self, user_id: int) -> dict:
         """過去7日間の時間帯別作業時間を取得
         
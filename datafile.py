@@ -0,0 +1,212 @@
+"""学習記録のエクスポート・インポート (CSV / NDJSON、gzip 圧縮にも対応)
+
+エクスポートでは行を async generator から受け取り、そのまま圧縮ファイルへ書き出すため、
+全件をメモリに載せることはない。圧縮後のサイズが上限を超えそうになったら次のファイルに切り替える。
+インポートでも同様に、ファイルを先頭から少しずつ読みながら検証する。
+
+1行は次の項目を持つ (CSV の列順も同じ):
+    type        "session" (study_logs) / "daily" (daily_summary)
+    user_id
+    username
+    date        YYYY-MM-DD (daily のみ)
+    start_time  ISO 形式 (session のみ)
+    end_time    ISO 形式 (session のみ)
+    seconds
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Tuple
+
+FIELDS = ("type", "user_id", "username", "date", "start_time", "end_time", "seconds")
+FORMATS = ("csv", "ndjson")
+MAX_SESSION_SECONDS = 7 * 24 * 3600
+
+
+def session_record(user_id, username, start_time, seconds, end_time) -> dict:
+    return {"type": "session", "user_id": user_id, "username": username, "date": None,
+            "start_time": start_time, "end_time": end_time, "seconds": seconds}
+
+
+def daily_record(user_id, username, date_str, seconds) -> dict:
+    return {"type": "daily", "user_id": user_id, "username": username, "date": date_str,
+            "start_time": None, "end_time": None, "seconds": seconds}
+
+
+class ExportWriter:
+    """レコードを gzip 圧縮した CSV / NDJSON ファイルに書き出す (上限サイズごとに分割)"""
+
+    def __init__(self, basename: str, fmt: str = "csv", max_bytes: int = 8 * 1024 * 1024,
+                 margin: int = 256 * 1024):
+        if fmt not in FORMATS:
+            raise ValueError(f"未対応の形式です: {fmt}")
+        self.basename = basename
+        self.fmt = fmt
+        # gzip は内部にバッファを持つため、書き込み済みサイズには余裕を持たせて判定する
+        self.limit = max_bytes - margin
+        self.workdir = tempfile.mkdtemp(prefix="export_")
+        self.paths: List[str] = []
+        self.rows = 0
+        self._raw = None
+        self._gzip = None
+        self._text = None
+        self._csv = None
+
+    def _open_part(self) -> None:
+        self._close_part()
+        ext = "csv" if self.fmt == "csv" else "ndjson"
+        path = os.path.join(self.workdir, f"{self.basename}_part{len(self.paths) + 1}.{ext}.gz")
+        self.paths.append(path)
+        self._raw = open(path, "wb")
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6)
+        self._text = io.TextIOWrapper(self._gzip, encoding="utf-8", newline="")
+        if self.fmt == "csv":
+            self._csv = csv.DictWriter(self._text, fieldnames=FIELDS)
+            self._csv.writeheader()
+
+    def _close_part(self) -> None:
+        if self._text is not None:
+            self._text.close()  # gzip と元のファイルも閉じる
+            self._raw.close()
+        self._raw = self._gzip = self._text = self._csv = None
+
+    def write(self, record: dict) -> None:
+        if self._raw is None or self._raw.tell() >= self.limit:
+            self._open_part()
+        if self._csv is not None:
+            self._csv.writerow(record)
+        else:
+            self._text.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.rows += 1
+
+    async def write_all(self, records: AsyncIterator[dict]) -> int:
+        async for record in records:
+            self.write(record)
+        return self.rows
+
+    def close(self) -> List[str]:
+        """書き出しを終えてファイルの一覧を返す (0件でもヘッダだけのファイルを1つ作る)"""
+        if self._raw is None and not self.paths:
+            self._open_part()
+        self._close_part()
+        return self.paths
+
+    def cleanup(self) -> None:
+        self._close_part()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(os.path.getsize(p) for p in self.paths if os.path.exists(p))
+
+
+def _to_local(dt: datetime) -> datetime:
+    """オフセット付きの日時をタイムゾーンなしのローカル時刻にする (なしの場合はそのまま)"""
+    if dt.tzinfo is not None:
+        return dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+class ImportReader:
+    """CSV / NDJSON (gzip 可) を少しずつ読み、検証済みのセッション行を返す
+
+    gzip かどうかは先頭のバイト、CSV / NDJSON は先頭行で判定する。type が "session" 以外 (daily など) の行は読み飛ばす。
+    返す行は (user_id, username, start_time, seconds, end_time)。日時は ISO 形式の文字列に正規化する。
+    """
+
+    def __init__(self, path: str, max_errors: int = 10):
+        self.path = path
+        self.max_errors = max_errors
+        self.line_no = 0
+        self.invalid = 0
+        self.skipped = 0
+        self.errors: List[str] = []
+        self._file = None
+        self._rows = None
+
+    def _open(self) -> None:
+        with open(self.path, "rb") as f:
+            gzipped = f.read(2) == b"\x1f\x8b"
+        raw = gzip.open(self.path, "rb") if gzipped else open(self.path, "rb")
+        self._file = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+        head = self._file.readline()
+        if head.lstrip().startswith("{"):
+            self._rows = self._ndjson_rows(head)
+        else:
+            self._rows = self._csv_rows(head)
+
+    def _csv_rows(self, head: str):
+        reader = csv.DictReader(self._file, fieldnames=next(csv.reader([head])))
+        for row in reader:
+            yield row
+
+    def _ndjson_rows(self, head: str):
+        yield self._parse_json(head)
+        for line in self._file:
+            if line.strip():
+                yield self._parse_json(line)
+
+    @staticmethod
+    def _parse_json(line: str):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        return record if isinstance(record, dict) else None
+
+    def _record_error(self, message: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(f"{self.line_no}件目: {message}")
+
+    @staticmethod
+    def validate(record: dict) -> Tuple[int, str, str, int, str]:
+        """1行を検証して (user_id, username, start_time, seconds, end_time) に変換する (不正なら ValueError)"""
+        user_id = int(record.get("user_id") or 0)
+        if user_id <= 0:
+            raise ValueError("user_id が不正です")
+        seconds_value = record.get("seconds")
+        if seconds_value in (None, ""):
+            raise ValueError("seconds がありません")
+        seconds = int(float(seconds_value))
+        if abs(seconds) > MAX_SESSION_SECONDS:
+            raise ValueError("seconds が大きすぎます")
+        # DB と同じくタイムゾーンなしのローカル時刻で保存する (オフセット付きの時刻はローカル時刻に変換する)
+        start = _to_local(datetime.fromisoformat(str(record.get("start_time") or "")))
+        end_value = record.get("end_time")
+        end = _to_local(datetime.fromisoformat(str(end_value))) if end_value else start + timedelta(seconds=max(seconds, 0))
+        if end < start:
+            raise ValueError("end_time が start_time より前です")
+        username = str(record.get("username") or user_id)
+        return user_id, username, start.isoformat(), seconds, end.isoformat()
+
+    def read_chunk(self, size: int) -> List[Tuple[int, str, str, int, str]]:
+        """最大 size 件の有効な行を読む (ファイル末尾で空リスト)。ブロッキング処理のため asyncio.to_thread から呼ぶ"""
+        if self._rows is None:
+            self._open()
+        chunk = []
+        for record in self._rows:
+            self.line_no += 1
+            if record is None:
+                self._record_error("JSON として読めません")
+                continue
+            if (record.get("type") or "session") != "session":
+                self.skipped += 1
+                continue
+            try:
+                chunk.append(self.validate(record))
+            except (TypeError, ValueError) as e:
+                self._record_error(str(e) or "値が不正です")
+                continue
+            if len(chunk) >= size:
+                break
+        return chunk
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
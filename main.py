@@ -6,6 +6,8 @@ import sys
 import logging
 from config import Config
 from database import Database
+from archive import LogArchive
+from scheduler import Scheduler
 from messages import Colors
 import utils
 import traceback
@@ -23,7 +25,13 @@ class WorkTimerBot(commands.Bot):
         super().__init__(command_prefix='!', intents=intents, help_command=None)
         
         # データベース管理
-        self.db = Database(Config.DB_PATH)
+        self.db = Database(Config.DB_PATH, cache_ttl=Config.QUERY_CACHE_SECONDS)
+
+        # 保持期間を過ぎたログのアーカイブ (無効時は None)
+        self.archive = LogArchive(Config.ARCHIVE_DIR) if Config.ARCHIVE_ENABLED else None
+
+        # 全Cog共通のスケジューラ (各Cogはここにジョブを登録する)
+        self.scheduler = Scheduler(self.db, wait_until_ready=self.wait_until_ready)
         
         # 設定の保持 (互換性のため、またはアクセスしやすくするため)
         # 必要な場合は Config クラスを直接参照しても良い
@@ -32,6 +40,7 @@ class WorkTimerBot(commands.Bot):
     async def setup_hook(self):
         """起動時の初期化処理"""
         await self.db.setup()
+        self.scheduler.start()
         
         # Extension(Cog)の読み込み
         initial_extensions = [
@@ -40,7 +49,8 @@ class WorkTimerBot(commands.Bot):
             'cogs.timer_cog',
             'cogs.admin',
             'cogs.status',
-            'cogs.pomodoro'
+            'cogs.pomodoro',
+            'cogs.export'
         ]
         
         for extension in initial_extensions:
@@ -96,6 +106,7 @@ class WorkTimerBot(commands.Bot):
     async def close(self):
         """Bot停止時に実行される処理"""
         logger.info("Botの停止処理を開始します...")
+        self.scheduler.stop()
         try:
             # 終了通知
             channel_id = Config.LOG_CHANNEL_ID
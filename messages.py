@@ -47,6 +47,8 @@ MESSAGES = {
     "rank": {
         "empty_message": "今週はまだ誰も作業していません...！一番乗りを目指しましょう！🏃‍♂️",
         "embed_title": "🏆 今週の作業時間ランキング",
+        "period_title": "🏆 作業時間ランキング ({period})",
+        "empty_message_period": "{period}の記録はまだありません。",
         "embed_desc": "",
         "embed_color": Colors.GOLD, # 金色
         "row": "{icon} **{name}**: {time}\n"
@@ -113,9 +115,11 @@ MESSAGES = {
         "embed_desc": "作業通話を記録・応援するボットです。\nVCに入ると自動で計測が始まります。",
         "embed_color": Colors.GRAY, # グレー
         "commands": [
-            ("🏆 `/rank`", "今週の作業時間ランキングを表示します。"),
+            ("🏆 `/rank top [期間]`", "作業時間ランキングを表示します（省略時は今週）。"),
+            ("📜 `/rank history`", "過去の週間・月間ランキングを表示します。"),
             ("📊 `/stats`", "あなたのこれまでの累計作業時間を表示します。"),
             ("📝 `/task [内容]`", "現在取り組んでいるタスク内容を設定します。"),
+            ("🔍 `/task_search [キーワード]`", "これまでに設定したタスクを検索し、それぞれの作業時間を表示します。"),
             ("🗣️ `/reading [名前]`", "読み上げ用の名前(読み仮名)を設定します。"),
             ("⏰ `/timer [分]`", "個人用タイマーをセットします。"),
             ("✏️ `/add`", "[管理者] 時間を手動で修正します。"),
@@ -0,0 +1,88 @@
+import asyncio
+import bisect
+import logging
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class MilestoneEngine:
+    """累計時間の称号判定をメモリ上で行うエンジン
+
+    起動時に集計テーブルからユーザーごとの累計秒数を1回のクエリで読み込み、
+    以降はセッション終了ごとに加算するだけで判定する。
+    ユーザーごとに次の閾値を保持しているため、閾値を超えない限り比較1回で終わる。
+    """
+
+    def __init__(self, db, milestones: Optional[Dict[int, str]] = None):
+        self.db = db
+        milestones = Config.MILESTONES if milestones is None else milestones
+        # (閾値秒数, ロール名) を昇順で保持
+        self.thresholds: List[Tuple[int, str]] = sorted((hours * 3600, name) for hours, name in milestones.items())
+        self._threshold_seconds = [seconds for seconds, _ in self.thresholds]
+        self.totals: Dict[int, int] = {}
+        self.next_index: Dict[int, int] = {}
+        self._loaded = asyncio.Event()
+        # ギルドごとのロール名 → ロールID
+        self._role_ids: Dict[int, Dict[str, int]] = {}
+
+    async def load(self) -> None:
+        """全ユーザーの累計秒数を日別・月別集計から読み込む"""
+        try:
+            rows = await self.db.get_tiered_totals(date.min, date.max)
+            self.totals = {user_id: total for user_id, total in rows}
+            self.next_index = {user_id: self._index_for(total) for user_id, total in self.totals.items()}
+            logger.info(f"称号エンジン: {len(self.totals)} 名の累計時間を読み込みました。")
+        except Exception as e:
+            logger.error(f"称号エンジンの初期化に失敗しました: {e}")
+        finally:
+            self._loaded.set()
+
+    def _index_for(self, total_seconds: int) -> int:
+        """total_seconds の時点でまだ達成していない最初の閾値のインデックス"""
+        # 従来どおり「時間」単位で比較する (hours <= total_hours で達成)
+        return bisect.bisect_right(self._threshold_seconds, (total_seconds // 3600) * 3600)
+
+    def next_threshold(self, user_id: int) -> Optional[int]:
+        index = self.next_index.get(user_id, 0)
+        return self._threshold_seconds[index] if index < len(self._threshold_seconds) else None
+
+    async def record(self, user_id: int, seconds: int) -> List[str]:
+        """保存済みのセッション分を加算し、今回新たに達成した称号 (ロール名) を返す"""
+        await self._loaded.wait()
+        total = self.totals.get(user_id, 0) + seconds
+        self.totals[user_id] = total
+        index = self.next_index.get(user_id, 0)
+        if index >= len(self._threshold_seconds) or total < self._threshold_seconds[index]:
+            return []
+
+        new_index = self._index_for(total)
+        self.next_index[user_id] = new_index
+        return [name for _, name in self.thresholds[index:new_index]]
+
+    async def adjust(self, user_id: int, seconds: int) -> None:
+        """手動調整などで累計が変わった場合に反映する (称号は付与しない)"""
+        await self._loaded.wait()
+        total = self.totals.get(user_id, 0) + seconds
+        self.totals[user_id] = total
+        self.next_index[user_id] = self._index_for(total)
+
+    def resolve_role(self, guild, role_name: str):
+        """ロール名からロールを取得する（ギルドごとに ID をキャッシュ）"""
+        role_ids = self._role_ids.get(guild.id)
+        if role_ids is not None and role_name in role_ids:
+            role = guild.get_role(role_ids[role_name])
+            if role is not None and role.name == role_name:
+                return role
+
+        # キャッシュにない・古い場合はこのギルドのロール一覧から作り直す
+        names = {name for _, name in self.thresholds}
+        self._role_ids[guild.id] = {role.name: role.id for role in guild.roles if role.name in names}
+        role_id = self._role_ids[guild.id].get(role_name)
+        return guild.get_role(role_id) if role_id is not None else None
+
+    def invalidate_roles(self, guild_id: int) -> None:
+        self._role_ids.pop(guild_id, None)
@@ -0,0 +1,136 @@
+"""Database の読み取りメソッドの結果キャッシュ
+
+引数ごとに結果を保持し、TTL を過ぎるか、依存するテーブル群の世代番号が書き込みで進むと無効になる。
+世代番号はクエリを実行する前に控えておくため、実行中に書き込みがあった結果は次回の参照で捨てられる。
+同じ引数の呼び出しが同時に来た場合は、最初の1回のクエリ結果を共有する (最初の呼び出しがキャンセルされた場合は、待っていた側が読み込み直す)。
+"""
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Hashable, Tuple
+
+
+def _copy(value):
+    # 呼び出し側が結果のリスト・辞書を書き換えてもキャッシュが壊れないようにする
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+
+class QueryCache:
+    """TTL と世代番号で無効化する LRU キャッシュ"""
+
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Tuple[int, ...], object]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _generation(self, groups: Tuple[str, ...]) -> Tuple[int, ...]:
+        return tuple(self._generations.get(group, 0) for group in groups)
+
+    def invalidate(self, *groups: str) -> None:
+        """書き込みのあったテーブル群の世代を進める (そのテーブル群に依存する結果はすべて無効になる)"""
+        for group in groups:
+            self._generations[group] = self._generations.get(group, 0) + 1
+
+    def _count(self, name: str, outcome: str) -> None:
+        stats = self._stats.setdefault(name, {"hits": 0, "misses": 0})
+        stats[outcome] += 1
+
+    async def get_or_load(self, name: str, key: Hashable, groups: Tuple[str, ...], loader):
+        now = time.monotonic()
+        generation = self._generation(groups)
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, stored_generation, value = entry
+            if now - stored_at <= self.ttl and stored_generation == generation:
+                self._entries.move_to_end(key)
+                self._count(name, "hits")
+                return _copy(value)
+            del self._entries[key]
+
+        # 実行中の同じクエリがあれば結果を共有する (その後に書き込みがあった場合は共有しない)
+        inflight_key = (key, generation)
+        inflight = self._inflight.get(inflight_key)
+        if inflight is not None:
+            self._count(name, "hits")
+            # 待っている側がキャンセルされても共有中のクエリは止めない
+            await asyncio.wait((inflight,))
+            if inflight.cancelled():
+                # 最初の呼び出しがキャンセルされた場合は、その取り消しを受け継がずに読み込み直す
+                return await self.get_or_load(name, key, groups, loader)
+            return _copy(inflight.result())
+
+        self._count(name, "misses")
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[inflight_key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 待っている呼び出しがなくても "exception was never retrieved" を出さない
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(inflight_key, None)
+        future.set_result(value)
+
+        self._entries[key] = (now, generation, value)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return _copy(value)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """メソッドごとのヒット数・ミス数・ヒット率"""
+        result = {}
+        for name, stats in sorted(self._stats.items()):
+            total = stats["hits"] + stats["misses"]
+            result[name] = {**stats, "hit_rate": stats["hits"] / total if total else 0.0}
+        return result
+
+    @property
+    def size(self) -> int:
+        return len(self._entries)
+
+
+def cached(*groups: str, per_day: bool = False):
+    """Database の読み取りメソッドを引数ごとにキャッシュするデコレータ
+
+    groups: 結果が依存するテーブル群 (Database 側で書き込み時に invalidate する名前)
+    per_day: 「今日」を基準に集計するメソッドは日付もキーに含める
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            cache = getattr(self, "cache", None)
+            if cache is None:
+                return await func(self, *args, **kwargs)
+            key = (func.__name__, args, tuple(sorted(kwargs.items())), date.today() if per_day else None)
+            return await cache.get_or_load(func.__name__, key, groups, lambda: func(self, *args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def invalidates(*groups: str):
+    """書き込みメソッドの実行後に、指定したテーブル群に依存するキャッシュを無効にするデコレータ"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            try:
+                return await func(self, *args, **kwargs)
+            finally:
+                cache = getattr(self, "cache", None)
+                if cache is not None:
+                    cache.invalidate(*groups)
+        return wrapper
+    return decorator
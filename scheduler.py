@@ -0,0 +1,396 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# JSTの定義
+JST = timezone(timedelta(hours=9))
+
+JobCallback = Callable[[], Awaitable[None]]
+
+
+class CronTrigger:
+    """5フィールドの cron 式 (分 時 日 月 曜日) によるトリガー
+
+    `*`, `*/n`, `a-b`, `a-b/n`, `a,b,c` をサポートする。曜日は 0=日曜 (7 も日曜)。
+    時刻は JST の壁時計で評価する。
+    """
+
+    def __init__(self, expr: str, tz: timezone = JST):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron式のフィールド数が不正です: {expr!r}")
+        self.expr = expr
+        self.tz = tz
+        self.minutes = self._parse(fields[0], 0, 59)
+        self.hours = self._parse(fields[1], 0, 23)
+        self.days = self._parse(fields[2], 1, 31)
+        self.months = self._parse(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in self._parse(fields[4], 0, 7)}
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_str = part.split("/", 1)
+                step = int(step_str)
+                if step <= 0:
+                    raise ValueError(f"cron式のステップが不正です: {field!r}")
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start_str, end_str = part.split("-", 1)
+                start, end = int(start_str), int(end_str)
+            else:
+                start = int(part)
+                end = high if step != 1 else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"cron式の値が範囲外です: {field!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, dt: datetime) -> bool:
+        in_days = dt.day in self.days
+        # cron の曜日は 0=日曜、Python の weekday() は 0=月曜
+        in_weekdays = (dt.weekday() + 1) % 7 in self.weekdays
+        if self._any_day:
+            return in_weekdays
+        if self._any_weekday:
+            return in_days
+        # 日・曜日の両方が指定された場合はどちらかに一致すればよい (cron の慣習)
+        return in_days or in_weekdays
+
+    def next_after(self, after: datetime) -> datetime:
+        """after より後で最初に一致する時刻を返す"""
+        dt = after.astimezone(self.tz).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                year = dt.year + (dt.month // 12)
+                month = dt.month % 12 + 1
+                dt = dt.replace(year=year, month=month, day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(dt):
+                dt = (dt + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if dt.hour not in self.hours:
+                dt = (dt + timedelta(hours=1)).replace(minute=0)
+                continue
+            if dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+                continue
+            return dt
+        raise ValueError(f"cron式に一致する時刻がありません: {self.expr!r}")
+
+    def __repr__(self):
+        return f"cron({self.expr})"
+
+
+class IntervalTrigger:
+    """一定間隔で繰り返すトリガー"""
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError("間隔は正の値で指定してください")
+        self.seconds = seconds
+
+    def next_after(self, after: datetime) -> datetime:
+        return after + timedelta(seconds=self.seconds)
+
+    def __repr__(self):
+        return f"every({self.seconds:g}s)"
+
+
+class OneShotTrigger:
+    """指定時刻に一度だけ実行するトリガー"""
+
+    def __init__(self, when: datetime):
+        # タイムゾーン無しの時刻はシステムのローカル時刻として扱う
+        self.when = when.astimezone(JST)
+
+    def next_after(self, after: datetime) -> Optional[datetime]:
+        return None
+
+    def __repr__(self):
+        return f"at({self.when.isoformat()})"
+
+
+class JobMetrics:
+    """ジョブごとの実行時間・遅延の統計"""
+
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.catch_up_runs = 0
+        self.last_started: Optional[datetime] = None
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "catch_up_runs": self.catch_up_runs,
+            "last_started": self.last_started.isoformat() if self.last_started else None,
+            "last_duration": round(self.last_duration, 3),
+            "avg_duration": round(self.total_duration / self.runs, 3) if self.runs else 0.0,
+            "max_duration": round(self.max_duration, 3),
+            "last_lateness": round(self.last_lateness, 3),
+            "max_lateness": round(self.max_lateness, 3),
+        }
+
+
+class Job:
+    def __init__(self, name: str, trigger, callback: JobCallback, catch_up: bool = False):
+        self.name = name
+        self.trigger = trigger
+        self.callback = callback
+        self.catch_up = catch_up
+        self.next_run: Optional[datetime] = None
+        self.is_catch_up_run = False
+        self.running: Optional[asyncio.Task] = None
+        self.metrics = JobMetrics()
+
+
+class Scheduler:
+    """全Cog共通のスケジューラ
+
+    - 次に実行すべきジョブの時刻まで眠り、ジョブが無い間はイベント待ちで何もしない
+    - cron式 (JST)、一定間隔、一回限りの3種類のトリガーをサポート
+    - catch_up=True のジョブは最終実行時刻を DB に保存し、停止中に実行を逃した場合は起動後に一度だけ実行する
+    - ジョブは個別のタスクで実行し、前回の実行が終わっていない場合はスキップする
+    """
+    ERROR_RETRY_SECONDS = 5.0  # ループ内で予期しないエラーが起きた後、再開するまでの待ち時間
+
+    def __init__(self, db=None, wait_until_ready: Optional[Callable[[], Awaitable[None]]] = None):
+        self.db = db
+        self._wait_until_ready = wait_until_ready
+        self._jobs: Dict[str, Job] = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._pending_catch_up: List[Job] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    # --- 登録 ---
+
+    def add_cron(self, name: str, expr: str, callback: JobCallback, catch_up: bool = False) -> Job:
+        """cron式で定期実行するジョブを登録する"""
+        return self._add(Job(name, CronTrigger(expr), callback, catch_up=catch_up))
+
+    def add_daily(self, name: str, hour: int, minute: int, callback: JobCallback, catch_up: bool = False) -> Job:
+        """毎日 JST の指定時刻に実行するジョブを登録する"""
+        return self.add_cron(name, f"{minute} {hour} * * *", callback, catch_up=catch_up)
+
+    def add_interval(self, name: str, seconds: float, callback: JobCallback, run_immediately: bool = False) -> Job:
+        """一定間隔で実行するジョブを登録する（初回は登録から seconds 後、run_immediately なら起動直後）"""
+        job = Job(name, IntervalTrigger(seconds), callback)
+        if run_immediately:
+            job.next_run = datetime.now(JST)
+        return self._add(job)
+
+    def add_oneshot(self, name: str, when: datetime, callback: JobCallback) -> Job:
+        """指定時刻に一度だけ実行するジョブを登録する（同名のジョブは置き換える）"""
+        job = Job(name, OneShotTrigger(when), callback)
+        job.next_run = job.trigger.when
+        return self._add(job)
+
+    def remove(self, name: str) -> None:
+        """ジョブを登録解除する（実行中のものは最後まで実行される）"""
+        job = self._jobs.pop(name, None)
+        if job:
+            job.next_run = None
+
+    def get_job(self, name: str) -> Optional[Job]:
+        return self._jobs.get(name)
+
+    def _add(self, job: Job) -> Job:
+        previous = self._jobs.get(job.name)
+        if previous:
+            # 同名ジョブの置き換え（一回限りのジョブの再登録など）では統計を引き継ぐ
+            job.metrics = previous.metrics
+        self.remove(job.name)
+        if job.next_run is None:
+            job.next_run = job.trigger.next_after(datetime.now(JST))
+        self._jobs[job.name] = job
+        if job.catch_up and self.db is not None:
+            self._pending_catch_up.append(job)
+        self._push(job)
+        return job
+
+    def _push(self, job: Job) -> None:
+        heapq.heappush(self._heap, (job.next_run, next(self._seq), job))
+        if self._heap[0][2] is job:
+            self._wakeup.set()
+
+    # --- 実行ループ ---
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+        for job in self._jobs.values():
+            if job.running and not job.running.done():
+                job.running.cancel()
+
+    async def _run(self):
+        try:
+            if self._wait_until_ready:
+                await self._wait_until_ready()
+
+            while True:
+                try:
+                    await self._run_once()
+                except Exception:
+                    # 1回分の処理が失敗してもループは止めない (止めると全ジョブが再起動まで動かなくなる)
+                    logger.exception("スケジューラのループでエラーが発生しました")
+                    await asyncio.sleep(self.ERROR_RETRY_SECONDS)
+        except asyncio.CancelledError:
+            pass
+
+    async def _run_once(self):
+        """次の実行時刻まで待ち、実行時刻を過ぎたジョブを起動する"""
+        self._wakeup.clear()
+        if self._pending_catch_up:
+            await self._apply_catch_up()
+
+        # 登録解除・置き換え済みのエントリを捨てる
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+
+        if not self._heap:
+            await self._wakeup.wait()
+            return
+
+        next_run = self._heap[0][0]
+        delay = (next_run - datetime.now(JST)).total_seconds()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                return
+            except asyncio.TimeoutError:
+                pass
+
+        now = datetime.now(JST)
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if not self._is_live(entry):
+                continue
+            job = entry[2]
+            try:
+                self._dispatch(job, now)
+            except Exception:
+                logger.exception(f"ジョブ {job.name} の起動に失敗しました")
+                # 次回の実行時刻を決められなかったジョブは、止まったまま残さず登録を解除する
+                if job.next_run == entry[0]:
+                    self._jobs.pop(job.name, None)
+
+    def _is_live(self, entry) -> bool:
+        scheduled, _, job = entry
+        return self._jobs.get(job.name) is job and job.next_run == scheduled
+
+    def _dispatch(self, job: Job, now: datetime) -> None:
+        scheduled = job.next_run
+        is_catch_up = job.is_catch_up_run
+        job.is_catch_up_run = False
+
+        # 次回の実行時刻を決める（大きく遅れた場合は逃した回をまとめて1回とする）
+        next_run = job.trigger.next_after(scheduled)
+        if next_run is not None and next_run <= now:
+            next_run = job.trigger.next_after(now)
+        job.next_run = next_run
+        if next_run is None:
+            self._jobs.pop(job.name, None)
+        else:
+            self._push(job)
+
+        if job.running and not job.running.done():
+            job.metrics.skipped += 1
+            logger.warning(f"ジョブ {job.name} は前回の実行が終わっていないためスキップしました")
+            return
+
+        job.running = asyncio.create_task(self._execute(job, scheduled, is_catch_up))
+
+    async def _execute(self, job: Job, scheduled: datetime, is_catch_up: bool):
+        metrics = job.metrics
+        started_at = datetime.now(JST)
+        lateness = max(0.0, (started_at - scheduled).total_seconds())
+        started = time.monotonic()
+        try:
+            await job.callback()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            metrics.failures += 1
+            logger.exception(f"ジョブ {job.name} の実行中にエラーが発生しました")
+        finally:
+            duration = time.monotonic() - started
+            metrics.runs += 1
+            metrics.last_started = started_at
+            metrics.last_duration = duration
+            metrics.total_duration += duration
+            metrics.max_duration = max(metrics.max_duration, duration)
+            if not is_catch_up:
+                metrics.last_lateness = lateness
+                metrics.max_lateness = max(metrics.max_lateness, lateness)
+            else:
+                metrics.catch_up_runs += 1
+
+        if job.catch_up and self.db is not None:
+            await self.db.set_job_last_run(job.name, started_at.isoformat())
+
+    async def _apply_catch_up(self):
+        """停止中に実行を逃したジョブを即時実行キューに入れる"""
+        jobs, self._pending_catch_up = self._pending_catch_up, []
+        now = datetime.now(JST)
+        for job in jobs:
+            if self._jobs.get(job.name) is not job:
+                continue
+            last_run_str = await self.db.get_job_last_run(job.name)
+            if not last_run_str:
+                # 初回登録時は基準時刻だけを記録する
+                await self.db.set_job_last_run(job.name, now.isoformat())
+                continue
+            try:
+                last_run = datetime.fromisoformat(last_run_str)
+            except ValueError:
+                logger.error(f"ジョブ {job.name} の最終実行時刻が不正です: {last_run_str}")
+                continue
+            if last_run.tzinfo is None:
+                last_run = last_run.replace(tzinfo=JST)
+
+            missed = job.trigger.next_after(last_run)
+            if missed is not None and missed < now:
+                logger.info(f"ジョブ {job.name} は {missed.isoformat()} の実行を逃したため、今すぐ実行します")
+                job.next_run = missed
+                job.is_catch_up_run = True
+                self._push(job)
+
+    # --- 状態 ---
+
+    def metrics(self) -> Dict[str, dict]:
+        """ジョブごとの統計と次回実行時刻を返す"""
+        result = {}
+        for name, job in sorted(self._jobs.items(), key=lambda kv: kv[1].next_run or datetime.max.replace(tzinfo=JST)):
+            data = job.metrics.as_dict()
+            data["trigger"] = repr(job.trigger)
+            data["next_run"] = job.next_run.isoformat() if job.next_run else None
+            result[name] = data
+        return result
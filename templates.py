@@ -0,0 +1,109 @@
+"""messages.py のメッセージテンプレートを事前に解析しておく仕組み
+
+起動時に MESSAGES の Embed 設定 (embed_title / embed_desc / fields) を1度だけ解析し、
+文字列ごとにリテラルと差し込み項目の並び・必要な項目名の集合を持つ CompiledTemplate にする。
+書式の誤り ("{name" の閉じ忘れ、位置引数 "{}" など) は読み込み時に ValueError になるため、
+入退室などのイベント処理中に初めて気づくことはない。
+"""
+import logging
+import string
+from typing import Dict, FrozenSet, List, Tuple
+
+import discord
+
+from messages import Colors
+
+logger = logging.getLogger(__name__)
+
+_formatter = string.Formatter()
+_CONVERSIONS = ("s", "r", "a")
+
+
+class CompiledTemplate:
+    """str.format 形式のテンプレート1つ分（キーワード引数のみ対応）
+
+    書式は解析時に検証し、必要な項目名の集合を持っておく。差し込みは項目がそろっている場合だけ行うため、
+    描画時に例外を発生させて元に戻すことはない。
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        placeholders = set()
+        try:
+            for _, field_name, _, conversion in _formatter.parse(text):
+                if field_name is None:
+                    continue
+                root = field_name.split(".", 1)[0].split("[", 1)[0]
+                if not root or root.isdigit():
+                    raise ValueError(f"位置引数の差し込み項目は使えません: {{{field_name}}}")
+                if conversion and conversion not in _CONVERSIONS:
+                    raise ValueError(f"不明な変換指定です: !{conversion}")
+                placeholders.add(root)
+        except ValueError as e:
+            raise ValueError(f"テンプレートの書式が不正です: {text!r} ({e})") from None
+        self.placeholders: FrozenSet[str] = frozenset(placeholders)
+        self._format_map = text.format_map
+        # 差し込み項目の無いテンプレートは、エスケープ ("{{" / "}}") を戻した結果を先に作っておく
+        self._literal = text.format_map({}) if not placeholders else None
+
+    def render(self, values: dict) -> str:
+        """値を差し込んだ文字列を返す（項目が足りない・書式が合わない場合は元の文字列のまま）"""
+        if self._literal is not None:
+            return self._literal
+        if not self.placeholders <= values.keys():
+            return self.text
+        try:
+            return self._format_map(values)
+        except Exception:
+            return self.text
+
+
+class EmbedTemplate:
+    """Embed 設定1つ分を解析済みの形で持ち、キーワード引数から Embed を作る"""
+
+    def __init__(self, config: dict, name: str = ""):
+        self.name = name
+        # 色は Colour に変換しておく (Embed 側で毎回 int から変換しない)
+        color = config.get("embed_color", Colors.GRAY)
+        self.color = color if isinstance(color, discord.Colour) else discord.Colour(color)
+        try:
+            self.title = CompiledTemplate(config.get("embed_title") or "")
+            self.description = CompiledTemplate(config.get("embed_description") or config.get("embed_desc") or "")
+            self.fields: List[Tuple[CompiledTemplate, CompiledTemplate, bool]] = []
+            fields = config.get("fields")
+            if isinstance(fields, list):
+                for field in fields:
+                    self.fields.append((
+                        CompiledTemplate(field.get("name", "")),
+                        CompiledTemplate(field.get("value", "")),
+                        field.get("inline", False)
+                    ))
+        except ValueError as e:
+            raise ValueError(f"MESSAGES[{name!r}]: {e}") from None
+
+        placeholders = set(self.title.placeholders) | set(self.description.placeholders)
+        for field_name, field_value, _ in self.fields:
+            placeholders |= field_name.placeholders | field_value.placeholders
+        self.placeholders: FrozenSet[str] = frozenset(placeholders)
+
+    def render(self, **kwargs) -> discord.Embed:
+        if logger.isEnabledFor(logging.DEBUG) and not self.placeholders <= kwargs.keys():
+            logger.debug(f"テンプレート {self.name or '(無名)'} に渡されていない項目: {sorted(self.placeholders - kwargs.keys())}")
+
+        embed = discord.Embed(title=self.title.render(kwargs), description=self.description.render(kwargs), color=self.color)
+        for field_name, field_value, inline in self.fields:
+            value = field_value.render(kwargs)
+            if value:
+                embed.add_field(name=field_name.render(kwargs) or "\u200b", value=value, inline=inline)
+        return embed
+
+
+def is_embed_config(config) -> bool:
+    return isinstance(config, dict) and any(
+        key in config for key in ("embed_title", "embed_description", "embed_desc", "fields")
+    )
+
+
+def compile_embed_templates(messages: dict) -> Dict[str, EmbedTemplate]:
+    """MESSAGES のうち Embed 設定であるものをすべて解析する（書式の誤りがあれば ValueError）"""
+    return {name: EmbedTemplate(config, name) for name, config in messages.items() if is_embed_config(config)}
@@ -0,0 +1,81 @@
+import random
+from datetime import datetime
+
+from concurrency import session_intervals, sweep
+
+
+def brute_force(intervals):
+    """1秒ごとに在室者を数える (テスト用の素朴な実装)"""
+    end = max((e for _, _, e in intervals), default=0)
+    peak, pairs = 0, {}
+    for t in range(end):
+        present = sorted({user for user, s, e in intervals if s <= t < e})
+        peak = max(peak, len(present))
+        for i, a in enumerate(present):
+            for b in present[i + 1:]:
+                pairs[(a, b)] = pairs.get((a, b), 0) + 1
+    return peak, pairs
+
+
+def test_peak_and_pair_overlap():
+    result = sweep([(1, 0, 100), (2, 50, 150), (3, 80, 90)])
+    assert result.peak_users == 3
+    assert result.peak_at == 80
+    assert result.pair_seconds == {(1, 2): 50, (1, 3): 10, (2, 3): 10}
+    assert result.co_study_seconds == 50
+
+
+def test_leave_before_join_at_same_instant():
+    # 同時刻の退出と入室は入れ替わりとして扱い、2人同時にはならない
+    result = sweep([(1, 0, 100), (2, 100, 200)])
+    assert result.peak_users == 1
+    assert result.pair_seconds == {}
+    assert result.co_study_seconds == 0
+
+
+def test_same_user_overlapping_intervals_count_once():
+    result = sweep([(1, 0, 100), (1, 50, 150), (2, 60, 120)])
+    assert result.peak_users == 2
+    assert result.pair_seconds == {(1, 2): 60}
+
+
+def test_same_user_touching_intervals_are_merged():
+    # 日次分割などで同じ人の区間が接していても、相手との重なりは途切れない
+    result = sweep([(1, 0, 100), (1, 100, 200), (2, 50, 150)])
+    assert result.pair_seconds == {(1, 2): 100}
+    assert result.timeline[-1] == (200, 0)
+
+
+def test_empty():
+    result = sweep([])
+    assert result.peak_users == 0
+    assert result.peak_at is None
+    assert result.pair_seconds == {}
+
+
+def test_matches_brute_force():
+    rng = random.Random(0)
+    intervals = []
+    for _ in range(60):
+        start = rng.randrange(0, 2000)
+        intervals.append((rng.randrange(1, 8), start, start + rng.randrange(1, 400)))
+    result = sweep(intervals)
+    peak, pairs = brute_force(intervals)
+    assert result.peak_users == peak
+    assert result.pair_seconds == pairs
+
+
+def test_session_intervals_are_clipped_to_the_day():
+    day_start = datetime(2024, 1, 2)
+    day_end = datetime(2024, 1, 3)
+    rows = [
+        (1, 3600, "2024-01-02T00:30:00"),  # 前日から続くセッション
+        (2, 600, "2024-01-02T12:00:00"),
+        (3, 7200, "2024-01-03T01:00:00"),  # 翌日に終わるセッション
+        (4, 60, "broken"),
+    ]
+    assert session_intervals(rows, day_start, day_end) == [
+        (1, 0, 1800),
+        (2, 42600, 43200),
+        (3, 82800, 86400),
+    ]
@@ -0,0 +1,104 @@
+import gzip
+import json
+import os
+import time
+
+import pytest
+
+from datafile import FIELDS, ImportReader
+
+
+@pytest.fixture
+def tokyo(monkeypatch):
+    monkeypatch.setenv("TZ", "Asia/Tokyo")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def write_csv(path, rows, compress=False):
+    lines = [",".join(FIELDS)] + [",".join("" if row.get(f) is None else str(row.get(f)) for f in FIELDS) for row in rows]
+    data = ("\n".join(lines) + "\n").encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(gzip.compress(data) if compress else data)
+
+
+def write_ndjson(path, lines):
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write((line if isinstance(line, str) else json.dumps(line)) + "\n")
+
+
+def read_all(path):
+    reader = ImportReader(path)
+    rows = []
+    while True:
+        chunk = reader.read_chunk(2)
+        if not chunk:
+            break
+        rows.extend(chunk)
+    reader.close()
+    return reader, rows
+
+
+SESSION = {"type": "session", "user_id": 1, "username": "a",
+           "start_time": "2024-01-01T09:00:00", "end_time": "2024-01-01T10:00:00", "seconds": 3600}
+
+
+def test_aware_times_are_converted_to_local(tokyo):
+    row = ImportReader.validate({**SESSION, "start_time": "2024-01-01T00:00:00+00:00",
+                                 "end_time": "2024-01-01T01:00:00+00:00"})
+    assert row == (1, "a", "2024-01-01T09:00:00", 3600, "2024-01-01T10:00:00")
+
+
+def test_aware_time_can_move_to_next_local_day(tokyo):
+    row = ImportReader.validate({**SESSION, "start_time": "2024-01-01T15:30:00+00:00",
+                                 "end_time": "2024-01-01T16:00:00+00:00", "seconds": 1800})
+    assert row[4] == "2024-01-02T01:00:00"
+
+
+def test_naive_times_are_kept(tokyo):
+    assert ImportReader.validate(SESSION) == (1, "a", "2024-01-01T09:00:00", 3600, "2024-01-01T10:00:00")
+
+
+def test_missing_end_time_is_derived_from_seconds():
+    row = ImportReader.validate({**SESSION, "end_time": None, "seconds": 600})
+    assert row[4] == "2024-01-01T09:10:00"
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_csv_detection(tmp_path, compress):
+    path = os.path.join(tmp_path, "logs.csv")
+    write_csv(path, [SESSION, {"type": "daily", "user_id": 1, "username": "a", "date": "2024-01-01", "seconds": 60}],
+              compress=compress)
+    reader, rows = read_all(path)
+    assert rows == [(1, "a", "2024-01-01T09:00:00", 3600, "2024-01-01T10:00:00")]
+    assert reader.skipped == 1
+    assert reader.invalid == 0
+
+
+def test_ndjson_detection(tmp_path):
+    path = os.path.join(tmp_path, "logs.ndjson")
+    write_ndjson(path, [SESSION, {**SESSION, "user_id": 2}])
+    reader, rows = read_all(path)
+    assert [row[0] for row in rows] == [1, 2]
+    assert reader.invalid == 0
+
+
+def test_invalid_rows_are_counted(tmp_path):
+    path = os.path.join(tmp_path, "logs.ndjson")
+    write_ndjson(path, [
+        SESSION,
+        "{not json",
+        [1, 2, 3],
+        {**SESSION, "user_id": 0},
+        {**SESSION, "seconds": ""},
+        {**SESSION, "end_time": "2024-01-01T08:00:00"},
+        {**SESSION, "start_time": "yesterday"},
+        {**SESSION, "user_id": 3},
+    ])
+    reader, rows = read_all(path)
+    assert [row[0] for row in rows] == [1, 3]
+    assert reader.invalid == 6
+    assert reader.errors[0].startswith("2件目")
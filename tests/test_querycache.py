@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+import querycache
+from querycache import QueryCache
+
+
+class Loader:
+    """呼び出し回数を数えるローダー (gate が与えられた場合は開くまで待つ)"""
+
+    def __init__(self, value="result", gate: asyncio.Event = None):
+        self.value = value
+        self.gate = gate
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        return self.value
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(querycache.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.mark.asyncio
+async def test_hit_within_ttl(clock):
+    cache = QueryCache(ttl=60)
+    loader = Loader([1, 2])
+
+    assert await cache.get_or_load("q", "k", ("logs",), loader) == [1, 2]
+    clock[0] += 59
+    assert await cache.get_or_load("q", "k", ("logs",), loader) == [1, 2]
+    assert loader.calls == 1
+    assert cache.stats()["q"]["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_ttl_expiry(clock):
+    cache = QueryCache(ttl=60)
+    loader = Loader()
+
+    await cache.get_or_load("q", "k", ("logs",), loader)
+    clock[0] += 61
+    await cache.get_or_load("q", "k", ("logs",), loader)
+    assert loader.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_generation_invalidation(clock):
+    cache = QueryCache(ttl=60)
+    loader = Loader()
+
+    await cache.get_or_load("q", "k", ("logs",), loader)
+    cache.invalidate("rollups")
+    await cache.get_or_load("q", "k", ("logs",), loader)
+    assert loader.calls == 1
+
+    cache.invalidate("logs")
+    await cache.get_or_load("q", "k", ("logs",), loader)
+    assert loader.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_result_is_copied(clock):
+    cache = QueryCache(ttl=60)
+    loader = Loader([1])
+
+    first = await cache.get_or_load("q", "k", ("logs",), loader)
+    first.append(2)
+    assert await cache.get_or_load("q", "k", ("logs",), loader) == [1]
+
+
+@pytest.mark.asyncio
+async def test_inflight_shared():
+    cache = QueryCache(ttl=60)
+    gate = asyncio.Event()
+    loader = Loader("shared", gate)
+
+    tasks = [asyncio.create_task(cache.get_or_load("q", "k", ("logs",), loader)) for _ in range(3)]
+    await asyncio.sleep(0)
+    gate.set()
+    assert await asyncio.gather(*tasks) == ["shared"] * 3
+    assert loader.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_inflight_not_shared_after_write():
+    cache = QueryCache(ttl=60)
+    gate = asyncio.Event()
+    loader = Loader("value", gate)
+
+    first = asyncio.create_task(cache.get_or_load("q", "k", ("logs",), loader))
+    await asyncio.sleep(0)
+    cache.invalidate("logs")
+    second = asyncio.create_task(cache.get_or_load("q", "k", ("logs",), loader))
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(first, second)
+    assert loader.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_first_caller_does_not_cancel_waiters():
+    cache = QueryCache(ttl=60)
+    gate = asyncio.Event()
+    loader = Loader("value", gate)
+
+    first = asyncio.create_task(cache.get_or_load("q", "k", ("logs",), loader))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get_or_load("q", "k", ("logs",), loader))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    await asyncio.sleep(0)
+    gate.set()
+    assert await waiter == "value"
+    assert first.cancelled()
+    assert loader.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_query():
+    cache = QueryCache(ttl=60)
+    gate = asyncio.Event()
+    loader = Loader("value", gate)
+
+    first = asyncio.create_task(cache.get_or_load("q", "k", ("logs",), loader))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get_or_load("q", "k", ("logs",), loader))
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    await asyncio.sleep(0)
+    gate.set()
+    assert await first == "value"
+    assert waiter.cancelled()
+    assert loader.calls == 1
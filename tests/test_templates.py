@@ -0,0 +1,42 @@
+import pytest
+
+from benchmarks.bench_templates import legacy_create_embed, run, sample_kwargs
+from messages import MESSAGES
+from templates import CompiledTemplate, EmbedTemplate
+from utils import EMBED_TEMPLATES, create_embed_from_config
+
+
+@pytest.mark.parametrize("name", sorted(EMBED_TEMPLATES))
+def test_matches_legacy_rendering(name):
+    config = MESSAGES[name]
+    for kwargs in (sample_kwargs(name), {}):
+        assert create_embed_from_config(config, **kwargs).to_dict() == legacy_create_embed(config, **kwargs).to_dict()
+
+
+@pytest.mark.parametrize("text, values, expected", [
+    ("a {{x}}", {}, "a {x}"),
+    ("a {{x}} {y}", {"y": 1}, "a {x} 1"),
+    ("a {{x}} {y}", {}, "a {{x}} {y}"),
+    ("{name} {missing}", {"name": "n"}, "{name} {missing}"),
+    ("", {}, ""),
+])
+def test_render_matches_str_format(text, values, expected):
+    assert CompiledTemplate(text).render(values) == expected
+
+
+@pytest.mark.parametrize("text", ["{name", "{}", "{0}", "{name!x}"])
+def test_errors_surface_at_compile_time(text):
+    with pytest.raises(ValueError):
+        EmbedTemplate({"embed_title": text}, "broken")
+
+
+def test_adhoc_config_is_compiled_on_the_fly():
+    embed = create_embed_from_config({"embed_title": "{a}", "fields": [{"name": "n", "value": "{b}"}]}, a="A", b="B")
+    assert embed.title == "A"
+    assert embed.fields[0].value == "B"
+
+
+def test_benchmark_runs():
+    results = run(number=10)
+    assert set(results) == set(EMBED_TEMPLATES)
+    assert all(legacy > 0 and compiled > 0 for legacy, compiled in results.values())
@@ -0,0 +1,288 @@
+import asyncio
+import io
+import logging
+import math
+import shutil
+import struct
+import time
+import wave
+from typing import AsyncIterator, Dict, List, Optional, Protocol, runtime_checkable
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+@runtime_checkable
+class TTSBackend(Protocol):
+    """音声合成バックエンドのインターフェース
+
+    stream は FFmpeg で再生可能な音声データ (mp3 / wav など) を
+    合成できた分から順にチャンクとして返す。
+    """
+    name: str
+
+    def is_available(self) -> bool:
+        ...
+
+    def stream(self, text: str) -> AsyncIterator[bytes]:
+        ...
+
+
+class EdgeTTSBackend:
+    """edge-tts (Microsoft Edge のオンライン音声合成) を使うバックエンド"""
+    name = "edge"
+
+    def __init__(self, voice: str = Config.TTS_VOICE_NAME):
+        self.voice = voice
+
+    def is_available(self) -> bool:
+        try:
+            import edge_tts  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    async def stream(self, text: str) -> AsyncIterator[bytes]:
+        import edge_tts
+
+        communicate = edge_tts.Communicate(text, self.voice)
+        async for chunk in communicate.stream():
+            if chunk.get("type") == "audio":
+                yield chunk["data"]
+
+
+class LocalTTSBackend:
+    """ローカルの音声合成エンジン (espeak-ng) を使うオフラインバックエンド"""
+    name = "local"
+
+    CHUNK_SIZE = 8192
+
+    def __init__(self, command: str = "espeak-ng", voice: str = "ja"):
+        self.command = command
+        self.voice = voice
+
+    def is_available(self) -> bool:
+        return shutil.which(self.command) is not None
+
+    async def stream(self, text: str) -> AsyncIterator[bytes]:
+        proc = await asyncio.create_subprocess_exec(
+            self.command, "-v", self.voice, "--stdout", text,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            while True:
+                chunk = await proc.stdout.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+            returncode = await proc.wait()
+            if returncode != 0:
+                raise RuntimeError(f"{self.command} 終了コード {returncode}")
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+
+
+class ToneTTSBackend:
+    """テスト・ベンチマーク用の決定的なスタブ
+
+    文字ごとに決まった周波数のトーンを並べた WAV を生成する。
+    同じテキストからは常に同じバイト列が得られ、外部サービスやエンジンを必要としない。
+    """
+    name = "tone"
+
+    SAMPLE_RATE = 24000
+    TONE_SECONDS = 0.06
+    MAX_CHARS = 80
+
+    def is_available(self) -> bool:
+        return True
+
+    CHUNK_SIZE = 8192
+
+    async def stream(self, text: str) -> AsyncIterator[bytes]:
+        audio = self.render(text)
+        for i in range(0, len(audio), self.CHUNK_SIZE):
+            yield audio[i:i + self.CHUNK_SIZE]
+
+    def render(self, text: str) -> bytes:
+        samples_per_tone = int(self.SAMPLE_RATE * self.TONE_SECONDS)
+        frames = bytearray()
+        for ch in (text or " ")[:self.MAX_CHARS]:
+            # 文字コードを 300Hz〜900Hz の範囲に割り当てる
+            freq = 300 + (ord(ch) % 600)
+            for i in range(samples_per_tone):
+                value = int(8000 * math.sin(2 * math.pi * freq * i / self.SAMPLE_RATE))
+                frames += struct.pack("<h", value)
+
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.SAMPLE_RATE)
+            wav.writeframes(bytes(frames))
+        return buf.getvalue()
+
+
+class BackendStats:
+    """バックエンドごとのレイテンシ・失敗回数の統計"""
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+        self.avg_latency = None  # 指数移動平均 (秒)
+        self.last_success_at = 0.0
+        self.disabled_until = 0.0
+
+    def record_success(self, latency: float) -> None:
+        self.calls += 1
+        self.consecutive_failures = 0
+        self.total_latency += latency
+        self.last_latency = latency
+        self.last_success_at = time.monotonic()
+        if self.avg_latency is None:
+            self.avg_latency = latency
+        else:
+            self.avg_latency = self.avg_latency * 0.7 + latency * 0.3
+
+    def record_failure(self, latency: float) -> None:
+        self.calls += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_latency = latency
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "last_latency": round(self.last_latency, 3),
+            "avg_latency": round(self.avg_latency, 3) if self.avg_latency is not None else None,
+            "cooldown": max(0.0, round(self.disabled_until - time.monotonic(), 1)),
+        }
+
+
+class TTSManager:
+    """フォールバックチェーン付きの音声合成マネージャー
+
+    - 設定順 (Config.TTS_BACKENDS) に試行し、失敗・タイムアウトしたら次のバックエンドへ
+    - 平均レイテンシが閾値を超えたバックエンドは後回しにする
+      (最後の計測から slow_recheck 秒経ったら設定順に戻し、回復していないかを計測し直す)
+    - 連続で失敗したバックエンドは一定時間スキップする
+    """
+
+    def __init__(self, backends: List[TTSBackend], timeout: float = 5.0,
+                 slow_threshold: float = 3.0, failure_limit: int = 3, cooldown: float = 300.0,
+                 slow_recheck: float = 60.0):
+        self.backends = backends
+        self.timeout = timeout
+        self.slow_threshold = slow_threshold
+        self.slow_recheck = slow_recheck
+        self.failure_limit = failure_limit
+        self.cooldown = cooldown
+        self._stats: Dict[str, BackendStats] = {b.name: BackendStats() for b in backends}
+
+    @classmethod
+    def from_config(cls) -> "TTSManager":
+        registry = {
+            "edge": lambda: EdgeTTSBackend(Config.TTS_VOICE_NAME),
+            "local": lambda: LocalTTSBackend(Config.TTS_LOCAL_COMMAND),
+            "tone": ToneTTSBackend,
+        }
+        backends = []
+        for name in Config.TTS_BACKENDS:
+            factory = registry.get(name)
+            if factory is None:
+                logger.warning(f"不明なTTSバックエンドを無視します: {name}")
+                continue
+            backends.append(factory())
+        if not backends:
+            backends.append(ToneTTSBackend())
+        return cls(backends, timeout=Config.TTS_TIMEOUT, slow_threshold=Config.TTS_SLOW_THRESHOLD)
+
+    def ordered_backends(self) -> List[TTSBackend]:
+        """試行順に並べたバックエンド一覧（クールダウン中・利用不可のものは除外）"""
+        now = time.monotonic()
+        candidates = []
+        for index, backend in enumerate(self.backends):
+            stats = self._stats[backend.name]
+            if stats.disabled_until > now:
+                continue
+            if not backend.is_available():
+                continue
+            # 後回しにしたままだと計測されず回復に気づけないため、一定時間で遅い扱いを解く
+            is_slow = (stats.avg_latency is not None and stats.avg_latency > self.slow_threshold
+                       and now - stats.last_success_at < self.slow_recheck)
+            candidates.append((is_slow, index, backend))
+        if not candidates:
+            # 全てクールダウン中の場合は、無音にするよりも設定順で再試行する
+            return [b for b in self.backends if b.is_available()]
+        candidates.sort(key=lambda item: (item[0], item[1]))
+        return [backend for _, _, backend in candidates]
+
+    async def stream(self, text: str) -> AsyncIterator[bytes]:
+        """テキストを音声チャンクのストリームに変換する
+
+        フォールバックは最初のチャンクが届くまでの間のみ行う（再生開始後は切り替えない）。
+        レイテンシ統計には最初のチャンクが届くまでの時間を記録する。
+        """
+        for backend in self.ordered_backends():
+            stats = self._stats[backend.name]
+            started = time.monotonic()
+            chunks = backend.stream(text)
+            try:
+                first = await asyncio.wait_for(chunks.__anext__(), timeout=self.timeout)
+                if not first:
+                    raise RuntimeError("空の音声データ")
+            except Exception as e:
+                await self._close_quietly(chunks)
+                latency = time.monotonic() - started
+                stats.record_failure(latency)
+                if isinstance(e, StopAsyncIteration):
+                    e = RuntimeError("音声データなし")
+                logger.warning(f"TTSバックエンド {backend.name} 失敗 ({latency:.2f}s): {e!r}")
+                if stats.consecutive_failures >= self.failure_limit:
+                    stats.disabled_until = time.monotonic() + self.cooldown
+                    logger.warning(f"TTSバックエンド {backend.name} を {self.cooldown:.0f}秒間無効化します")
+                continue
+
+            stats.record_success(time.monotonic() - started)
+            try:
+                yield first
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    yield chunk
+            except Exception as e:
+                logger.error(f"TTSバックエンド {backend.name} ストリーム途中で失敗: {e!r}")
+            finally:
+                await self._close_quietly(chunks)
+            return
+
+        logger.error("全てのTTSバックエンドで音声合成に失敗しました")
+
+    async def synthesize(self, text: str) -> Optional[bytes]:
+        """テキストを音声データ全体に変換する（全バックエンドが失敗した場合は None）"""
+        audio = b"".join([chunk async for chunk in self.stream(text)])
+        return audio or None
+
+    @staticmethod
+    async def _close_quietly(chunks) -> None:
+        try:
+            await chunks.aclose()
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, dict]:
+        """バックエンドごとの統計を返す"""
+        return {name: s.as_dict() for name, s in self._stats.items()}
+
+
+tts_manager = TTSManager.from_config()
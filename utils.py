@@ -1,15 +1,18 @@
-import os
+import io
 import asyncio
+import time
+from typing import Dict, List
+from queue import SimpleQueue
 import discord
-import edge_tts
 import logging
 import traceback
 from config import Config
-from messages import Colors
+from messages import Colors, MESSAGES
+from templates import EmbedTemplate, compile_embed_templates
+from tts import tts_manager
 
 logger = logging.getLogger(__name__)
 
-VOICE_NAME = "ja-JP-NanamiNeural"
 FFMPEG_CLEANUP_DELAY = 1
 
 def format_duration(total_seconds, for_voice=False):
@@ -25,9 +28,58 @@ def format_duration(total_seconds, for_voice=False):
     else:
         return f"{hours}時間 {minutes}分 {seconds}秒"
 
-async def generate_voice(text, output_path):
-    communicate = edge_tts.Communicate(text, VOICE_NAME)
-    await communicate.save(output_path)
+class StreamingAudioBuffer(io.RawIOBase):
+    """非同期に届く音声チャンクを FFmpeg の stdin に流すためのメモリ上のパイプ
+
+    FFmpegPCMAudio(pipe=True) の書き込みスレッドから read() され、
+    データが届くまでブロックする。finish() で EOF を通知する。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = SimpleQueue()
+        self._pending = b""
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def feed(self, data: bytes) -> None:
+        if data:
+            self._chunks.put(data)
+
+    def finish(self) -> None:
+        self._chunks.put(None)
+
+    def read(self, size=-1):
+        while not self._pending:
+            if self._eof:
+                return b""
+            chunk = self._chunks.get()
+            if chunk is None:
+                self._eof = True
+                return b""
+            self._pending = chunk
+
+        if size is None or size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+
+async def pump_voice_stream(chunks, buffer: StreamingAudioBuffer):
+    """TTSストリームの残りをバッファに流し込む（終了・失敗時は必ず EOF を通知）"""
+    try:
+        async for chunk in chunks:
+            buffer.feed(chunk)
+    except Exception as e:
+        logger.error(f"音声ストリーム転送エラー: {e}")
+    finally:
+        buffer.finish()
+        try:
+            await chunks.aclose()
+        except Exception:
+            pass
 
 # 音声再生管理用 {guild_id: {'queue': asyncio.Queue, 'task': asyncio.Task}}
 voice_states = {}
@@ -93,35 +145,37 @@ async def voice_worker(initial_voice_channel):
                     queue.task_done()
                     continue
 
-            filename = f"voice_{member_id}_{int(asyncio.get_event_loop().time() * 1000)}.mp3"
             source = None
+            pump_task = None
+            chunks = tts_manager.stream(text)
             try:
-                await generate_voice(text, filename)
-                
-                if not os.path.exists(filename):
-                     logger.error(f"音声ファイル生成失敗: {filename}")
-                     queue.task_done()
-                     continue
-
-                source = discord.FFmpegPCMAudio(filename)
-                
+                # 最初のチャンクが届いた時点で再生を開始し、残りは並行して流し込む
+                first_chunk = await anext(chunks, None)
+                if not first_chunk:
+                    logger.error(f"音声生成失敗 (member: {member_id})")
+                    continue
+
+                buffer = StreamingAudioBuffer()
+                buffer.feed(first_chunk)
+                pump_task = asyncio.create_task(pump_voice_stream(chunks, buffer))
+                source = discord.FFmpegPCMAudio(buffer, pipe=True)
+
                 if not vc.is_playing():
                     vc.play(source)
                     while vc.is_playing():
                         await asyncio.sleep(FFMPEG_CLEANUP_DELAY)
-                
+
                 await asyncio.sleep(0.5)
 
             except Exception as e:
                 logger.error(f"音声再生プロセスエラー: {e}")
             finally:
+                if pump_task:
+                    pump_task.cancel()
+                else:
+                    await chunks.aclose()
                 if source:
                     source.cleanup()
-                if os.path.exists(filename):
-                    try:
-                        os.remove(filename)
-                    except:
-                        pass
                 queue.task_done()
 
     except Exception as e:
@@ -156,49 +210,226 @@ async def delete_previous_message(channel, message_id):
         except Exception as e:
             logger.error(f"メッセージ削除エラー: {e}")
 
+# MESSAGES の Embed 設定は起動時に1度だけ解析しておく (書式の誤りはここで ValueError になる)
+EMBED_TEMPLATES = compile_embed_templates(MESSAGES)
+_TEMPLATES_BY_CONFIG = {id(MESSAGES[name]): (MESSAGES[name], template) for name, template in EMBED_TEMPLATES.items()}
+
+
 def create_embed_from_config(config, **kwargs):
-    """設定辞書からEmbedを安全に生成"""
-    title = config.get("embed_title", "")
-    if title:
+    """設定辞書からEmbedを安全に生成（MESSAGES の設定は解析済みのテンプレートを使う）"""
+    entry = _TEMPLATES_BY_CONFIG.get(id(config))
+    if entry is not None and entry[0] is config:
+        return entry[1].render(**kwargs)
+
+    # MESSAGES 以外の設定辞書はその場で解析する
+    try:
+        template = EmbedTemplate(config)
+    except ValueError as e:
+        logger.error(f"Embed テンプレートの書式エラー: {e}")
+        return discord.Embed(
+            title=config.get("embed_title", ""),
+            description=config.get("embed_description") or config.get("embed_desc", ""),
+            color=config.get("embed_color", Colors.GRAY)
+        )
+    return template.render(**kwargs)
+
+
+class UserResolver:
+    """ユーザーIDから User を取得する（キャッシュ → get_user → fetch_user の順）
+
+    fetch_user の結果は ttl 秒キャッシュし、存在しないユーザーも短時間キャッシュして API を叩き続けないようにする。
+    """
+
+    def __init__(self, bot, ttl: float = 3600, negative_ttl: float = 300):
+        self.bot = bot
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._cache = {}  # {user_id: (user or None, expires_at)}
+
+    async def resolve(self, user_id: int):
+        loop_time = asyncio.get_running_loop().time()
+        cached = self._cache.get(user_id)
+        if cached and cached[1] > loop_time:
+            return cached[0]
+
+        user = self.bot.get_user(user_id)
+        if user:
+            return user
+
         try:
-            title = title.format(**kwargs)
-        except Exception:
-            pass
+            user = await self.bot.fetch_user(user_id)
+            self._cache[user_id] = (user, loop_time + self.ttl)
+        except discord.NotFound:
+            user = None
+            self._cache[user_id] = (None, loop_time + self.negative_ttl)
+        return user
+
+
+def is_retryable_send_error(e: BaseException) -> bool:
+    """再試行で回復しうる送信エラーか (レート制限・サーバーエラー・通信エラー)"""
+    if isinstance(e, discord.HTTPException):
+        return e.status == 429 or e.status >= 500
+    return isinstance(e, (OSError, asyncio.TimeoutError))
 
-    desc = config.get("embed_description") or config.get("embed_desc", "")
-    if desc:
+
+async def _send_with_backoff(target, payload: dict, retries: int, base_delay: float,
+                             before_send=None, on_rate_limit=None):
+    """宛先1件への送信。回復しうるエラーに限って指数バックオフで再試行し、それ以外はそのまま送出する
+
+    before_send: 各送信の前に待つコルーチン関数
+    on_rate_limit: 429 を受けたときに (例外, 既定の待ち時間) で呼び、実際に待つ秒数を返す関数
+    """
+    for attempt in range(retries + 1):
+        if before_send is not None:
+            await before_send()
         try:
-            desc = desc.format(**kwargs)
-        except Exception:
-            pass
+            return await target.send(**payload)
+        except Exception as e:
+            if attempt >= retries or not is_retryable_send_error(e):
+                raise
+            delay = base_delay * (2 ** attempt)
+            if on_rate_limit is not None and isinstance(e, discord.HTTPException) and e.status == 429:
+                delay = on_rate_limit(e, delay)
+            if delay > 0:
+                logger.warning(f"送信失敗のため {delay:.1f}秒後に再試行します ({attempt + 1}/{retries}): {e}")
+                await asyncio.sleep(delay)
 
-    color = config.get("embed_color", Colors.GRAY)
 
-    embed = discord.Embed(title=title, description=desc, color=color)
-    
-    # 共通フィールド設定がある場合
-    if "fields" in config and isinstance(config["fields"], list):
-        for field in config["fields"]:
-            name = field.get("name", "")
-            value = field.get("value", "")
-            inline = field.get("inline", False)
-            
-            try:
-                name = name.format(**kwargs)
-            except Exception:
-                pass
-            
+async def send_with_retry(target, retries: int = 2, base_delay: float = 1.0, **kwargs):
+    """メッセージ送信を一時的なエラーに限ってリトライする（権限エラー・存在しない宛先は即失敗）"""
+    return await _send_with_backoff(target, kwargs, retries, base_delay)
+
+
+class EmbedPaginator:
+    """行を Discord の上限内に収まるようにフィールド・Embed へ詰めていく
+
+    - フィールドの値は 1024 文字、1 Embed あたり 25 フィールド・合計 6000 文字まで
+    - max_pages を超える行は受け付けず、overflowed を立てる（呼び出し側で CSV などに切り替える）
+    """
+    FIELD_LIMIT = 1024
+    FIELDS_PER_EMBED = 25
+    EMBED_LIMIT = 6000
+
+    def __init__(self, first_embed: discord.Embed, field_name: str = "Results", max_pages: int = 5,
+                 reserve: int = 100):
+        self.field_name = field_name
+        self.max_pages = max_pages
+        self.reserve = reserve  # 後から付けるフッターなどのために空けておく文字数
+        self.pages: List[discord.Embed] = [first_embed]
+        self.overflowed = False
+        self._lines: List[str] = []
+        self._length = 0
+
+    def _new_page(self) -> discord.Embed:
+        first = self.pages[0]
+        return discord.Embed(title=f"{first.title} ({len(self.pages) + 1})" if first.title else None, color=first.color)
+
+    def _next_field_name(self, page: discord.Embed) -> str:
+        return self.field_name if not page.fields else "\u200b"
+
+    def _flush(self) -> None:
+        if not self._lines:
+            return
+        page = self.pages[-1]
+        page.add_field(name=self._next_field_name(page), value="".join(self._lines), inline=False)
+        self._lines = []
+        self._length = 0
+
+    def _fits(self, page: discord.Embed, line: str) -> bool:
+        if not self._lines and len(page.fields) >= self.FIELDS_PER_EMBED:
+            return False
+        # 書き込み中のフィールドも含めた Embed 全体の文字数
+        field_name_len = len(self._next_field_name(page))
+        return len(page) + field_name_len + self._length + len(line) <= self.EMBED_LIMIT - self.reserve
+
+    def add_line(self, line: str) -> bool:
+        """1行追加する（上限に達して追加できなかった場合は False）"""
+        if self.overflowed:
+            return False
+        line = line[:self.FIELD_LIMIT]
+        if self._length + len(line) > self.FIELD_LIMIT:
+            self._flush()
+
+        if not self._fits(self.pages[-1], line):
+            self._flush()
+            if len(self.pages) >= self.max_pages:
+                self.overflowed = True
+                return False
+            self.pages.append(self._new_page())
+
+        self._lines.append(line)
+        self._length += len(line)
+        return True
+
+    def finish(self) -> List[discord.Embed]:
+        self._flush()
+        return self.pages
+
+
+class FanOutResult:
+    """一斉送信の結果 (宛先ごとの成否と所要時間)"""
+
+    def __init__(self):
+        self.sent: List[int] = []
+        self.failed: Dict[int, str] = {}  # {宛先ID: エラー内容}
+        self.opted_out: List[int] = []  # DMを受け付けていない宛先
+        self.rate_limited = 0
+        self.elapsed = 0.0
+
+    @property
+    def total(self) -> int:
+        return len(self.sent) + len(self.failed) + len(self.opted_out)
+
+    def summary(self) -> str:
+        return (f"送信 {len(self.sent)}/{self.total}件 (失敗 {len(self.failed)}, DM拒否 {len(self.opted_out)}, "
+                f"レート制限 {self.rate_limited}回) {self.elapsed:.2f}秒")
+
+
+async def fan_out(recipients, concurrency: int = 5, retries: int = 2, base_delay: float = 1.0, **payload) -> FanOutResult:
+    """同じ内容を複数の宛先へ同時実行数を制限して送信する
+
+    - payload (content / embed など) は呼び出し側で1回だけ作成して渡す
+    - 同じIDの宛先には1回だけ送る
+    - レート制限 (429) を受けた場合は全ワーカーがその待ち時間だけ送信を止める
+    - DMを拒否している宛先 (Forbidden) は opted_out として記録し、再試行しない
+    """
+    result = FanOutResult()
+    semaphore = asyncio.Semaphore(concurrency)
+    resume_at = 0.0
+    started = time.monotonic()
+    loop = asyncio.get_running_loop()
+
+    unique = {}
+    for recipient in recipients:
+        unique.setdefault(recipient.id, recipient)
+
+    async def wait_for_resume():
+        wait = resume_at - loop.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause_all(e, delay: float) -> float:
+        # 429 は全ワーカーで共有する再開時刻を延ばし、各ワーカーは次の送信前にそこまで待つ
+        nonlocal resume_at
+        result.rate_limited += 1
+        retry_after = getattr(e, "retry_after", None) or delay
+        resume_at = max(resume_at, loop.time() + retry_after)
+        logger.warning(f"レート制限のため一斉送信を {retry_after:.1f}秒停止します")
+        return 0
+
+    async def deliver(recipient):
+        async with semaphore:
             try:
-                value = value.format(**kwargs)
-            except Exception:
-                pass
-                
-            if value:
-                if not name:
-                    name = "\u200b"
-                embed.add_field(name=name, value=value, inline=inline)
-    
-    return embed
+                await _send_with_backoff(recipient, payload, retries, base_delay, wait_for_resume, pause_all)
+                result.sent.append(recipient.id)
+            except discord.Forbidden:
+                result.opted_out.append(recipient.id)
+            except Exception as e:
+                result.failed[recipient.id] = str(e)
+
+    await asyncio.gather(*(deliver(r) for r in unique.values()))
+    result.elapsed = time.monotonic() - started
+    return result
 
 
 async def notify_backup(bot, title: str, content: str = None, exc: Exception = None, max_tb_chars: int = 1500):